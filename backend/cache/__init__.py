@@ -0,0 +1,38 @@
+"""Cache module for frequently accessed API data.
+
+This module provides a bounded cache with LRU eviction, TTL and tag-based
+invalidation. Two backends share the same interface:
+
+- ``memory``: per-process (default, single worker)
+- ``shared``: one store in a shared-memory directory for all workers on the host
+"""
+import os
+from typing import Optional
+
+from .base import BaseCache, DEFAULT_MAX_BYTES, DEFAULT_MAX_ENTRIES, DEFAULT_SWEEP_INTERVAL_SECONDS
+from .memory_cache import MemoryCache
+from .responses import CachedResponse
+from .shared_cache import DEFAULT_SHARED_DIR, SharedCache
+
+# Singleton instance
+_cache_instance: Optional[BaseCache] = None
+
+
+def get_cache() -> BaseCache:
+    """Get the cache instance (singleton), configured from the environment."""
+    global _cache_instance
+    if _cache_instance is None:
+        options = dict(
+            max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            max_bytes=int(os.environ.get("CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            sweep_interval_seconds=float(os.environ.get("CACHE_SWEEP_INTERVAL_SECONDS", DEFAULT_SWEEP_INTERVAL_SECONDS)),
+        )
+        backend = os.environ.get("CACHE_BACKEND", "memory").lower()
+        if backend == "shared":
+            _cache_instance = SharedCache(os.environ.get("CACHE_SHARED_DIR", DEFAULT_SHARED_DIR), **options)
+        else:
+            _cache_instance = MemoryCache(**options)
+    return _cache_instance
+
+
+__all__ = ['BaseCache', 'CachedResponse', 'MemoryCache', 'SharedCache', 'get_cache']
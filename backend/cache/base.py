@@ -0,0 +1,358 @@
+"""Backend-independent cache behaviour.
+
+``BaseCache`` implements the public cache interface (get/set/get_or_load/
+invalidate_tags/stats) on top of a few storage primitives provided by each
+backend, so stale-while-revalidate and single-flight loading behave the same
+whether entries live in this process or in a segment shared by all workers.
+"""
+import asyncio
+import json
+import logging
+import sys
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple, Type, Union
+
+from utils.periodic import PeriodicTask
+from .responses import CachedResponse
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Awaitable[Any]]
+TagsSpec = Union[Iterable[str], Callable[[Any], Iterable[str]]]
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64MB
+DEFAULT_SWEEP_INTERVAL_SECONDS = 30
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory footprint of a cached value in bytes.
+
+    Cached values are pre-encoded responses or JSON-shaped API payloads, for
+    which the length of their JSON encoding is a cheap and stable proxy.
+    """
+    if isinstance(value, CachedResponse):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class CacheEntry:
+    """A single cached value with its expiry deadlines and dependency tags."""
+
+    __slots__ = ("value", "expires_at", "stale_at", "size", "tags", "hard_at")
+
+    def __init__(
+        self,
+        value: Any,
+        expires_at: Optional[float],
+        size: int,
+        tags: frozenset = frozenset(),
+        stale_at: Optional[float] = None,
+        hard_at: Optional[float] = None
+    ):
+        self.value = value
+        self.expires_at = expires_at  # backend clock deadline, None = no expiry
+        self.stale_at = stale_at  # soft deadline after which a refresh is triggered
+        self.size = size
+        self.tags = tags
+        # Deadline after which the entry is only served if reloading it fails;
+        # expires_at may lie beyond it by a stale-if-error grace period
+        self.hard_at = hard_at if hard_at is not None else expires_at
+
+    def is_expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+    def is_stale(self, now: float) -> bool:
+        return self.stale_at is not None and now >= self.stale_at
+
+    def is_past_hard(self, now: float) -> bool:
+        return self.hard_at is not None and now >= self.hard_at
+
+
+class BaseCache:
+    """Common cache logic; subclasses provide storage.
+
+    Subclasses implement ``_clock``, ``_get_entry``, ``_store``, ``_remove_key``,
+    ``_remove_tags``, ``_clear``, ``_sweep``, ``_generation``, ``_iter_entries``
+    and ``_backend_stats``.
+    """
+
+    backend = "base"
+    # True if every worker on the host sees the same entries
+    shared = False
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        sweep_interval_seconds: float = DEFAULT_SWEEP_INTERVAL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._stale_hits = 0
+        self._loads = 0
+        self._coalesced = 0
+        self._load_errors = 0
+        self._stale_errors = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._sweeper = PeriodicTask("cache-sweeper", sweep_interval_seconds, self._sweep_async)
+
+    # ---- storage primitives -------------------------------------------------
+
+    def _clock(self) -> float:
+        raise NotImplementedError
+
+    def _get_entry(self, key: str, now: float) -> Optional[CacheEntry]:
+        """Return the live entry for `key` (dropping it if expired) and mark it used."""
+        raise NotImplementedError
+
+    def _store(
+        self,
+        key: str,
+        value: Any,
+        expires_at: Optional[float],
+        stale_at: Optional[float],
+        tags: frozenset,
+        hard_at: Optional[float] = None
+    ):
+        raise NotImplementedError
+
+    def _remove_key(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def _remove_tags(self, tags: Iterable[str]) -> int:
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+    def _sweep(self) -> int:
+        raise NotImplementedError
+
+    def _generation(self) -> int:
+        """Counter bumped by every invalidation visible to this process."""
+        raise NotImplementedError
+
+    def _iter_entries(self) -> Iterator[Tuple[str, CacheEntry]]:
+        """Yield stored entries without marking them used."""
+        raise NotImplementedError
+
+    def _backend_stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    # ---- public interface ---------------------------------------------------
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for `key`, or None if missing or expired."""
+        entry = self._get_entry(key, self._clock())
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return entry.value
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl_seconds: Optional[float] = 60,
+        tags: Iterable[str] = (),
+        soft_ttl_seconds: Optional[float] = None,
+        stale_if_error_seconds: float = 0
+    ):
+        """Store `value` under `key`.
+
+        Args:
+            key: Cache key
+            value: Value to cache
+            ttl_seconds: Lifetime of the entry; None keeps it until evicted
+            tags: Dependency tags used by invalidate_tags()
+            soft_ttl_seconds: Age after which get_or_load() refreshes the entry in the background
+            stale_if_error_seconds: Time past `ttl_seconds` the entry is kept as a
+                fallback for get_or_load() when reloading it fails
+        """
+        now = self._clock()
+        hard_at = now + ttl_seconds if ttl_seconds is not None else None
+        expires_at = hard_at + stale_if_error_seconds if hard_at is not None else None
+        stale_at = now + soft_ttl_seconds if soft_ttl_seconds is not None else None
+        self._store(key, value, expires_at, stale_at, frozenset(tags), hard_at)
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Loader,
+        soft_ttl: float,
+        hard_ttl: float,
+        tags: TagsSpec = (),
+        stale_if_error: float = 0,
+        fallback_errors: Tuple[Type[BaseException], ...] = (Exception,)
+    ) -> Tuple[Any, str]:
+        """Return the cached value for `key`, loading it on a miss.
+
+        Fresh entries are returned directly. Entries past `soft_ttl` are still
+        returned, and a single background refresh is started. Misses (or entries
+        past `hard_ttl`) await the loader, shared by all concurrent callers.
+        Exceptions raised by the loader propagate and nothing is cached, unless
+        the entry is within its `stale_if_error` grace period and the exception
+        is one of `fallback_errors`: the old value is then served instead.
+
+        Args:
+            key: Cache key
+            loader: Coroutine function producing the value
+            soft_ttl: Seconds an entry is served without triggering a refresh
+            hard_ttl: Seconds after which an entry is only served if reloading fails
+            tags: Dependency tags, or a callable deriving them from the loaded value
+            stale_if_error: Seconds past `hard_ttl` an entry is kept as a fallback
+            fallback_errors: Loader exceptions that may be answered with the fallback
+
+        Returns:
+            tuple: (value, status) where status is "hit", "stale", "miss" or "stale-error"
+        """
+        now = self._clock()
+        entry = self._get_entry(key, now)
+
+        if entry is not None and not entry.is_past_hard(now):
+            self._hits += 1
+            if entry.is_stale(now):
+                self._stale_hits += 1
+                if key not in self._inflight:
+                    self._start_load(key, loader, soft_ttl, hard_ttl, tags, stale_if_error)
+                return entry.value, "stale"
+            return entry.value, "hit"
+
+        self._misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._start_load(key, loader, soft_ttl, hard_ttl, tags, stale_if_error)
+        else:
+            self._coalesced += 1
+        try:
+            # Shield so one disconnecting client does not cancel the load for the others
+            value = await asyncio.shield(task)
+        except fallback_errors as e:
+            if entry is None:
+                raise
+            self._stale_errors += 1
+            logger.debug(f"Serving stale '{key}' after load failure: {e!r}")
+            return entry.value, "stale-error"
+        return value, "miss"
+
+    def delete(self, key: str) -> bool:
+        """Remove a single key. Returns True if it was present."""
+        return self._remove_key(key)
+
+    def invalidate_tags(self, *tags: str) -> int:
+        """Remove every entry carrying any of `tags`. Returns the number removed."""
+        removed = self._remove_tags(tags)
+        self._invalidations += removed
+        return removed
+
+    def items(self) -> Iterator[Tuple[str, Any, Optional[float], Optional[float], frozenset]]:
+        """Live entries as (key, value, ttl_remaining, soft_ttl_remaining, tags).
+
+        Remaining lifetimes are in seconds (None = no deadline), so entries can
+        be re-stored elsewhere with set(); used for snapshots.
+        """
+        now = self._clock()
+        for key, entry in self._iter_entries():
+            if entry.is_expired(now):
+                continue
+            ttl = entry.hard_at - now if entry.hard_at is not None else None
+            if ttl is not None and ttl <= 0:
+                continue
+            soft_ttl = entry.stale_at - now if entry.stale_at is not None else None
+            yield key, entry.value, ttl, soft_ttl, entry.tags
+
+    def clear(self):
+        self._clear()
+
+    def sweep(self) -> int:
+        """Drop expired entries and enforce size caps. Returns the number removed."""
+        return self._sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the cache from production data."""
+        lookups = self._hits + self._misses
+        return {
+            "backend": self.backend,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            **self._backend_stats(),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "invalidations": self._invalidations,
+            "stale_hits": self._stale_hits,
+            "loads": self._loads,
+            "coalesced_loads": self._coalesced,
+            "load_errors": self._load_errors,
+            "stale_if_error_hits": self._stale_errors,
+            "inflight": len(self._inflight),
+        }
+
+    def start_sweeper(self):
+        """Start the background expiry sweeper (call from app startup)."""
+        self._sweeper.start()
+
+    async def stop_sweeper(self):
+        await self._sweeper.stop()
+
+    # ---- loading ------------------------------------------------------------
+
+    async def _sweep_async(self):
+        self.sweep()
+
+    def _start_load(
+        self,
+        key: str,
+        loader: Loader,
+        soft_ttl: float,
+        hard_ttl: float,
+        tags: TagsSpec,
+        stale_if_error: float = 0
+    ) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(
+            self._run_loader(key, loader, soft_ttl, hard_ttl, tags, stale_if_error)
+        )
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish_load(key, t))
+        return task
+
+    def _finish_load(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self._load_errors += 1
+            logger.debug(f"Cache load for '{key}' failed: {task.exception()}")
+
+    async def _run_loader(
+        self,
+        key: str,
+        loader: Loader,
+        soft_ttl: float,
+        hard_ttl: float,
+        tags: TagsSpec,
+        stale_if_error: float = 0
+    ) -> Any:
+        # A load that raced an invalidation must not store its (possibly old) result
+        generation = self._generation()
+        self._loads += 1
+        value = await loader()
+        if self._generation() == generation:
+            entry_tags = tags(value) if callable(tags) else tags
+            self.set(
+                key, value, ttl_seconds=hard_ttl, tags=entry_tags,
+                soft_ttl_seconds=soft_ttl, stale_if_error_seconds=stale_if_error
+            )
+        return value
@@ -0,0 +1,43 @@
+"""Byte encoding for cache values that leave the process (shared segment, snapshots).
+
+Values are JSON-shaped API payloads, raw bytes or pre-encoded responses
+(``cache.responses.CachedResponse``); each encoding is tagged
+with a short kind so the reader knows how to rebuild it. Pickle is
+deliberately avoided so a tampered cache file can at worst poison content,
+never execute code.
+"""
+import json
+from typing import Any, Tuple
+
+from .responses import CachedResponse
+
+
+class UnsupportedValue(TypeError):
+    """Raised when a value cannot be encoded for out-of-process storage."""
+
+
+def encode_value(value: Any) -> Tuple[str, bytes]:
+    """Encode a cache value.
+
+    Returns:
+        tuple: (kind, payload)
+    """
+    if isinstance(value, CachedResponse):
+        return "response", value.to_bytes()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "bytes", bytes(value)
+    try:
+        return "json", json.dumps(value, default=str, separators=(",", ":")).encode()
+    except (TypeError, ValueError) as e:
+        raise UnsupportedValue(str(e))
+
+
+def decode_value(kind: str, payload: bytes) -> Any:
+    """Rebuild a value produced by encode_value()."""
+    if kind == "response":
+        return CachedResponse.from_bytes(payload)
+    if kind == "bytes":
+        return payload
+    if kind == "json":
+        return json.loads(payload)
+    raise UnsupportedValue(f"Unknown cache value kind: {kind}")
@@ -0,0 +1,130 @@
+"""In-process response cache with LRU eviction and per-entry TTL.
+
+Entries are bounded both by count and by an approximate byte size, so
+arbitrary query parameters (e.g. random ``limit=`` values) cannot grow the
+keyspace without limit. Expiry uses the monotonic clock and is fixed when an
+entry is stored; a background sweeper drops expired entries that nobody reads.
+
+Entries can carry dependency tags (see ``cache.tags``). A reverse index from
+tag to keys lets writers evict exactly the entries that depend on a changed
+document, in time proportional to the number of tagged entries.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from .base import BaseCache, CacheEntry, estimate_size
+
+
+class MemoryCache(BaseCache):
+    """Bounded LRU cache with TTL, size accounting and hit/miss statistics."""
+
+    backend = "memory"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._tag_index: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        # Bumped on every invalidation so a load that raced a write is not stored
+        self._generation_counter = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _clock(self) -> float:
+        return time.monotonic()
+
+    def _generation(self) -> int:
+        return self._generation_counter
+
+    def _get_entry(self, key: str, now: float) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.is_expired(now):
+            self._remove(key)
+            self._expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(
+        self,
+        key: str,
+        value: Any,
+        expires_at: Optional[float],
+        stale_at: Optional[float],
+        tags: frozenset,
+        hard_at: Optional[float] = None
+    ):
+        size = estimate_size(value)
+        if key in self._entries:
+            self._remove(key)
+
+        # A single value larger than the whole budget is never cached
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = CacheEntry(value, expires_at, size, tags, stale_at, hard_at)
+        self._bytes += size
+        for tag in tags:
+            self._tag_index.setdefault(tag, set()).add(key)
+        self._evict_to_fit()
+
+    def _remove_key(self, key: str) -> bool:
+        self._generation_counter += 1
+        if key in self._entries:
+            self._remove(key)
+            return True
+        return False
+
+    def _remove_tags(self, tags: Iterable[str]) -> int:
+        self._generation_counter += 1
+        keys = set()
+        for tag in tags:
+            keys.update(self._tag_index.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _clear(self):
+        self._generation_counter += 1
+        self._entries.clear()
+        self._tag_index.clear()
+        self._bytes = 0
+
+    def _sweep(self) -> int:
+        now = time.monotonic()
+        expired = [k for k, entry in self._entries.items() if entry.is_expired(now)]
+        for key in expired:
+            self._remove(key)
+        self._expirations += len(expired)
+        return len(expired)
+
+    def _iter_entries(self) -> Iterator[Tuple[str, CacheEntry]]:
+        # Copy so callers may store or invalidate while iterating
+        return iter(list(self._entries.items()))
+
+    def _backend_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "tags": len(self._tag_index),
+        }
+
+    def _evict_to_fit(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self._evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
@@ -0,0 +1,206 @@
+"""Pre-encoded JSON responses for hot public GET endpoints.
+
+A ``CachedResponse`` holds the final JSON bytes of a payload, encoded once
+when it is loaded, plus gzip and (if the optional ``brotli`` package is
+installed) brotli variants and a strong ETag. Serving a hit then only picks
+the variant matching the client's ``Accept-Encoding`` and hands the bytes to
+the server, skipping ``jsonable_encoder``, JSON serialization and the gzip
+middleware on every request.
+
+Responses carry validators (ETag, and Last-Modified when the source document
+has a modification time), so a conditional request that still matches is
+answered with a bodiless 304.
+"""
+import gzip
+import hashlib
+import json
+import struct
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional, Union
+
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+# Bodies below this size are not worth compressing (matches the gzip middleware)
+MIN_COMPRESS_SIZE = 500
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 8
+
+# ETag suffix per content coding; all variants validate against the same body
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def http_date(value: Union[str, datetime, None]) -> Optional[str]:
+    """Format a stored timestamp (ISO string or datetime) as an HTTP-date."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def cache_control(max_age: int, stale_while_revalidate: int = 0) -> str:
+    """Build a public Cache-Control header value."""
+    value = f"public, max-age={max_age}"
+    if stale_while_revalidate:
+        value += f", stale-while-revalidate={stale_while_revalidate}"
+    return value
+
+
+def _accepted_encodings(header: str) -> set:
+    """Codings listed in an Accept-Encoding header, minus those with q=0."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding)
+    return accepted
+
+
+def _etag_base(tag: str) -> str:
+    """Strip the weak prefix, quotes and encoding suffix from an entity tag."""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+class CachedResponse:
+    """Encoded JSON body with precompressed variants and a strong ETag."""
+
+    __slots__ = ("body", "gzip_body", "br_body", "etag", "meta", "last_modified")
+
+    def __init__(
+        self,
+        body: bytes,
+        gzip_body: Optional[bytes] = None,
+        br_body: Optional[bytes] = None,
+        etag: Optional[str] = None,
+        meta: Optional[Dict[str, Any]] = None
+    ):
+        self.body = body
+        self.gzip_body = gzip_body
+        self.br_body = br_body
+        self.etag = etag or f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        # Small facts about the source document(s), e.g. a blog id for tagging
+        self.meta = meta or {}
+        self.last_modified = self.meta.get("last_modified")
+
+    @classmethod
+    def from_payload(cls, payload: Any, meta: Optional[Dict[str, Any]] = None) -> "CachedResponse":
+        """Encode a payload exactly as FastAPI's JSONResponse would, then compress it."""
+        body = json.dumps(
+            jsonable_encoder(payload),
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return cls.from_body(body, meta)
+
+    @classmethod
+    def from_body(cls, body: bytes, meta: Optional[Dict[str, Any]] = None) -> "CachedResponse":
+        gzip_body = br_body = None
+        if len(body) >= MIN_COMPRESS_SIZE:
+            gzip_body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                br_body = brotli.compress(body, quality=BROTLI_QUALITY)
+        return cls(body, gzip_body, br_body, meta=meta)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.body) + len(self.gzip_body or b"") + len(self.br_body or b"")
+
+    def not_modified(self, request: Request) -> bool:
+        """Evaluate the request's validators against this response (RFC 9110 13.2.2)."""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            base = _etag_base(self.etag)
+            return any(_etag_base(tag) == base for tag in if_none_match.split(","))
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return parsedate_to_datetime(self.last_modified) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def to_response(
+        self,
+        request: Request,
+        cache_status: Optional[str] = None,
+        cache_control: Optional[str] = None
+    ) -> Response:
+        """Build the response for `request`: a 304 if its validators still match,
+        otherwise the best precompressed variant."""
+        headers = {"Vary": "Accept-Encoding"}
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        if cache_status:
+            headers["X-Cache"] = cache_status.upper()
+
+        content, encoding = self.body, None
+        if self.gzip_body is not None:
+            accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+            if self.br_body is not None and "br" in accepted:
+                content, encoding = self.br_body, "br"
+            elif "gzip" in accepted:
+                content, encoding = self.gzip_body, "gzip"
+        # Each coding is a distinct representation, so it gets its own strong tag
+        headers["ETag"] = f'{self.etag[:-1]}-{encoding}"' if encoding else self.etag
+
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=content, media_type="application/json", headers=headers)
+
+    # ---- out-of-process storage (shared cache, snapshots) -------------------
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps({
+            "etag": self.etag,
+            "meta": self.meta,
+            "sizes": [len(self.body), len(self.gzip_body or b""), len(self.br_body or b"")],
+        }).encode()
+        return b"".join([struct.pack("<I", len(header)), header, self.body, self.gzip_body or b"", self.br_body or b""])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedResponse":
+        (header_len,) = struct.unpack_from("<I", data)
+        header = json.loads(data[4:4 + header_len])
+        body_len, gzip_len, br_len = header["sizes"]
+        offset = 4 + header_len
+        body = data[offset:offset + body_len]
+        offset += body_len
+        gzip_body = data[offset:offset + gzip_len] or None
+        offset += gzip_len
+        br_body = data[offset:offset + br_len] or None
+        return cls(body, gzip_body, br_body, etag=header["etag"], meta=header["meta"])
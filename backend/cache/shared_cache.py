@@ -0,0 +1,321 @@
+"""Same-host cache shared by every uvicorn worker process.
+
+Entries live in a tmpfs directory (``/dev/shm`` by default), one file per key,
+written to a temp file and atomically renamed into place. Dependency tags are
+marker files in a per-tag directory, so ``invalidate_tags`` touches only the
+tagged entries. Because every worker reads the same files, a write or an
+invalidation in one worker is visible to all of them on their next lookup.
+
+A small mmap'd counter in the same directory is bumped on every invalidation;
+it plays the role of the in-process generation counter, so a load in any
+worker that raced an invalidation in another is not stored.
+
+Expiry uses the wall clock since deadlines are compared across processes.
+Size caps are enforced by the sweeper, which runs in one worker at a time.
+"""
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .base import BaseCache, CacheEntry
+from .codec import UnsupportedValue, decode_value, encode_value
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARED_DIR = "/dev/shm/portfolio-cache"
+
+# Decoded entries kept per worker so a hit on an unchanged file skips JSON parsing
+DECODED_MEMO_SIZE = 128
+TEMP_PREFIX = ".tmp-"
+TEMP_MAX_AGE_SECONDS = 60
+
+
+def _digest(value: str) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+
+def _unlink(path: Path) -> bool:
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class SharedCache(BaseCache):
+    """File-per-entry cache in a shared-memory directory, visible to all workers."""
+
+    backend = "shared"
+    shared = True
+
+    def __init__(self, directory: str = DEFAULT_SHARED_DIR, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.directory = Path(directory)
+        self._entry_dir = self.directory / "entries"
+        self._tag_dir = self.directory / "tags"
+        for path in (self.directory, self._entry_dir, self._tag_dir):
+            path.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+        # Refuse a directory another user could have planted cache content in
+        if self.directory.stat().st_uid != os.getuid():
+            raise RuntimeError(f"Shared cache directory {self.directory} is not owned by this user")
+
+        self._lock_fd = os.open(self.directory / "lock", os.O_RDWR | os.O_CREAT, 0o600)
+        self._generation_map = self._open_generation()
+        self._decoded: "OrderedDict[str, Tuple[int, int, CacheEntry]]" = OrderedDict()
+
+    def _open_generation(self) -> mmap.mmap:
+        fd = os.open(self.directory / "generation", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            return mmap.mmap(fd, 8)
+        finally:
+            os.close(fd)
+
+    def _clock(self) -> float:
+        return time.time()
+
+    def _generation(self) -> int:
+        return struct.unpack_from("<Q", self._generation_map)[0]
+
+    def _bump_generation(self):
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            struct.pack_into("<Q", self._generation_map, 0, self._generation() + 1)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ---- entries ------------------------------------------------------------
+
+    def _get_entry(self, key: str, now: float) -> Optional[CacheEntry]:
+        path = self._entry_dir / _digest(key)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+        try:
+            st = os.fstat(fd)
+            memo = self._decoded.get(key)
+            if memo is not None and memo[0] == st.st_ino and memo[1] == st.st_mtime_ns:
+                entry = memo[2]
+                self._decoded.move_to_end(key)
+            else:
+                with os.fdopen(os.dup(fd), "rb") as f:
+                    entry = self._decode_entry(key, f.read())
+                if entry is None:
+                    return None
+                self._decoded[key] = (st.st_ino, st.st_mtime_ns, entry)
+                if len(self._decoded) > DECODED_MEMO_SIZE:
+                    self._decoded.popitem(last=False)
+
+            if entry.is_expired(now):
+                _unlink(path)
+                self._decoded.pop(key, None)
+                self._expirations += 1
+                return None
+
+            # Record the access for LRU eviction, at most once a second per entry
+            now_ns = time.time_ns()
+            if now_ns - st.st_atime_ns > 1_000_000_000:
+                try:
+                    os.utime(fd, ns=(now_ns, st.st_mtime_ns))
+                except OSError:
+                    pass
+            return entry
+        finally:
+            os.close(fd)
+
+    def _decode_entry(self, key: str, data: bytes) -> Optional[CacheEntry]:
+        try:
+            raw_header, payload = data.split(b"\n", 1)
+            header = json.loads(raw_header)
+            if header["k"] != key:
+                return None
+            value = decode_value(header["c"], payload)
+        except (ValueError, KeyError, UnsupportedValue) as e:
+            logger.warning(f"Discarding unreadable shared cache entry for '{key}': {e}")
+            return None
+        return CacheEntry(value, header["e"], len(payload), frozenset(header["t"]), header["s"], header.get("h"))
+
+    def _store(
+        self,
+        key: str,
+        value: Any,
+        expires_at: Optional[float],
+        stale_at: Optional[float],
+        tags: frozenset,
+        hard_at: Optional[float] = None
+    ):
+        try:
+            kind, payload = encode_value(value)
+        except UnsupportedValue as e:
+            logger.warning(f"Not caching '{key}' in shared cache: {e}")
+            return
+
+        # A single value larger than the whole budget is never cached
+        if len(payload) > self.max_bytes:
+            return
+
+        digest = _digest(key)
+        header = json.dumps({"k": key, "e": expires_at, "s": stale_at, "h": hard_at, "t": sorted(tags), "c": kind})
+
+        # Tag markers go in before the entry is published, so an invalidation
+        # that starts after the rename is guaranteed to find it
+        for tag in tags:
+            tag_dir = self._tag_dir / _digest(tag)
+            tag_dir.mkdir(mode=0o700, exist_ok=True)
+            (tag_dir / digest).touch()
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._entry_dir, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.encode())
+                f.write(b"\n")
+                f.write(payload)
+            os.replace(tmp_path, self._entry_dir / digest)
+        except BaseException:
+            _unlink(Path(tmp_path))
+            raise
+
+    def _remove_key(self, key: str) -> bool:
+        self._bump_generation()
+        self._decoded.pop(key, None)
+        return _unlink(self._entry_dir / _digest(key))
+
+    def _remove_tags(self, tags: Iterable[str]) -> int:
+        self._bump_generation()
+        removed = 0
+        for tag in tags:
+            tag_dir = self._tag_dir / _digest(tag)
+            try:
+                digests = os.listdir(tag_dir)
+            except FileNotFoundError:
+                continue
+            for digest in digests:
+                if _unlink(self._entry_dir / digest):
+                    removed += 1
+                _unlink(tag_dir / digest)
+        return removed
+
+    def _clear(self):
+        self._bump_generation()
+        self._decoded.clear()
+        for directory in (self._entry_dir, self._tag_dir):
+            for name in os.listdir(directory):
+                path = directory / name
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    _unlink(path)
+
+    # ---- maintenance --------------------------------------------------------
+
+    def _scan_entries(self) -> List[Tuple[str, os.stat_result]]:
+        entries = []
+        for name in os.listdir(self._entry_dir):
+            try:
+                entries.append((name, os.stat(self._entry_dir / name)))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _read_expiry(self, name: str) -> Optional[float]:
+        try:
+            with open(self._entry_dir / name, "rb") as f:
+                return json.loads(f.readline())["e"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _sweep(self) -> int:
+        # Only one worker sweeps at a time; the others skip this round
+        sweep_fd = os.open(self.directory / "sweep.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(sweep_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return 0
+                raise
+            return self._sweep_locked()
+        finally:
+            os.close(sweep_fd)
+
+    def _sweep_locked(self) -> int:
+        now = time.time()
+        removed = 0
+        live = []
+        for name, st in self._scan_entries():
+            if name.startswith(TEMP_PREFIX):
+                # Leftover from a worker that died mid-write
+                if now - st.st_mtime > TEMP_MAX_AGE_SECONDS:
+                    _unlink(self._entry_dir / name)
+                continue
+            expires_at = self._read_expiry(name)
+            if expires_at is not None and now >= expires_at:
+                if _unlink(self._entry_dir / name):
+                    removed += 1
+                    self._expirations += 1
+                continue
+            live.append((st.st_atime, st.st_size, name))
+
+        # Evict least recently used entries until both caps are met
+        live.sort()
+        total_bytes = sum(size for _, size, _ in live)
+        count = len(live)
+        for _, size, name in live:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            if _unlink(self._entry_dir / name):
+                removed += 1
+                self._evictions += 1
+            count -= 1
+            total_bytes -= size
+
+        # Drop tag markers whose entry is gone
+        for tag_name in os.listdir(self._tag_dir):
+            tag_dir = self._tag_dir / tag_name
+            try:
+                digests = os.listdir(tag_dir)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for digest in digests:
+                if not (self._entry_dir / digest).exists():
+                    _unlink(tag_dir / digest)
+        return removed
+
+    def _iter_entries(self) -> Iterator[Tuple[str, CacheEntry]]:
+        for name in os.listdir(self._entry_dir):
+            if name.startswith(TEMP_PREFIX):
+                continue
+            try:
+                with open(self._entry_dir / name, "rb") as f:
+                    data = f.read()
+                key = json.loads(data.split(b"\n", 1)[0])["k"]
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+            entry = self._decode_entry(key, data)
+            if entry is not None:
+                yield key, entry
+
+    def _backend_stats(self) -> Dict[str, Any]:
+        entries = [st for name, st in self._scan_entries() if not name.startswith(TEMP_PREFIX)]
+        return {
+            "directory": str(self.directory),
+            "entries": len(entries),
+            "bytes": sum(st.st_size for st in entries),
+            "tags": len(os.listdir(self._tag_dir)),
+            "generation": self._generation(),
+        }
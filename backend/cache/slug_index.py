@@ -0,0 +1,161 @@
+"""In-memory index of published blog slugs.
+
+Lets ``/blogs/{slug}`` and ``/blogs/{slug}/adjacent`` answer requests for
+slugs that do not exist without a database round trip, so scrapers and
+broken-link crawlers cannot generate unbounded query load.
+
+Each process holds the slug -> blog ids mapping. Admin writes update it in
+place and bump a version key in the cache; another worker that sees a
+different version (shared backend) stops trusting its copy and rebuilds.
+
+With a per-process cache a worker cannot see blogs published through other
+workers, so a slug missing from its index is not trusted: it is looked up in
+the database, and a miss there is remembered as a short-lived negative entry.
+Unknown slugs then cost one query per slug per negative TTL. A periodic
+rebuild picks up the other workers' writes.
+
+While the index is loading, stale or rebuilding, every slug is treated as
+possibly existing, with the same negative entries.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from utils.periodic import PeriodicTask
+from .base import BaseCache
+from .tags import LIST_PUBLISHED
+
+logger = logging.getLogger(__name__)
+
+SlugLoader = Callable[[], Awaitable[Iterable[dict]]]
+
+VERSION_KEY = "slugs:version"
+NEGATIVE_TTL_SECONDS = 30
+VERSION_CHECK_INTERVAL_SECONDS = 1.0
+DEFAULT_REFRESH_INTERVAL_SECONDS = 300
+
+
+class SlugIndex:
+    """Published slug membership with a cross-worker version check."""
+
+    def __init__(
+        self,
+        cache: BaseCache,
+        load_slugs: SlugLoader,
+        negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS,
+        refresh_interval_seconds: float = DEFAULT_REFRESH_INTERVAL_SECONDS
+    ):
+        """
+        Args:
+            cache: Cache holding the version key and negative entries
+            load_slugs: Coroutine function returning ``{"id", "slug"}`` docs of published blogs
+            negative_ttl_seconds: Lifetime of a remembered missing slug
+            refresh_interval_seconds: Interval of the periodic full rebuild
+        """
+        self._cache = cache
+        self._load_slugs = load_slugs
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._slugs: Optional[Dict[str, Set[str]]] = None  # None until loaded
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._refresher = PeriodicTask("slug-index-refresh", refresh_interval_seconds, self.rebuild)
+
+    @property
+    def ready(self) -> bool:
+        return self._slugs is not None
+
+    async def rebuild(self):
+        """Reload every published slug from the database."""
+        version = self._cache.get(VERSION_KEY)
+        slugs: Dict[str, Set[str]] = {}
+        for doc in await self._load_slugs():
+            if doc.get("slug"):
+                slugs.setdefault(doc["slug"], set()).add(doc.get("id"))
+        if version is None:
+            version = self._bump_version()
+        self._slugs = slugs
+        self._version = version
+        self._version_checked_at = time.monotonic()
+
+    def start(self):
+        """Build the index in the background and keep it refreshed (call from app startup)."""
+        self._schedule_rebuild()
+        self._refresher.start()
+
+    async def stop(self):
+        await self._refresher.stop()
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            self._rebuild_task.cancel()
+
+    # ---- lookups ------------------------------------------------------------
+
+    def may_exist(self, slug: str) -> bool:
+        """False only if `slug` is known not to belong to a published blog."""
+        if self._is_current():
+            if slug in self._slugs:
+                return True
+            if self._cache.shared:
+                return False
+        return self._cache.get(self._negative_key(slug)) is None
+
+    def mark_missing(self, slug: str):
+        """Remember a slug the database had no published blog for.
+
+        Tagged like the listings, so publishing any blog drops it early.
+        """
+        self._cache.set(self._negative_key(slug), True, ttl_seconds=self.negative_ttl_seconds, tags=[LIST_PUBLISHED])
+
+    # ---- writes -------------------------------------------------------------
+
+    def apply(self, blog_id: str, before: Optional[dict], after: Optional[dict]):
+        """Record a blog write: `before`/`after` are its states (None if absent)."""
+        if self._slugs is not None:
+            if before and before.get("slug"):
+                ids = self._slugs.get(before["slug"])
+                if ids is not None:
+                    ids.discard(blog_id)
+                    if not ids:
+                        del self._slugs[before["slug"]]
+            if after and after.get("slug") and after.get("is_published", True):
+                self._slugs.setdefault(after["slug"], set()).add(blog_id)
+        if after and after.get("slug"):
+            self._cache.delete(self._negative_key(after["slug"]))
+        self._version = self._bump_version()
+
+    # ---- internals ----------------------------------------------------------
+
+    @staticmethod
+    def _negative_key(slug: str) -> str:
+        return f"slugs:missing={slug}"
+
+    def _bump_version(self) -> str:
+        version = uuid.uuid4().hex
+        self._cache.set(VERSION_KEY, version, ttl_seconds=None)
+        return version
+
+    def _is_current(self) -> bool:
+        if self._slugs is None:
+            return False
+        now = time.monotonic()
+        if now - self._version_checked_at >= VERSION_CHECK_INTERVAL_SECONDS:
+            self._version_checked_at = now
+            if self._cache.get(VERSION_KEY) != self._version:
+                # Another worker wrote a blog (or the key was evicted): rebuild
+                self._slugs = None
+                self._schedule_rebuild()
+                return False
+        return True
+
+    def _schedule_rebuild(self):
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            return
+        self._rebuild_task = asyncio.get_running_loop().create_task(self._rebuild_logged())
+
+    async def _rebuild_logged(self):
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.warning(f"Slug index rebuild failed: {e}")
@@ -0,0 +1,138 @@
+"""Warm-restart snapshots of the cache.
+
+On shutdown the cache is written to a gzip'd JSON-lines file: a header line,
+then one line per entry with its key, encoded value (see ``cache.codec``),
+remaining TTLs and dependency tags. On startup the file is read back so the
+first requests after a deploy are served from memory. The file is encoded and
+written, or read and decoded, in a worker thread; the cache itself is only
+touched on the event loop, since the memory backend is not thread-safe.
+
+Entries are only restored if they are still current. The caller passes a
+``versions`` map from dependency tag to a fingerprint of the documents
+behind it (e.g. ``blog:<id>`` -> its ``updated_at``) both when saving and
+when loading. An entry is restored only if every one of its tags has a
+fingerprint, and that fingerprint is unchanged. Untagged entries are never
+restored, because nothing can vouch for them.
+"""
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from .base import BaseCache
+from .codec import UnsupportedValue, decode_value, encode_value
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+# Entries with less life left than this are not worth writing out
+MIN_REMAINING_TTL_SECONDS = 5
+
+# (key, value, ttl_remaining, soft_ttl_remaining, tags), as yielded by BaseCache.items()
+Entry = Tuple[str, Any, Optional[float], Optional[float], Iterable[str]]
+
+
+async def save_snapshot(cache: BaseCache, path: Union[str, Path], versions: Dict[str, str]) -> int:
+    """Write the cache's current entries to `path`. Returns the number written."""
+    entries = list(cache.items())
+    return await asyncio.get_running_loop().run_in_executor(None, _write_snapshot, entries, Path(path), versions)
+
+
+async def load_snapshot(
+    cache: BaseCache,
+    path: Union[str, Path],
+    versions: Dict[str, str],
+    stale_if_error_seconds: float = 0
+) -> int:
+    """Restore still-current entries from `path` into `cache`. Returns the number restored.
+
+    A missing, unreadable or foreign-format file restores nothing.
+
+    Args:
+        cache: Cache to restore into
+        path: Snapshot file
+        versions: Current fingerprint of each dependency tag
+        stale_if_error_seconds: Grace kept past each entry's TTL, as get_or_load()
+            gives the entries it stores
+    """
+    entries = await asyncio.get_running_loop().run_in_executor(None, _read_snapshot, Path(path), versions)
+    for key, value, ttl, soft_ttl, tags in entries:
+        cache.set(
+            key, value, ttl_seconds=ttl, tags=tags,
+            soft_ttl_seconds=soft_ttl, stale_if_error_seconds=stale_if_error_seconds
+        )
+    return len(entries)
+
+
+def _write_snapshot(entries: List[Entry], path: Path, versions: Dict[str, str]) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"format": SNAPSHOT_FORMAT, "saved_at": time.time()}) + "\n")
+            for key, value, ttl, soft_ttl, tags in entries:
+                if not tags or any(tag not in versions for tag in tags):
+                    continue
+                if ttl is not None and ttl < MIN_REMAINING_TTL_SECONDS:
+                    continue
+                try:
+                    kind, payload = encode_value(value)
+                except UnsupportedValue:
+                    continue
+                f.write(json.dumps({
+                    "k": key,
+                    "c": kind,
+                    "v": base64.b64encode(payload).decode("ascii"),
+                    "e": ttl,
+                    "s": soft_ttl,
+                    "t": {tag: versions[tag] for tag in tags},
+                }) + "\n")
+                written += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return written
+
+
+def _read_snapshot(path: Path, versions: Dict[str, str]) -> List[Entry]:
+    entries: List[Entry] = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("format") != SNAPSHOT_FORMAT:
+                logger.info(f"Ignoring cache snapshot {path} with unknown format")
+                return []
+            # Time spent down counts against the remaining lifetimes
+            elapsed = max(0.0, time.time() - header["saved_at"])
+
+            for line in f:
+                record = json.loads(line)
+                if any(versions.get(tag) != version for tag, version in record["t"].items()):
+                    continue
+                ttl = record["e"] - elapsed if record["e"] is not None else None
+                if ttl is not None and ttl <= 0:
+                    continue
+                soft_ttl = record["s"] - elapsed if record["s"] is not None else None
+                try:
+                    value = decode_value(record["c"], base64.b64decode(record["v"]))
+                except (UnsupportedValue, ValueError):
+                    continue
+                entries.append((record["k"], value, ttl, soft_ttl, list(record["t"])))
+    except FileNotFoundError:
+        return []
+    except (OSError, EOFError, ValueError, KeyError) as e:
+        logger.warning(f"Discarding unreadable cache snapshot {path}: {e}")
+    return entries
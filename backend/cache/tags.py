@@ -0,0 +1,71 @@
+"""Dependency tags shared by cache readers (public routes) and writers (admin routes).
+
+A cached blog detail depends on ``blog:<id>``. Cached listings depend on
+``list:published`` and, when filtered, on ``category:<name>`` or ``tag:<t>``.
+Site-wide documents (profile, about, testimonials, page content) use ``site:*``.
+"""
+from typing import Iterable, Optional, Set
+
+
+LIST_PUBLISHED = "list:published"
+
+SITE_PROFILE = "site:profile"
+SITE_ABOUT = "site:about"
+SITE_TESTIMONIALS = "site:testimonials"
+
+# Blog fields left out of list payloads: writes touching only these keep cached listings
+LIST_HIDDEN_FIELDS = {"content", "editor_blocks", "updated_at"}
+
+# Projection used by every cached blog listing
+LIST_PROJECTION = {"_id": 0, **{field: 0 for field in LIST_HIDDEN_FIELDS}}
+
+
+def blog_tag(blog_id: str) -> str:
+    return f"blog:{blog_id}"
+
+
+def category_tag(category: str) -> str:
+    return f"category:{category}"
+
+
+def tag_tag(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def page_content_tag(page: str) -> str:
+    return f"site:content:{page}"
+
+
+def blog_list_tags(blog: Optional[dict]) -> Set[str]:
+    """Tags of every listing a blog document appears in (empty if unpublished)."""
+    if not blog or not blog.get("is_published", True):
+        return set()
+    tags = {LIST_PUBLISHED}
+    if blog.get("category"):
+        tags.add(category_tag(blog["category"]))
+    for t in blog.get("tags") or []:
+        tags.add(tag_tag(t))
+    return tags
+
+
+def changed_list_fields(before: dict, update: dict) -> Set[str]:
+    """Names of list-visible fields whose value differs between `before` and `update`."""
+    return {
+        field for field, value in update.items()
+        if field not in LIST_HIDDEN_FIELDS and before.get(field) != value
+    }
+
+
+def blog_invalidation_tags(blog_id: str, *states: Optional[dict], lists_changed: bool = True) -> Iterable[str]:
+    """Tags to evict after a write to a blog.
+
+    Args:
+        blog_id: ID of the written blog (its detail entry is always evicted)
+        states: Blog documents before and/or after the write
+        lists_changed: False when only list-hidden fields changed
+    """
+    tags = {blog_tag(blog_id)}
+    if lists_changed:
+        for state in states:
+            tags |= blog_list_tags(state)
+    return tags
@@ -0,0 +1,21 @@
+"""
+Versioned data migrations
+
+Run with ``python -m migrations`` (see ``--help``). Add a migration as a new
+``mNNNN_<name>.py`` module defining ID, DESCRIPTION and ``async def run(ctx)``,
+and list it in MIGRATIONS.
+"""
+from .runner import Backfill, Migration, MigrationContext, MigrationLocked, MigrationRunner
+from . import m0001_expiring_timestamps_to_dates, m0002_unique_blog_slugs
+
+MIGRATIONS = [
+    Migration(module.ID, module.DESCRIPTION, module.run)
+    for module in (
+        m0001_expiring_timestamps_to_dates,
+        m0002_unique_blog_slugs,
+    )
+]
+
+
+def get_runner(db, **kwargs) -> MigrationRunner:
+    return MigrationRunner(db, MIGRATIONS, **kwargs)
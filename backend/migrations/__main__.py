@@ -0,0 +1,65 @@
+"""
+Command line entry point
+
+    python -m migrations              # apply pending migrations
+    python -m migrations --dry-run    # report how many documents each step would change
+    python -m migrations --status     # list migrations and their state
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from . import MigrationLocked, get_runner
+from .runner import DEFAULT_BATCH_SIZE, DEFAULT_PAUSE_SECONDS
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Apply data migrations")
+    parser.add_argument("--dry-run", action="store_true", help="count affected documents without writing")
+    parser.add_argument("--status", action="store_true", help="show migration state and exit")
+    parser.add_argument("--target", help="stop after this migration id")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="documents per batch")
+    parser.add_argument(
+        "--pause-ms", type=int, default=int(DEFAULT_PAUSE_SECONDS * 1000),
+        help="pause between batches, to limit load on a live database"
+    )
+    return parser.parse_args(argv)
+
+
+async def _main(argv) -> int:
+    args = _parse_args(argv)
+    load_dotenv(Path(__file__).parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    client = AsyncIOMotorClient(os.environ["MONGODB_URI"])
+    runner = get_runner(
+        client[os.environ["DB_NAME"]], batch_size=args.batch_size, pause_seconds=args.pause_ms / 1000
+    )
+    try:
+        if args.status:
+            for record in await runner.status():
+                print(f"{record['id']:<40} {record['status']:<8} {record['description']}")
+            return 0
+
+        reports = await runner.run(dry_run=args.dry_run, target=args.target)
+        if not reports:
+            print("No pending migrations")
+        for migration_id, report in reports.items():
+            steps = ", ".join(f"{name}={count}" for name, count in report.items()) or "no steps"
+            print(f"{migration_id}: {'would change' if args.dry_run else 'changed'} {steps}")
+        return 0
+    except MigrationLocked as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
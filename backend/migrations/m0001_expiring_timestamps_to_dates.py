@@ -0,0 +1,51 @@
+"""
+Store the timestamps of expiring collections as BSON dates
+
+TTL indexes only expire dates, so records written with ISO-string timestamps
+would never be removed. Also drops the leftover ``account_lockouts`` records;
+locks are kept in ``login_failures`` now.
+"""
+from utils.dates import as_utc_datetime
+
+from .runner import Backfill, MigrationContext
+
+ID = "0001_expiring_timestamps_to_dates"
+DESCRIPTION = "Convert ISO-string timestamps of expiring collections to dates"
+
+# collection -> fields that may hold ISO strings
+FIELDS = {
+    "rate_limits": ["timestamp"],
+    "otp_codes": ["created_at", "expires_at"],
+    "webauthn_challenges": ["created_at", "expires_at"],
+    "login_failures": ["last_attempt", "locked_until"],
+    "visit_logs": ["timestamp"],
+}
+
+
+def _to_dates(fields):
+    def transform(doc: dict):
+        updates = {}
+        for name in fields:
+            value = doc.get(name)
+            if isinstance(value, str):
+                parsed = as_utc_datetime(value)
+                if parsed is not None:
+                    updates[name] = parsed
+        return {"$set": updates} if updates else None
+    return transform
+
+
+async def run(ctx: MigrationContext):
+    for collection, fields in FIELDS.items():
+        await ctx.backfill(Backfill(
+            name=collection,
+            collection=collection,
+            filter={"$or": [{name: {"$type": "string"}} for name in fields]},
+            transform=_to_dates(fields),
+            projection={name: 1 for name in fields}
+        ))
+
+    lockouts = ctx.db.account_lockouts
+    ctx.count("account_lockouts", await lockouts.count_documents({}))
+    if not ctx.dry_run:
+        await lockouts.drop()
@@ -0,0 +1,40 @@
+"""
+Make blog slugs unique
+
+Blogs sharing a slug only ever served the first match. The oldest post keeps
+the slug; the others get a suffix from their id. Then the unique index on
+``blogs.slug`` from utils.indexes is built.
+"""
+from pymongo import UpdateOne
+
+from utils.indexes import INDEXES
+
+from .runner import MigrationContext
+
+ID = "0002_unique_blog_slugs"
+DESCRIPTION = "Rename duplicate blog slugs so the unique slug index can be built"
+
+
+async def run(ctx: MigrationContext):
+    duplicates = ctx.db.blogs.aggregate([
+        {"$match": {"slug": {"$type": "string"}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": "$slug", "blogs": {"$push": {"_id": "$_id", "id": "$id"}}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ])
+
+    operations = []
+    async for group in duplicates:
+        for blog in group["blogs"][1:]:
+            suffix = str(blog.get("id") or blog["_id"])[:8]
+            operations.append(UpdateOne({"_id": blog["_id"]}, {"$set": {"slug": f"{group['_id']}-{suffix}"}}))
+
+    ctx.count("renamed", len(operations))
+    if operations and not ctx.dry_run:
+        for start in range(0, len(operations), ctx.batch_size):
+            await ctx.db.blogs.bulk_write(operations[start:start + ctx.batch_size], ordered=False)
+
+    if not ctx.dry_run:
+        for spec in INDEXES:
+            if spec.collection == "blogs" and spec.keys == (("slug", 1),):
+                await ctx.db.blogs.create_index(list(spec.keys), name=spec.name, unique=spec.unique)
@@ -0,0 +1,225 @@
+"""
+Migration runner
+Applies versioned data migrations in order and records them in the
+``migrations`` collection
+
+A migration is an async function taking a MigrationContext. Most data changes
+are expressed as a Backfill: a filter selecting the documents still to change
+and a function turning one document into an update. Backfills walk the
+collection in ``_id`` order in batches, write each batch with one unordered
+``bulk_write``, checkpoint the last ``_id`` in the migration's record and pause
+between batches, so they can run against a live database and resume where an
+interrupted run stopped.
+
+In dry-run mode nothing is written; each step reports how many documents it
+would change.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "migrations"
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAUSE_SECONDS = 0.05
+
+# A run holds a lease on the migration it applies, renewed with every batch,
+# so two runners never apply the same migration at once
+LEASE_SECONDS = 120
+
+
+class MigrationLocked(Exception):
+    """Raised when another runner holds the lease on a migration."""
+
+
+@dataclass(frozen=True)
+class Migration:
+    id: str
+    description: str
+    run: Callable[["MigrationContext"], Awaitable[None]]
+
+
+@dataclass
+class Backfill:
+    """
+    Batched update of the documents matching `filter`.
+
+    Args:
+        name: Step name, used for the checkpoint and the report
+        collection: Collection to update
+        filter: Selects documents that still need the change
+        transform: Returns the update for one document, or None to leave it
+        projection: Fields `transform` needs (None fetches whole documents)
+    """
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    transform: Callable[[dict], Optional[dict]]
+    projection: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class MigrationContext:
+    db: Any
+    migration_id: str
+    dry_run: bool = False
+    batch_size: int = DEFAULT_BATCH_SIZE
+    pause_seconds: float = DEFAULT_PAUSE_SECONDS
+    checkpoints: Dict[str, Any] = field(default_factory=dict)
+    report: Dict[str, int] = field(default_factory=dict)
+
+    async def backfill(self, step: Backfill) -> int:
+        """Apply `step` (or count it in dry-run mode). Returns the documents changed."""
+        collection = self.db[step.collection]
+        last_id = self.checkpoints.get(step.name)
+        changed = 0
+
+        while True:
+            query = dict(step.filter)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await collection.find(query, step.projection).sort("_id", ASCENDING).to_list(self.batch_size)
+            if not batch:
+                break
+
+            operations = []
+            for doc in batch:
+                update = step.transform(doc)
+                if update:
+                    operations.append(UpdateOne({"_id": doc["_id"]}, update))
+            if operations and not self.dry_run:
+                await collection.bulk_write(operations, ordered=False)
+            changed += len(operations)
+            last_id = batch[-1]["_id"]
+
+            if not self.dry_run:
+                await self._checkpoint(step.name, last_id)
+            if len(batch) < self.batch_size:
+                break
+            await asyncio.sleep(self.pause_seconds)
+
+        self.report[step.name] = changed
+        return changed
+
+    def count(self, name: str, value: int):
+        """Record the size of a step that is not a Backfill."""
+        self.report[name] = value
+
+    async def _checkpoint(self, name: str, last_id: Any):
+        self.checkpoints[name] = last_id
+        await self.db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": self.migration_id},
+            {"$set": {
+                f"checkpoints.{name}": last_id,
+                "locked_until": _now() + timedelta(seconds=LEASE_SECONDS)
+            }}
+        )
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class MigrationRunner:
+    """Applies `migrations` (ordered by id) that are not yet recorded as done."""
+
+    def __init__(
+        self,
+        db,
+        migrations: List[Migration],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        pause_seconds: float = DEFAULT_PAUSE_SECONDS
+    ):
+        self.db = db
+        self.migrations = sorted(migrations, key=lambda m: m.id)
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+    @property
+    def _records(self):
+        return self.db[MIGRATIONS_COLLECTION]
+
+    async def pending(self) -> List[Migration]:
+        done = {doc["_id"] async for doc in self._records.find({"status": "done"}, {"_id": 1})}
+        return [m for m in self.migrations if m.id not in done]
+
+    async def status(self) -> List[dict]:
+        records = {doc["_id"]: doc async for doc in self._records.find({})}
+        return [
+            {"id": m.id, "description": m.description, **{
+                k: v for k, v in records.get(m.id, {"status": "pending"}).items() if k != "_id"
+            }}
+            for m in self.migrations
+        ]
+
+    async def run(self, dry_run: bool = False, target: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Apply pending migrations up to and including `target`. Returns per-step counts."""
+        reports = {}
+        for migration in await self.pending():
+            if target is not None and migration.id > target:
+                break
+            reports[migration.id] = await self._apply(migration, dry_run)
+        return reports
+
+    async def _apply(self, migration: Migration, dry_run: bool) -> Dict[str, int]:
+        checkpoints = {}
+        if not dry_run:
+            record = await self._claim(migration)
+            checkpoints = record.get("checkpoints", {})
+            if checkpoints:
+                logger.info(f"Resuming migration {migration.id}")
+
+        ctx = MigrationContext(
+            self.db, migration.id, dry_run, self.batch_size, self.pause_seconds, checkpoints
+        )
+        logger.info(f"{'Dry-running' if dry_run else 'Applying'} migration {migration.id}: {migration.description}")
+        try:
+            await migration.run(ctx)
+        except BaseException:
+            if not dry_run:
+                # Keep the checkpoints; release the lease so a rerun can resume at once
+                await self._records.update_one(
+                    {"_id": migration.id}, {"$set": {"status": "failed", "locked_until": _now()}}
+                )
+            raise
+
+        if not dry_run:
+            await self._records.update_one(
+                {"_id": migration.id},
+                {
+                    "$set": {"status": "done", "finished_at": _now(), "report": ctx.report},
+                    "$unset": {"locked_until": "", "checkpoints": ""}
+                }
+            )
+        return ctx.report
+
+    async def _claim(self, migration: Migration) -> dict:
+        now = _now()
+        try:
+            return await self._records.find_one_and_update(
+                {
+                    "_id": migration.id,
+                    "status": {"$ne": "done"},
+                    "$or": [{"locked_until": {"$exists": False}}, {"locked_until": {"$lt": now}}]
+                },
+                {
+                    "$set": {
+                        "status": "running",
+                        "description": migration.description,
+                        "locked_until": now + timedelta(seconds=LEASE_SECONDS)
+                    },
+                    "$setOnInsert": {"started_at": now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError as e:
+            # The upsert collides with the existing record when its lease is held
+            raise MigrationLocked(f"Migration {migration.id} is being applied by another runner") from e
@@ -3,15 +3,25 @@ from typing import List, Optional
 from pydantic import BaseModel, Field
 import uuid
 import re
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone, timedelta
+from pymongo.errors import DuplicateKeyError
 
 from routes.auth_routes import get_admin_user, User
+from utils.bot_detection import bot_hit_counts
+from utils.dates import as_utc_datetime
+from utils.visit_rollups import GRANULARITIES, query_visit_analytics
+from utils.visitor_sketches import SITE_SCOPE, blog_scope, count_unique_visitors
+from cache.tags import (
+    LIST_PUBLISHED, SITE_PROFILE, blog_tag, category_tag, page_content_tag,
+    blog_invalidation_tags, changed_list_fields
+)
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 # Will be set from main server.py
 db = None
 cache = None
+slug_index = None
 
 def set_db(database):
     global db
@@ -21,12 +31,25 @@ def set_cache(cache_instance):
     global cache
     cache = cache_instance
 
-def invalidate_blog_cache(slug: str = None):
-    """Invalidate blog-related caches"""
+def set_slug_index(index):
+    global slug_index
+    slug_index = index
+
+# Write buffers and breakers reported by /cache/stats, by name (each has a stats() method)
+stats_sources = {}
+
+def set_stats_sources(**sources):
+    stats_sources.update(sources)
+
+def invalidate_blog_cache(blog_id: str, *states: dict, lists_changed: bool = True):
+    """Invalidate the cached detail for a blog and the listings its states appear in"""
     if cache:
-        if slug:
-            cache.invalidate(f"blog:{slug}")
-        cache.invalidate("blogs:")
+        cache.invalidate_tags(*blog_invalidation_tags(blog_id, *states, lists_changed=lists_changed))
+
+def update_slug_index(blog_id: str, before: Optional[dict], after: Optional[dict]):
+    """Keep the published slug index in step with a blog write"""
+    if slug_index:
+        slug_index.apply(blog_id, before, after)
 
 
 def generate_slug(title: str) -> str:
@@ -68,12 +91,16 @@ async def update_profile(profile_data: ProfileUpdate, admin: User = Depends(get_
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
     
+    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    
     # Upsert profile
     await db.profile.update_one(
         {},
         {"$set": update_data},
         upsert=True
     )
+    if cache:
+        cache.invalidate_tags(SITE_PROFILE)
     
     return {"message": "Profile updated successfully"}
 
@@ -251,6 +278,66 @@ async def get_stats(admin: User = Depends(get_admin_user)):
     }
 
 
+# ============ Cache Stats ============
+@router.get("/cache/stats")
+async def get_cache_stats(admin: User = Depends(get_admin_user)):
+    """Get response cache counters (hits, misses, evictions, size) and those of the write buffers"""
+    if cache is None:
+        raise HTTPException(status_code=503, detail="Cache not configured")
+    return {**cache.stats(), **{name: source.stats() for name, source in stats_sources.items()}}
+
+
+# ============ Visit Analytics ============
+# Default range per granularity when no start is given
+ANALYTICS_DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+@router.get("/analytics/visits")
+async def get_visit_analytics(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    top: int = 10,
+    admin: User = Depends(get_admin_user)
+):
+    """Visit counts per hour or day with top referrer paths and browser families (from the rollups)"""
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    end = as_utc_datetime(end) or datetime.now(timezone.utc)
+    start = as_utc_datetime(start) or end - ANALYTICS_DEFAULT_RANGE[granularity]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    return await query_visit_analytics(db, start, end, granularity, top=max(1, min(top, 100)))
+
+
+# Longest range merged for a unique-visitor estimate
+MAX_VISITOR_RANGE_DAYS = 366
+
+@router.get("/analytics/visitors")
+async def get_unique_visitors(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    blog_id: Optional[str] = None,
+    admin: User = Depends(get_admin_user)
+):
+    """Estimated unique visitors per day and over the range, site-wide or for one post (about 1% error)"""
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= MAX_VISITOR_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_VISITOR_RANGE_DAYS} days")
+    
+    scope = blog_scope(blog_id) if blog_id else SITE_SCOPE
+    return await count_unique_visitors(db.visitor_sketches, scope, start, end)
+
+
+@router.get("/analytics/bots")
+async def get_bot_hits(admin: User = Depends(get_admin_user)):
+    """Bot visits and views kept out of the statistics (this worker, since it started)"""
+    return bot_hit_counts()
+
+
 # ============ Page Content CRUD ============
 class PageContentUpdate(BaseModel):
     hero_tagline: Optional[str] = None
@@ -292,9 +379,11 @@ async def update_page_content(page: str, content_data: PageContentUpdate, admin:
     
     await db.page_content.update_one(
         {"page": page},
-        {"$set": {"page": page, **update_data}},
+        {"$set": {"page": page, **update_data, "updated_at": datetime.now(timezone.utc).isoformat()}},
         upsert=True
     )
+    if cache:
+        cache.invalidate_tags(page_content_tag(page))
     
     return {"message": f"{page} content updated successfully"}
 
@@ -381,10 +470,17 @@ async def create_blog(blog: BlogCreate, admin: User = Depends(get_admin_user)):
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.blogs.insert_one(blog_doc)
+    try:
+        await db.blogs.insert_one(blog_doc)
+    except DuplicateKeyError:
+        # Another post took the slug since the check above (slugs are unique)
+        blog_doc.pop("_id", None)
+        slug = blog_doc["slug"] = f"{slug}-{str(uuid.uuid4())[:8]}"
+        await db.blogs.insert_one(blog_doc)
     
     # Invalidate cache so new blog appears in lists
-    invalidate_blog_cache()
+    update_slug_index(blog_doc["id"], None, blog_doc)
+    invalidate_blog_cache(blog_doc["id"], blog_doc)
     
     return {"id": blog_doc["id"], "slug": slug, "message": "Blog created successfully"}
 
@@ -392,9 +488,8 @@ async def create_blog(blog: BlogCreate, admin: User = Depends(get_admin_user)):
 @router.put("/blogs/{blog_id}")
 async def update_blog(blog_id: str, blog: BlogUpdate, admin: User = Depends(get_admin_user)):
     """Update a blog post"""
-    # Get existing blog to get slug for cache invalidation
-    existing_blog = await db.blogs.find_one({"id": blog_id})
-    old_slug = existing_blog.get("slug") if existing_blog else None
+    # Get existing blog to work out which cached listings it affects
+    existing_blog = await db.blogs.find_one({"id": blog_id}, {"_id": 0})
     
     update_data = {k: v for k, v in blog.model_dump().items() if v is not None}
     
@@ -406,33 +501,34 @@ async def update_blog(blog_id: str, blog: BlogUpdate, admin: User = Depends(get_
         update_data["reading_time"] = calculate_reading_time(update_data["content"])
     
     # Handle slug - use custom slug if provided, otherwise generate from title if title changed
-    new_slug = None
     if "slug" in update_data and update_data["slug"]:
         slug = update_data["slug"].strip().lower()
         slug = re.sub(r'[^a-z0-9-]', '', slug)
         slug = re.sub(r'-+', '-', slug).strip('-')
         update_data["slug"] = slug
-        new_slug = slug
     elif "title" in update_data:
         update_data["slug"] = generate_slug(update_data["title"])
-        new_slug = update_data["slug"]
     
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    result = await db.blogs.update_one(
-        {"id": blog_id},
-        {"$set": update_data}
-    )
+    try:
+        result = await db.blogs.update_one(
+            {"id": blog_id},
+            {"$set": update_data}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Another blog post already uses this slug")
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Blog not found")
     
-    # Invalidate cache for old and new slugs
-    if old_slug:
-        invalidate_blog_cache(old_slug)
-    if new_slug and new_slug != old_slug:
-        invalidate_blog_cache(new_slug)
-    invalidate_blog_cache()  # Also invalidate list cache
+    # The detail entry is always evicted; listings only if a list-visible field changed
+    before = existing_blog or {}
+    update_slug_index(blog_id, existing_blog, {**before, **update_data})
+    invalidate_blog_cache(
+        blog_id, existing_blog, {**before, **update_data},
+        lists_changed=not existing_blog or bool(changed_list_fields(before, update_data))
+    )
     
     return {"message": "Blog updated successfully"}
 
@@ -440,9 +536,8 @@ async def update_blog(blog_id: str, blog: BlogUpdate, admin: User = Depends(get_
 @router.delete("/blogs/{blog_id}")
 async def delete_blog(blog_id: str, admin: User = Depends(get_admin_user)):
     """Delete a blog post"""
-    # Get blog first to get slug for cache invalidation
-    blog = await db.blogs.find_one({"id": blog_id})
-    slug = blog.get("slug") if blog else None
+    # Get blog first to work out which cached listings it appears in
+    blog = await db.blogs.find_one({"id": blog_id}, {"_id": 0})
     
     result = await db.blogs.delete_one({"id": blog_id})
     
@@ -453,9 +548,8 @@ async def delete_blog(blog_id: str, admin: User = Depends(get_admin_user)):
     await db.comments.delete_many({"blog_id": blog_id})
     
     # Invalidate cache
-    if slug:
-        invalidate_blog_cache(slug)
-    invalidate_blog_cache()
+    update_slug_index(blog_id, blog, None)
+    invalidate_blog_cache(blog_id, blog)
     
     return {"message": "Blog deleted successfully"}
 
@@ -574,10 +668,17 @@ async def delete_category(category_name: str, admin: User = Depends(get_admin_us
         raise HTTPException(status_code=404, detail="Category not found")
     
     # Update any blogs using this category to 'General'
+    affected = await db.blogs.find({"category": category_name}, {"_id": 0, "id": 1}).to_list(None)
     await db.blogs.update_many(
         {"category": category_name},
         {"$set": {"category": "General"}}
     )
     
+    if cache and affected:
+        cache.invalidate_tags(
+            LIST_PUBLISHED, category_tag(category_name), category_tag("General"),
+            *(blog_tag(b["id"]) for b in affected)
+        )
+    
     return {"message": f"Category '{category_name}' deleted successfully"}
 
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+import asyncio
 import uuid
 from datetime import datetime, timezone
 
@@ -10,10 +12,10 @@ from auth import (
     create_refresh_token, decode_refresh_token
 )
 from utils import (
-    check_rate_limit, record_attempt,
     check_account_lockout, increment_failure_count, clear_failure_count,
-    log_audit, AuditAction, set_rate_limiter_db
+    log_audit, log_audit_background, AuditAction, set_rate_limiter_db
 )
+from utils.rate_limit_middleware import RateLimitPolicy, get_client_ip
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 security = HTTPBearer()
@@ -25,6 +27,21 @@ WINDOW_SECONDS = 300  # 5 minutes
 MAX_FAILURES_BEFORE_LOCKOUT = 10
 LOCKOUT_DURATION_MINUTES = 30
 
+# Per-IP limits, enforced by RateLimitMiddleware before the handlers run.
+# Login counts every attempt; TOTP counts failed codes. Both clear on success.
+RATE_LIMIT_POLICIES = [
+    RateLimitPolicy(
+        "POST", r"/api/auth/login", "login", MAX_ATTEMPTS, WINDOW_SECONDS,
+        detail=f"Too many login attempts. Try again in {WINDOW_SECONDS // 60} minutes.",
+        clear_on_success=True
+    ),
+    RateLimitPolicy(
+        "POST", r"/api/auth/login/totp", "totp", TOTP_MAX_ATTEMPTS, WINDOW_SECONDS,
+        detail=f"Too many TOTP attempts. Try again in {WINDOW_SECONDS // 60} minutes.",
+        consume=False, record_statuses=frozenset({401}), clear_on_success=True
+    ),
+]
+
 # Will be set from main server.py
 db = None
 
@@ -164,20 +181,16 @@ async def register(user_data: UserCreate):
 
 @router.post("/login")
 async def login(credentials: UserLogin, request: Request):
-    """Login and get access token with persistent rate limiting and account lockout."""
-    # Get real client IP (handle proxies)
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    # Check account lockout first
-    is_locked, unlock_time = await check_account_lockout(
-        credentials.email, 
-        MAX_FAILURES_BEFORE_LOCKOUT, 
-        LOCKOUT_DURATION_MINUTES
+    """Login and get access token with account lockout (IP rate limited by RateLimitMiddleware)."""
+    client_ip = get_client_ip(request)
+    
+    # The lockout and the user are independent lookups: fetch them concurrently
+    (is_locked, unlock_time), user = await asyncio.gather(
+        check_account_lockout(credentials.email, MAX_FAILURES_BEFORE_LOCKOUT, LOCKOUT_DURATION_MINUTES),
+        db.users.find_one({"email": credentials.email})
     )
     if is_locked:
-        await log_audit(
+        log_audit_background(
             AuditAction.LOGIN_FAILED,
             user_email=credentials.email,
             ip_address=client_ip,
@@ -189,27 +202,11 @@ async def login(credentials: UserLogin, request: Request):
             detail=f"Account temporarily locked. Try again after {unlock_time.strftime('%H:%M UTC') if unlock_time else 'some time'}."
         )
     
-    # Check IP-based rate limit (persistent)
-    is_allowed, remaining = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="login",
-        max_attempts=MAX_ATTEMPTS,
-        window_seconds=WINDOW_SECONDS
-    )
-    
-    if not is_allowed:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Too many login attempts. Try again in {WINDOW_SECONDS // 60} minutes."
-        )
-    
-    user = await db.users.find_one({"email": credentials.email})
-    
-    if not user or not verify_password(credentials.password, user["hashed_password"]):
-        # Record failed attempt for both IP and account
-        await record_attempt(client_ip, "login")
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, credentials.password, user["hashed_password"]):
+        # The IP attempt is already counted; record the failure against the account
         await increment_failure_count(credentials.email, MAX_FAILURES_BEFORE_LOCKOUT, LOCKOUT_DURATION_MINUTES)
-        await log_audit(
+        log_audit_background(
             AuditAction.LOGIN_FAILED,
             user_email=credentials.email,
             ip_address=client_ip,
@@ -222,12 +219,10 @@ async def login(credentials: UserLogin, request: Request):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Clear rate limits on successful credential verification
-    await record_attempt(client_ip, "login", success=True)
-    await clear_failure_count(credentials.email)
-    
     # Check if TOTP is enabled for this user
     if user.get('totp_enabled') and user.get('totp_secret'):
+        # Clear the account's failures (the middleware clears the IP limit on success)
+        await clear_failure_count(credentials.email)
         # Return indicator that TOTP is required
         return {
             "requires_totp": True,
@@ -240,22 +235,26 @@ async def login(credentials: UserLogin, request: Request):
     previous_ip = user.get('last_login_ip')
     current_login = datetime.now(timezone.utc).isoformat()
     
-    # Update last login in database
-    await db.users.update_one(
-        {"email": user["email"]},
-        {"$set": {
-            "last_login": current_login, 
-            "previous_login": previous_login,
-            "last_login_ip": client_ip,
-            "previous_login_ip": previous_ip
-        }}
+    # Update last login and clear the account's failures together
+    # (the middleware clears the IP limit on success)
+    await asyncio.gather(
+        db.users.update_one(
+            {"email": user["email"]},
+            {"$set": {
+                "last_login": current_login, 
+                "previous_login": previous_login,
+                "last_login_ip": client_ip,
+                "previous_login_ip": previous_ip
+            }}
+        ),
+        clear_failure_count(credentials.email)
     )
     
     # Generate tokens
     access_token = create_access_token(data={"sub": user["email"]})
     refresh_token = create_refresh_token(data={"sub": user["email"]})
     
-    await log_audit(
+    log_audit_background(
         AuditAction.LOGIN_SUCCESS,
         user_id=user.get("id"),
         user_email=user["email"],
@@ -276,24 +275,8 @@ async def login_with_totp(request: Request):
     """Complete login with TOTP code after password verification"""
     from utils.crypto import decrypt_sensitive_data
     
-    # Get real client IP (handle proxies)
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    # Rate limiting for TOTP attempts (stricter than login, persistent)
-    is_allowed, _ = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="totp",
-        max_attempts=TOTP_MAX_ATTEMPTS,
-        window_seconds=WINDOW_SECONDS
-    )
-    
-    if not is_allowed:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Too many TOTP attempts. Try again in {WINDOW_SECONDS // 60} minutes."
-        )
+    # Failed attempts are counted per IP by RateLimitMiddleware (401 responses)
+    client_ip = get_client_ip(request)
     
     body = await request.json()
     email = body.get('email')
@@ -305,8 +288,7 @@ async def login_with_totp(request: Request):
     
     user = await db.users.find_one({"email": email})
     
-    if not user or not verify_password(password, user["hashed_password"]):
-        await record_attempt(client_ip, "totp")
+    if not user or not await run_in_threadpool(verify_password, password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"  # Generic message to prevent enumeration
@@ -327,12 +309,8 @@ async def login_with_totp(request: Request):
     
     totp = pyotp.TOTP(totp_secret)
     if not totp.verify(totp_code, valid_window=1):  # Allow 1 window tolerance
-        await record_attempt(client_ip, "totp")
         raise HTTPException(status_code=401, detail="Invalid TOTP code")
     
-    # Clear attempts on success
-    await record_attempt(client_ip, "totp", success=True)
-    
     # Store current login time and get previous login time/IP
     previous_login = user.get('last_login')
     previous_ip = user.get('last_login_ip')
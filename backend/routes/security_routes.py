@@ -34,12 +34,13 @@ from webauthn.helpers.cose import COSEAlgorithmIdentifier
 from routes.auth_routes import get_admin_user, get_current_user, User
 from auth import verify_password, get_password_hash
 from utils import (
-    check_rate_limit, record_attempt,
     log_audit, AuditAction,
     encrypt_sensitive_data, decrypt_sensitive_data,
     hash_otp_code, verify_otp_hash,
     validate_password_strength
 )
+from utils.dates import as_utc_datetime
+from utils.rate_limit_middleware import RateLimitPolicy, get_client_ip
 
 router = APIRouter(prefix="/security", tags=["Security"])
 
@@ -48,6 +49,23 @@ PASSKEY_MAX_ATTEMPTS = 5
 PASSKEY_WINDOW_SECONDS = 300  # 5 minutes
 WEBAUTHN_CHALLENGE_TTL_SECONDS = 300  # 5 minutes
 
+# Per-IP passkey limits, enforced by RateLimitMiddleware before the handlers run.
+# Requesting options only checks the limit; every authentication attempt counts
+# until one succeeds.
+_PASSKEY_LIMIT_DETAIL = f"Too many attempts. Try again in {PASSKEY_WINDOW_SECONDS // 60} minutes."
+RATE_LIMIT_POLICIES = [
+    RateLimitPolicy(
+        "POST", r"/api/security/passkey/authenticate-options", "passkey",
+        PASSKEY_MAX_ATTEMPTS, PASSKEY_WINDOW_SECONDS,
+        detail=_PASSKEY_LIMIT_DETAIL, consume=False
+    ),
+    RateLimitPolicy(
+        "POST", r"/api/security/passkey/authenticate", "passkey",
+        PASSKEY_MAX_ATTEMPTS, PASSKEY_WINDOW_SECONDS,
+        detail=_PASSKEY_LIMIT_DETAIL, clear_on_success=True
+    ),
+]
+
 # Will be set from main server.py
 db = None
 
@@ -277,13 +295,13 @@ async def send_otp(request: Request):
     # Hash OTP code before storage for security
     otp_hash = hash_otp_code(otp_code, session_token)
     
-    # Store OTP with expiration (hashed)
+    # Store OTP with expiration (hashed); the TTL index on expires_at removes it
     await db.otp_codes.insert_one({
         "email": email,
         "otp_hash": otp_hash,  # Store hash, not plain code
         "session_token": session_token,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "expires_at": (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat(),
+        "created_at": datetime.now(timezone.utc),
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
         "used": False
     })
     
@@ -310,7 +328,8 @@ async def verify_otp(data: OTPVerify):
         raise HTTPException(status_code=400, detail="Invalid or expired session")
     
     # Check expiration
-    expires_at = datetime.fromisoformat(otp_record['expires_at'])
+    # TTL deletion runs about once a minute, so expiry is still checked here
+    expires_at = as_utc_datetime(otp_record['expires_at'])
     if datetime.now(timezone.utc) > expires_at:
         raise HTTPException(status_code=400, detail="OTP has expired")
     
@@ -536,12 +555,13 @@ async def get_passkey_registration_options(admin: User = Depends(get_admin_user)
         ]
     )
     
-    # Store challenge
+    # Store challenge (expired challenges are removed by the TTL index)
     await db.webauthn_challenges.update_one(
         {"user_id": admin.id},
         {"$set": {
             "challenge": base64.b64encode(options.challenge).decode(),
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc),
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=WEBAUTHN_CHALLENGE_TTL_SECONDS)
         }},
         upsert=True
     )
@@ -658,25 +678,6 @@ async def update_passkey(passkey_id: str, request: Request, admin: User = Depend
 @router.post("/passkey/authenticate-options")
 async def get_passkey_auth_options(request: Request):
     """Generate WebAuthn authentication options for discoverable credentials (no email needed)"""
-    # Get real client IP (handle proxies)
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    # Rate limiting (persistent)
-    is_allowed, _ = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="passkey",
-        max_attempts=PASSKEY_MAX_ATTEMPTS,
-        window_seconds=PASSKEY_WINDOW_SECONDS
-    )
-    
-    if not is_allowed:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Too many attempts. Try again in {PASSKEY_WINDOW_SECONDS // 60} minutes."
-        )
-    
     config = await db.passkey_config.find_one({}, {"_id": 0})
     rp_id = config.get('rp_id', DEFAULT_RP_ID) if config else DEFAULT_RP_ID
     
@@ -694,8 +695,8 @@ async def get_passkey_auth_options(request: Request):
         {"$set": {
             "challenge": base64.b64encode(options.challenge).decode(),
             "type": "authentication",
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "expires_at": expires_at.isoformat()
+            "created_at": datetime.now(timezone.utc),
+            "expires_at": expires_at
         }},
         upsert=True
     )
@@ -709,31 +710,14 @@ async def authenticate_passkey(request: Request):
     """Verify passkey for authentication and return JWT token (usernameless)"""
     from auth import create_access_token, create_refresh_token
     
-    # Get real client IP (handle proxies)
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    # Rate limiting (persistent)
-    is_allowed, _ = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="passkey",
-        max_attempts=PASSKEY_MAX_ATTEMPTS,
-        window_seconds=PASSKEY_WINDOW_SECONDS
-    )
-    
-    if not is_allowed:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Too many attempts. Try again in {PASSKEY_WINDOW_SECONDS // 60} minutes."
-        )
+    # Attempts are counted per IP by RateLimitMiddleware and cleared on success
+    client_ip = get_client_ip(request)
     
     body = await request.json()
     credential = body.get('credential')
     session_id = body.get('session_id')
     
     if not credential or not session_id:
-        await record_attempt(client_ip, "passkey")
         raise HTTPException(status_code=400, detail="Credential and session_id required")
     
     config = await db.passkey_config.find_one({}, {"_id": 0})
@@ -743,15 +727,13 @@ async def authenticate_passkey(request: Request):
     # Get challenge using session_id
     challenge_doc = await db.webauthn_challenges.find_one({"session_id": session_id})
     if not challenge_doc:
-        await record_attempt(client_ip, "passkey")
         raise HTTPException(status_code=400, detail="No authentication in progress")
     
     # Check if challenge has expired
     if challenge_doc.get('expires_at'):
-        expires_at = datetime.fromisoformat(challenge_doc['expires_at'])
+        expires_at = as_utc_datetime(challenge_doc['expires_at'])
         if datetime.now(timezone.utc) > expires_at:
             await db.webauthn_challenges.delete_one({"session_id": session_id})
-            await record_attempt(client_ip, "passkey")
             raise HTTPException(status_code=400, detail="Authentication challenge expired")
     
     expected_challenge = base64.b64decode(challenge_doc['challenge'])
@@ -761,13 +743,11 @@ async def authenticate_passkey(request: Request):
     stored_cred = await db.passkey_credentials.find_one({"credential_id": credential_id})
     
     if not stored_cred:
-        await record_attempt(client_ip, "passkey")
         raise HTTPException(status_code=400, detail="Passkey not found")
     
     # Get user from stored credential
     user = await db.users.find_one({"id": stored_cred['user_id']})
     if not user:
-        await record_attempt(client_ip, "passkey")
         raise HTTPException(status_code=404, detail="User not found")
     
     try:
@@ -780,9 +760,6 @@ async def authenticate_passkey(request: Request):
             credential_current_sign_count=stored_cred['sign_count'],
         )
         
-        # Clear rate limit on success
-        await record_attempt(client_ip, "passkey", success=True)
-        
         # Update sign count and last used
         await db.passkey_credentials.update_one(
             {"id": stored_cred['id']},
@@ -816,7 +793,6 @@ async def authenticate_passkey(request: Request):
         }
     
     except Exception as e:
-        await record_attempt(client_ip, "passkey")
         raise HTTPException(status_code=400, detail=f"Authentication failed: {str(e)}")
 
 
@@ -860,24 +836,26 @@ async def check_mfa_requirements(request: Request):
 
 @router.post("/cleanup/challenges")
 async def cleanup_expired_challenges(admin: User = Depends(get_admin_user)):
-    """Clean up expired WebAuthn challenges and OTP codes"""
-    now = datetime.now(timezone.utc).isoformat()
+    """
+    Clean up expired WebAuthn challenges, OTP codes and rate limit records.
+    
+    TTL indexes expire these on their own; this also removes records written
+    before their timestamps were stored as dates (ISO strings), which TTL
+    indexes ignore.
+    """
+    now = datetime.now(timezone.utc)
+    
+    def expired(field: str, cutoff: datetime) -> dict:
+        return {"$or": [{field: {"$lt": cutoff}}, {field: {"$lt": cutoff.isoformat()}}]}
     
     # Clean up expired WebAuthn challenges
-    challenge_result = await db.webauthn_challenges.delete_many({
-        "expires_at": {"$lt": now}
-    })
+    challenge_result = await db.webauthn_challenges.delete_many(expired("expires_at", now))
     
     # Clean up expired OTP codes
-    otp_result = await db.otp_codes.delete_many({
-        "expires_at": {"$lt": now}
-    })
+    otp_result = await db.otp_codes.delete_many(expired("expires_at", now))
     
     # Clean up old rate limit records (older than 1 hour)
-    cutoff = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
-    rate_limit_result = await db.rate_limits.delete_many({
-        "timestamp": {"$lt": cutoff}
-    })
+    rate_limit_result = await db.rate_limits.delete_many(expired("timestamp", now - timedelta(hours=1)))
     
     return {
         "message": "Cleanup completed",
@@ -912,9 +890,7 @@ async def get_audit_logs_endpoint(
 async def change_password(data: PasswordChange, request: Request, admin: User = Depends(get_admin_user)):
     """Change admin password with strong validation"""
     # Get client IP for audit
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
+    client_ip = get_client_ip(request)
     
     # Get current user from database
     user = await db.users.find_one({"id": admin.id})
@@ -1,16 +1,19 @@
 from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr, field_validator
 from typing import List, Optional
 import uuid
+import asyncio
+import hashlib
 from datetime import datetime, timezone
 import time
 import shutil
@@ -20,13 +23,17 @@ import bleach
 # Import security utilities
 from utils import (
     set_rate_limiter_db, set_audit_db,
-    check_rate_limit, record_attempt,
-    log_audit, AuditAction,
-    hash_ip_address
+    start_rate_limit_sync, stop_rate_limit_sync,
+    log_audit, flush_audit_logs, AuditAction,
+    hash_ip_address,
+    hash_visitor
 )
+from utils.indexes import ensure_indexes
+from migrations import get_runner as get_migration_runner
+from utils.rate_limit_middleware import RateLimitMiddleware, RateLimitPolicy, get_client_ip
 
 # Import storage module for file uploads
-from storage import get_storage
+from storage import UploadTooLarge, get_storage
 
 
 ROOT_DIR = Path(__file__).parent
@@ -46,41 +53,197 @@ CONTACT_WINDOW_SECONDS = 3600  # 1 hour
 # Public API rate limits (to prevent scraping/abuse)
 PUBLIC_API_MAX_REQUESTS = 100  # requests per window
 PUBLIC_API_WINDOW_SECONDS = 60  # 1 minute window
+# Stricter limit for crawler/script user agents on the same routes (0 disables)
+BOT_API_MAX_REQUESTS = int(os.environ.get("BOT_API_MAX_REQUESTS", 30))
+
+
+def _is_preview(request: Request) -> bool:
+    return request.query_params.get("preview", "").lower() in ("1", "true", "yes", "on")
+
+
+def _is_not_bot(request: Request) -> bool:
+    return not is_bot(request.headers.get("user-agent"))
+
+
+# Public route limits, enforced by RateLimitMiddleware before routing
+PUBLIC_RATE_LIMIT_POLICIES = [
+    RateLimitPolicy("GET", r"/api/blogs", "public_api", PUBLIC_API_MAX_REQUESTS, PUBLIC_API_WINDOW_SECONDS),
+    # Previews are admin-only (token checked in the handler) and not limited
+    RateLimitPolicy(
+        "GET", r"/api/blogs/[^/]+", "public_api", PUBLIC_API_MAX_REQUESTS, PUBLIC_API_WINDOW_SECONDS,
+        skip=_is_preview
+    ),
+    RateLimitPolicy("GET", r"/api/comments/[^/]+", "public_api", PUBLIC_API_MAX_REQUESTS, PUBLIC_API_WINDOW_SECONDS),
+    RateLimitPolicy("POST", r"/api/blogs/[^/]+/view", "public_api", PUBLIC_API_MAX_REQUESTS, PUBLIC_API_WINDOW_SECONDS),
+    RateLimitPolicy(
+        "POST", r"/api/contact", "contact", CONTACT_MAX_ATTEMPTS, CONTACT_WINDOW_SECONDS,
+        detail="Too many messages. Please try again later."
+    ),
+    # Also limit by email to prevent spam to the same address from different IPs
+    RateLimitPolicy(
+        "POST", r"/api/contact", "contact_email", 3, CONTACT_WINDOW_SECONDS,  # Max 3 messages per email per hour
+        detail="Too many messages to this email. Please try again later.",
+        identifier="body:email", identifier_prefix="email:"
+    ),
+    RateLimitPolicy(
+        "POST", r"/api/comments", "comment", 10, 600,  # Max 10 comments per 10 minutes per IP
+        detail="Too many comments. Please wait before posting again."
+    ),
+]
+if BOT_API_MAX_REQUESTS > 0:
+    PUBLIC_RATE_LIMIT_POLICIES += [
+        RateLimitPolicy(
+            "GET", r"/api/(blogs(/[^/]+)*|comments/[^/]+)", "bot_api", BOT_API_MAX_REQUESTS,
+            PUBLIC_API_WINDOW_SECONDS, skip=_is_not_bot
+        ),
+        RateLimitPolicy(
+            "POST", r"/api/(visits/track|blogs/[^/]+/view)", "bot_api", BOT_API_MAX_REQUESTS,
+            PUBLIC_API_WINDOW_SECONDS, skip=_is_not_bot
+        ),
+    ]
+
+# In-memory cache for frequently accessed data (bounded LRU with per-entry TTL)
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.bot_detection import is_bot, record_bot_hit
+from utils.view_counter import ViewCounter
+from utils.view_dedup import ViewDeduplicator
+from utils.visit_queue import VisitIngestQueue, sanitize_user_agent
+from utils.visit_rollups import VisitRollup
+from utils.visitor_sketches import SITE_SCOPE, VisitorSketches, blog_scope
+from cache import get_cache
+from cache.responses import CachedResponse, cache_control, http_date
+from cache.slug_index import SlugIndex
+from cache.snapshot import load_snapshot, save_snapshot
+from cache.tags import (
+    LIST_PUBLISHED, LIST_PROJECTION, SITE_ABOUT, SITE_PROFILE, SITE_TESTIMONIALS,
+    blog_list_tags, blog_tag, category_tag, page_content_tag, tag_tag
+)
 
-# In-memory cache for frequently accessed data
-from functools import lru_cache
-from datetime import datetime, timedelta
-import gzip
-from starlette.responses import Response
-from typing import Dict, Any
-import json
-import hashlib
+cache = get_cache()
 
-# Simple in-memory cache with TTL
-class SimpleCache:
-    def __init__(self):
-        self._cache: Dict[str, tuple[Any, datetime]] = {}
-    
-    def get(self, key: str, ttl_seconds: int = 60):
-        if key in self._cache:
-            value, timestamp = self._cache[key]
-            if datetime.now(timezone.utc) - timestamp < timedelta(seconds=ttl_seconds):
-                return value
-            del self._cache[key]
-        return None
-    
-    def set(self, key: str, value: Any):
-        self._cache[key] = (value, datetime.now(timezone.utc))
-    
-    def invalidate(self, pattern: str = None):
-        if pattern:
-            keys_to_delete = [k for k in self._cache if pattern in k]
-            for k in keys_to_delete:
-                del self._cache[k]
-        else:
-            self._cache.clear()
+# Public reads go through this breaker: each call gets a deadline, and after
+# repeated failures Mongo is left alone for a while instead of piling up requests
+mongo_breaker = CircuitBreaker(
+    "mongodb",
+    failure_threshold=int(os.environ.get("DB_BREAKER_FAILURE_THRESHOLD", 5)),
+    reset_timeout_seconds=float(os.environ.get("DB_BREAKER_RESET_SECONDS", 30)),
+    call_timeout_seconds=float(os.environ.get("DB_READ_TIMEOUT_SECONDS", 3)),
+    failure_exceptions=(PyMongoError,)
+)
+# Failures that put the public read paths in degraded mode
+DEGRADED_ERRORS = (PyMongoError, asyncio.TimeoutError, CircuitOpenError)
+
+# How long past its hard TTL a cached response is kept to be served if the database fails
+STALE_IF_ERROR_SECONDS = int(os.environ.get("CACHE_STALE_IF_ERROR_SECONDS", 86400))
+
+# Cache contents are written here on shutdown and restored on startup (empty to disable)
+CACHE_SNAPSHOT_PATH = os.environ.get("CACHE_SNAPSHOT_PATH", str(ROOT_DIR / ".cache" / "snapshot.jsonl.gz"))
+
+
+async def load_published_slugs():
+    return await db.blogs.find({"is_published": True}, {"_id": 0, "id": 1, "slug": 1}).to_list(None)
+
+
+# Lets unknown slugs 404 without a database query
+slug_index = SlugIndex(cache, load_published_slugs)
+
+# Blog views are buffered and flushed with one bulk write per interval
+view_counter = ViewCounter(
+    db.blogs, flush_interval_seconds=float(os.environ.get("VIEW_COUNT_FLUSH_SECONDS", 5))
+)
+# Tracked visits are queued and written with one insert_many per interval
+visit_queue = VisitIngestQueue(
+    db.visit_logs, db.site_stats,
+    flush_interval_seconds=float(os.environ.get("VISIT_FLUSH_SECONDS", 5)),
+    max_queued=int(os.environ.get("VISIT_QUEUE_MAX", 10000))
+)
+# Folds visit_logs into hourly/daily analytics (idempotent, safe on every worker)
+visit_rollup = VisitRollup(
+    db,
+    interval_seconds=float(os.environ.get("VISIT_ROLLUP_INTERVAL_SECONDS", 300)),
+    settle_seconds=float(os.environ.get("VISIT_ROLLUP_SETTLE_SECONDS", 300))
+)
+# Unique visitors per day (site and per post) as HyperLogLog sketches
+visitor_sketches = VisitorSketches(
+    db.visitor_sketches, flush_interval_seconds=float(os.environ.get("VISITOR_SKETCH_FLUSH_SECONDS", 60))
+)
+# Repeat views of a post by the same visitor within the window are not counted
+view_dedup = ViewDeduplicator(
+    window_seconds=float(os.environ.get("VIEW_DEDUP_WINDOW_SECONDS", 1800)),
+    capacity=int(os.environ.get("VIEW_DEDUP_CAPACITY", 100000))
+)
+
+# (soft, hard) TTLs in seconds per cached endpoint. Until the soft TTL an entry is
+# served as-is; until the hard TTL it is served stale while one task refreshes it.
+CACHE_TTLS = {
+    "blogs": (60, 600),
+    "blog": (300, 3600),
+    "blogs_filtered": (60, 600),
+    "taxonomy": (300, 3600),
+    # Site-wide documents change rarely and are evicted by the admin writes;
+    # the soft TTL only picks up edits made outside the API
+    "site": (3600, 86400),
+}
+
+
+def _cache_control_policy(name: str, max_age: int, stale_while_revalidate: int) -> str:
+    """Cache-Control for a public endpoint, overridable as CACHE_CONTROL_<NAME>="max_age,swr"."""
+    override = os.environ.get(f"CACHE_CONTROL_{name.upper()}")
+    if override:
+        max_age, stale_while_revalidate = (int(v) for v in override.split(","))
+    return cache_control(max_age, stale_while_revalidate)
+
+
+# Browser/CDN caching per endpoint: (max-age, stale-while-revalidate) in seconds.
+# Clients revalidate with If-None-Match / If-Modified-Since and get a 304 if unchanged.
+HTTP_CACHE_POLICIES = {
+    "blogs": _cache_control_policy("blogs", 60, 300),
+    "blog": _cache_control_policy("blog", 60, 600),
+    "blogs_filtered": _cache_control_policy("blogs_filtered", 60, 300),
+    "taxonomy": _cache_control_policy("taxonomy", 300, 3600),
+    "site": _cache_control_policy("site", 300, 3600),
+}
+
+
+def last_modified_meta(doc) -> dict:
+    """Response meta sending the document's modification time as Last-Modified."""
+    return {"last_modified": http_date(doc.get("updated_at"))} if isinstance(doc, dict) else {}
+
+
+async def load_cached_response(key: str, load, ttl: str, tags, meta=None):
+    """Get `key` from the cache as a CachedResponse, loading it with `load` on a miss.
+
+    The payload is serialized and compressed once per load, so hits skip JSON
+    encoding and the gzip middleware entirely. `meta` (a dict or a callable
+    taking the payload) is kept on the cached response, e.g. for tagging; a
+    ``last_modified`` HTTP-date in it is sent as Last-Modified.
+
+    If the database fails or misses its deadline, the last known good value is
+    returned with status "stale-error" for up to STALE_IF_ERROR_SECONDS past
+    its hard TTL.
+
+    Returns:
+        tuple: (CachedResponse, cache status)
+    """
+    async def load_response():
+        payload = await mongo_breaker.call(load)
+        return CachedResponse.from_payload(payload, meta(payload) if callable(meta) else meta)
+
+    soft_ttl, hard_ttl = CACHE_TTLS[ttl]
+    return await cache.get_or_load(
+        key, load_response, soft_ttl=soft_ttl, hard_ttl=hard_ttl, tags=tags,
+        stale_if_error=STALE_IF_ERROR_SECONDS, fallback_errors=DEGRADED_ERRORS
+    )
 
-cache = SimpleCache()
+
+async def cached_json_response(request: Request, key: str, load, ttl: str, tags, meta=None) -> Response:
+    """Serve `key` from the cache as pre-encoded JSON (see load_cached_response)."""
+    try:
+        cached, status = await load_cached_response(key, load, ttl, tags, meta)
+    except DEGRADED_ERRORS:
+        # Nothing cached to fall back on
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    return cached.to_response(request, status, cache_control=HTTP_CACHE_POLICIES[ttl])
 
 # Security middleware for headers
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
@@ -155,9 +318,6 @@ app = FastAPI(
 from starlette.middleware.gzip import GZipMiddleware as StarletteGZip
 app.add_middleware(StarletteGZip, minimum_size=500)
 
-# Add security headers middleware
-app.add_middleware(SecurityHeadersMiddleware)
-
 # Mount static files for uploads at /api/uploads to work with ingress
 app.mount("/api/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
@@ -166,6 +326,9 @@ api_router = APIRouter(prefix="/api")
 
 # Max file size for uploads (5GB)
 MAX_UPLOAD_SIZE = 5 * 1024 * 1024 * 1024
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_TOO_LARGE_DETAIL = f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024*1024)}GB"
 
 
 # Define Models
@@ -273,37 +436,29 @@ async def health_check():
 @api_router.get("/visits")
 async def get_visits():
     stats = await db.site_stats.find_one({"type": "visits"}, {"_id": 0})
+    # Include this worker's visits that are still queued
     if not stats:
-        return {"total": 0}
-    return {"total": stats.get("total", 0)}
+        return {"total": visit_queue.unwritten_total}
+    return {"total": stats.get("total", 0) + visit_queue.unwritten_total}
 
-@api_router.post("/visits/track")
+@api_router.post("/visits/track", status_code=204)
 async def track_visit(request: Request):
-    # Get visitor info
-    client_ip = request.client.host
-    user_agent = request.headers.get("user-agent", "unknown")
-    
-    # Sanitize user agent to prevent log injection
-    sanitized_user_agent = bleach.clean(user_agent[:500], tags=[], strip=True)
-    
-    # Update total visits
-    await db.site_stats.update_one(
-        {"type": "visits"},
-        {"$inc": {"total": 1}},
-        upsert=True
-    )
-    
-    # Log individual visit with hashed IP for privacy (GDPR compliance)
-    visit_log = {
+    user_agent = request.headers.get("user-agent")
+    if is_bot(user_agent):
+        record_bot_hit("visit")
+        return Response(status_code=204)
+    
+    client_ip = get_client_ip(request)
+    visitor_sketches.add(hash_visitor(client_ip), SITE_SCOPE)
+    # Queued and written in batches; the response does not wait for the database
+    visit_queue.add({
         "id": str(uuid.uuid4()),
         "ip_hash": hash_ip_address(client_ip),  # Privacy-preserving hash
-        "user_agent": sanitized_user_agent,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "user_agent": sanitize_user_agent(user_agent),
+        "timestamp": datetime.now(timezone.utc),  # BSON date: expired by the visit_logs TTL index
         "path": request.headers.get("referer", "/")
-    }
-    await db.visit_logs.insert_one(visit_log)
-    
-    return {"success": True}
+    })
+    return Response(status_code=204)
 
 # Status endpoints
 @api_router.post("/status", response_model=StatusCheck)
@@ -329,29 +484,25 @@ from routes.auth_routes import get_admin_user
 @api_router.post("/upload")
 async def upload_file(file: UploadFile = File(...), admin = Depends(get_admin_user)):
     """Upload a file and return the URL (admin only)"""
-    # Read file contents
-    file_size = 0
-    chunk_size = 1024 * 1024  # 1MB chunks
-    contents = b""
-    
-    while True:
-        chunk = await file.read(chunk_size)
-        if not chunk:
-            break
-        file_size += len(chunk)
-        contents += chunk
-        if file_size > MAX_UPLOAD_SIZE:
-            raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024*1024)}GB")
-    
-    # Upload using storage module
+    async def chunks():
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    # Streamed to disk by the storage module; the file is never held in memory
     storage = get_storage()
     try:
-        result = await storage.upload(
-            content=contents,
+        result = await storage.upload_stream(
+            chunks(),
             filename=file.filename or "unnamed",
-            content_type=file.content_type
+            content_type=file.content_type,
+            max_size=MAX_UPLOAD_SIZE
         )
         return result
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_DETAIL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
@@ -573,18 +724,13 @@ async def upload_from_url(request: RemoteUrlRequest, admin = Depends(get_admin_u
         raise HTTPException(status_code=400, detail="Could not resolve hostname")
     
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-            response = await client.get(url)
+        async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client, client.stream("GET", url) as response:
             response.raise_for_status()
             
             # Check content length
             content_length = response.headers.get('content-length')
             if content_length and int(content_length) > MAX_UPLOAD_SIZE:
-                raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024*1024)}GB")
-            
-            content = response.content
-            if len(content) > MAX_UPLOAD_SIZE:
-                raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024*1024*1024)}GB")
+                raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_DETAIL)
             
             # Determine filename from URL or content-disposition
             filename = None
@@ -617,17 +763,22 @@ async def upload_from_url(request: RemoteUrlRequest, admin = Depends(get_admin_u
                 }
                 file_ext = ext_map.get(content_type, 'bin')
             
-            # Use storage module to upload the downloaded file
+            # Stream the body to storage; the size limit also covers a missing or wrong content-length
             storage = get_storage()
             full_filename = f"{filename}.{file_ext}" if file_ext and '.' not in filename else filename
-            result = await storage.upload(
-                content=content,
+            result = await storage.upload_stream(
+                response.aiter_bytes(UPLOAD_CHUNK_SIZE),
                 filename=full_filename,
-                content_type=content_type
+                content_type=content_type,
+                max_size=MAX_UPLOAD_SIZE
             )
             
             return result
             
+    except HTTPException:
+        raise
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_DETAIL)
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=400, detail=f"Failed to download: HTTP {e.response.status_code}")
     except httpx.TimeoutException:
@@ -664,8 +815,7 @@ async def delete_file(filename: str, admin = Depends(get_admin_user)):
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
 
 # Profile endpoint
-@api_router.get("/profile")
-async def get_profile():
+async def load_profile():
     profile = await db.profile.find_one({}, {"_id": 0, "phone": 0, "timezone": 0})
     if not profile:
         # Return default profile data
@@ -690,21 +840,28 @@ async def get_profile():
     profile.pop("timezone", None)
     return profile
 
+@api_router.get("/profile")
+async def get_profile(request: Request):
+    return await cached_json_response(
+        request, "site:profile", load_profile, "site", tags=[SITE_PROFILE], meta=last_modified_meta
+    )
+
+
 # Update Profile endpoint (Admin)
 @api_router.put("/admin/profile")
 async def update_profile(profile_data: dict, admin = Depends(get_admin_user)):
     # Update or insert profile (only keep one profile document)
     await db.profile.update_one(
         {},  # Match any document (there should only be one profile)
-        {"$set": profile_data},
+        {"$set": {**profile_data, "updated_at": datetime.now(timezone.utc).isoformat()}},
         upsert=True
     )
+    cache.invalidate_tags(SITE_PROFILE)
     
     return {"message": "Profile updated successfully"}
 
 # About endpoint
-@api_router.get("/about")
-async def get_about():
+async def load_about():
     about = await db.about.find_one({}, {"_id": 0})
     if not about:
         return {
@@ -722,9 +879,14 @@ async def get_about():
         }
     return about
 
+@api_router.get("/about")
+async def get_about(request: Request):
+    return await cached_json_response(
+        request, "site:about", load_about, "site", tags=[SITE_ABOUT], meta=last_modified_meta
+    )
+
 # Testimonials endpoint
-@api_router.get("/testimonials", response_model=List[dict])
-async def get_testimonials():
+async def load_testimonials():
     testimonials = await db.testimonials.find({}, {"_id": 0}).to_list(100)
     if not testimonials:
         return [
@@ -734,49 +896,18 @@ async def get_testimonials():
         ]
     return testimonials
 
+@api_router.get("/testimonials", response_model=List[dict])
+async def get_testimonials(request: Request):
+    return await cached_json_response(
+        request, "site:testimonials", load_testimonials, "site", tags=[SITE_TESTIMONIALS]
+    )
+
 # Contact message endpoint with rate limiting
 @api_router.post("/contact", response_model=ContactMessage)
 async def submit_contact(contact: ContactMessageCreate, request: Request):
-    """Submit a contact message with persistent rate limiting"""
-    # Get real client IP (handle proxies)
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    # Rate limiting by IP (using persistent MongoDB storage)
-    is_allowed, remaining = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="contact",
-        max_attempts=CONTACT_MAX_ATTEMPTS,
-        window_seconds=CONTACT_WINDOW_SECONDS
-    )
-    
-    if not is_allowed:
-        raise HTTPException(
-            status_code=429,
-            detail="Too many messages. Please try again later."
-        )
-    
-    # Also rate limit by email to prevent spam to same address from different IPs
-    sanitized_email = bleach.clean(contact.email, tags=[], strip=True)[:254]
-    email_allowed, _ = await check_rate_limit(
-        identifier=f"email:{sanitized_email}",
-        limit_type="contact_email",
-        max_attempts=3,  # Max 3 messages per email per hour
-        window_seconds=CONTACT_WINDOW_SECONDS
-    )
-    
-    if not email_allowed:
-        raise HTTPException(
-            status_code=429,
-            detail="Too many messages to this email. Please try again later."
-        )
-    
-    # Record the attempt
-    await record_attempt(client_ip, "contact")
-    await record_attempt(f"email:{sanitized_email}", "contact_email")
-    
+    """Submit a contact message (rate limited per IP and per email by RateLimitMiddleware)"""
     # Sanitize inputs
+    sanitized_email = bleach.clean(contact.email, tags=[], strip=True)[:254]
     sanitized_name = bleach.clean(contact.name, tags=[], strip=True)[:100]
     sanitized_subject = bleach.clean(contact.subject, tags=[], strip=True)[:200]
     sanitized_message = bleach.clean(contact.message, tags=[], strip=True)[:5000]
@@ -801,70 +932,41 @@ async def get_contact_messages():
 
 
 # ============ Public Page Content ============
-@api_router.get("/content/{page}")
-async def get_public_page_content(page: str):
-    """Get public page content"""
+async def load_page_content(page: str):
     content = await db.page_content.find_one({"page": page}, {"_id": 0})
     if not content:
         return {"page": page, "content": {}}
     return content
 
 
+@api_router.get("/content/{page}")
+async def get_public_page_content(page: str, request: Request):
+    """Get public page content"""
+    return await cached_json_response(
+        request, f"site:content={page}", lambda: load_page_content(page), "site",
+        tags=[page_content_tag(page)], meta=last_modified_meta
+    )
+
+
 # ============ Public Blog Routes ============
 @api_router.get("/blogs")
 async def get_blogs(featured: bool = None, limit: int = 10, request: Request = None):
-    """Get published blog posts with caching and rate limiting"""
-    # Rate limit public API access
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host) if request else "unknown"
-    if client_ip and "," in client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    is_allowed, remaining = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="public_api",
-        max_attempts=PUBLIC_API_MAX_REQUESTS,
-        window_seconds=PUBLIC_API_WINDOW_SECONDS
-    )
-    if not is_allowed:
-        raise HTTPException(status_code=429, detail="Too many requests. Please slow down.")
-    
-    # Create cache key
-    cache_key = f"blogs:featured={featured}:limit={limit}"
-    
-    # Check cache (60 second TTL)
-    cached = cache.get(cache_key, ttl_seconds=60)
-    if cached:
-        return cached
-    
+    """Get published blog posts with caching (rate limited by RateLimitMiddleware)"""
     query = {"is_published": True}
     if featured is not None:
         query["is_featured"] = featured
     
-    blogs = await db.blogs.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+    async def load():
+        return await db.blogs.find(query, LIST_PROJECTION).sort("created_at", -1).to_list(limit)
     
-    # Cache result
-    cache.set(cache_key, blogs)
-    return blogs
+    return await cached_json_response(
+        request, f"blogs:featured={featured}:limit={limit}", load, "blogs", tags=[LIST_PUBLISHED]
+    )
 
 
 @api_router.get("/blogs/{slug}")
 async def get_blog_by_slug(slug: str, preview: bool = False, request: Request = None):
-    """Get a single blog post by slug with caching and rate limiting. Use preview=true for draft posts (admin only)."""
-    # Rate limit public API access (skip for preview/admin)
-    if not preview and request:
-        client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-        if client_ip and "," in client_ip:
-            client_ip = client_ip.split(",")[0].strip()
-        
-        is_allowed, remaining = await check_rate_limit(
-            identifier=client_ip,
-            limit_type="public_api",
-            max_attempts=PUBLIC_API_MAX_REQUESTS,
-            window_seconds=PUBLIC_API_WINDOW_SECONDS
-        )
-        if not is_allowed:
-            raise HTTPException(status_code=429, detail="Too many requests. Please slow down.")
-    
+    """Get a single blog post by slug with caching. Use preview=true for draft posts (admin only)."""
     if preview:
         # For preview mode, allow fetching unpublished posts if user is authenticated admin
         from auth import decode_token
@@ -886,33 +988,72 @@ async def get_blog_by_slug(slug: str, preview: bool = False, request: Request =
             raise HTTPException(status_code=404, detail="Blog not found")
         return blog
     
-    # Check cache for public blog (5 minute TTL)
-    cache_key = f"blog:{slug}"
-    cached = cache.get(cache_key, ttl_seconds=300)
-    if cached:
-        # Still increment view count asynchronously
-        await db.blogs.update_one({"slug": slug}, {"$inc": {"views": 1}})
-        return cached
-    
     # Normal public access - only published posts
-    blog = await db.blogs.find_one({"slug": slug, "is_published": True}, {"_id": 0})
-    if not blog:
+    cached, status = await load_published_blog(slug)
+    return cached.to_response(request, status, cache_control=HTTP_CACHE_POLICIES["blog"])
+
+
+async def load_published_blog(slug: str):
+    """Cached response for a published post (404 if there is none, 503 if it cannot be loaded).
+
+    Returns:
+        tuple: (CachedResponse, cache status)
+    """
+    if not slug_index.may_exist(slug):
         raise HTTPException(status_code=404, detail="Blog not found")
     
-    # Increment view count
-    await db.blogs.update_one({"slug": slug}, {"$inc": {"views": 1}})
+    async def load():
+        blog = await db.blogs.find_one({"slug": slug, "is_published": True}, {"_id": 0})
+        if not blog:
+            slug_index.mark_missing(slug)
+            raise HTTPException(status_code=404, detail="Blog not found")
+        return blog
+    
+    # Keyed by slug but tagged by id so renames evict it
+    try:
+        return await load_cached_response(
+            f"blog:{slug}", load, "blog",
+            tags=lambda r: [blog_tag(r.meta["id"])],
+            meta=lambda b: {"id": b["id"], "last_modified": http_date(b.get("updated_at") or b.get("created_at"))}
+        )
+    except DEGRADED_ERRORS:
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+
+@api_router.post("/blogs/{slug}/view", status_code=204)
+async def record_blog_view(slug: str, request: Request):
+    """Count a view of a post, sent by the reader's browser.
+
+    Views are not counted on GET /blogs/{slug}: the frontend renders posts
+    server-side, so those requests come from the frontend server's address
+    (twice per page) rather than the reader's.
+    """
+    cached, _ = await load_published_blog(slug)
+    blog_id = cached.meta.get("id")
+    if not blog_id:
+        return Response(status_code=204)
     
-    # Cache result
-    cache.set(cache_key, blog)
+    if is_bot(request.headers.get("user-agent")):
+        record_bot_hit("view")
+        return Response(status_code=204)
     
-    return blog
+    # Counted in memory and written in batches, so a view costs no database write
+    client_ip = get_client_ip(request)
+    visitor_sketches.add(hash_visitor(client_ip), blog_scope(blog_id))
+    if view_dedup.first_view(hash_ip_address(client_ip), blog_id):
+        view_counter.add(blog_id)
+    return Response(status_code=204)
 
 
 @api_router.get("/blogs/{slug}/adjacent")
 async def get_adjacent_blogs(slug: str):
     """Get previous and next blog posts"""
+    if not slug_index.may_exist(slug):
+        return {"previous": None, "next": None}
+    
     current = await db.blogs.find_one({"slug": slug, "is_published": True}, {"created_at": 1})
     if not current:
+        slug_index.mark_missing(slug)
         return {"previous": None, "next": None}
     
     # Get previous (older)
@@ -954,41 +1095,55 @@ async def get_related_blogs(slug: str, limit: int = 3):
 
 
 @api_router.get("/blogs/categories/list")
-async def get_blog_categories():
+async def get_blog_categories(request: Request):
     """Get all blog categories"""
-    blogs = await db.blogs.find({"is_published": True}, {"category": 1, "_id": 0}).to_list(1000)
-    categories = list(set(b.get("category", "General") for b in blogs if b.get("category")))
-    return categories
+    async def load():
+        blogs = await db.blogs.find({"is_published": True}, {"category": 1, "_id": 0}).to_list(1000)
+        return list(set(b.get("category", "General") for b in blogs if b.get("category")))
+    
+    return await cached_json_response(request, "blogs:categories", load, "taxonomy", tags=[LIST_PUBLISHED])
 
 
 @api_router.get("/blogs/tags/list")
-async def get_blog_tags():
+async def get_blog_tags(request: Request):
     """Get all blog tags"""
-    blogs = await db.blogs.find({"is_published": True}, {"tags": 1, "_id": 0}).to_list(1000)
-    tags = []
-    for b in blogs:
-        tags.extend(b.get("tags", []))
-    return list(set(tags))
+    async def load():
+        blogs = await db.blogs.find({"is_published": True}, {"tags": 1, "_id": 0}).to_list(1000)
+        tags = []
+        for b in blogs:
+            tags.extend(b.get("tags", []))
+        return list(set(tags))
+    
+    return await cached_json_response(request, "blogs:tags", load, "taxonomy", tags=[LIST_PUBLISHED])
 
 
 @api_router.get("/blogs/category/{category}")
-async def get_blogs_by_category(category: str, limit: int = 50):
+async def get_blogs_by_category(category: str, request: Request, limit: int = 50):
     """Get published blog posts filtered by category"""
-    blogs = await db.blogs.find(
-        {"is_published": True, "category": category},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(limit)
-    return blogs
+    async def load():
+        return await db.blogs.find(
+            {"is_published": True, "category": category},
+            LIST_PROJECTION
+        ).sort("created_at", -1).to_list(limit)
+    
+    return await cached_json_response(
+        request, f"blogs:category={category}:limit={limit}", load, "blogs_filtered",
+        tags=[category_tag(category)]
+    )
 
 
 @api_router.get("/blogs/tag/{tag}")
-async def get_blogs_by_tag(tag: str, limit: int = 50):
+async def get_blogs_by_tag(tag: str, request: Request, limit: int = 50):
     """Get published blog posts filtered by tag"""
-    blogs = await db.blogs.find(
-        {"is_published": True, "tags": tag},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(limit)
-    return blogs
+    async def load():
+        return await db.blogs.find(
+            {"is_published": True, "tags": tag},
+            LIST_PROJECTION
+        ).sort("created_at", -1).to_list(limit)
+    
+    return await cached_json_response(
+        request, f"blogs:tag={tag}:limit={limit}", load, "blogs_filtered", tags=[tag_tag(tag)]
+    )
 
 
 # ============ Public Comments Routes ============
@@ -1002,23 +1157,8 @@ class CommentCreate(PydanticBaseModel):
     parent_id: Optional[str] = None
 
 @api_router.get("/comments/{blog_id}")
-async def get_blog_comments(blog_id: str, request: Request = None):
-    """Get all approved comments for a blog post with rate limiting"""
-    # Rate limit public API access
-    if request:
-        client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-        if client_ip and "," in client_ip:
-            client_ip = client_ip.split(",")[0].strip()
-        
-        is_allowed, _ = await check_rate_limit(
-            identifier=client_ip,
-            limit_type="public_api",
-            max_attempts=PUBLIC_API_MAX_REQUESTS,
-            window_seconds=PUBLIC_API_WINDOW_SECONDS
-        )
-        if not is_allowed:
-            raise HTTPException(status_code=429, detail="Too many requests. Please slow down.")
-    
+async def get_blog_comments(blog_id: str):
+    """Get all approved comments for a blog post"""
     comments = await db.comments.find(
         {"blog_id": blog_id, "is_approved": True, "is_hidden": {"$ne": True}},
         {"_id": 0}
@@ -1037,22 +1177,8 @@ async def create_comment(comment: CommentCreate, request: Request):
     if not blog.get("comments_enabled", True):
         raise HTTPException(status_code=403, detail="Comments are disabled for this post")
     
-    # Get client IP
-    client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-    if client_ip:
-        client_ip = client_ip.split(",")[0].strip()
-    
-    # Rate limit comments per IP
-    is_allowed, _ = await check_rate_limit(
-        identifier=client_ip,
-        limit_type="comment",
-        max_attempts=10,  # Max 10 comments per 10 minutes per IP
-        window_seconds=600
-    )
-    if not is_allowed:
-        raise HTTPException(status_code=429, detail="Too many comments. Please wait before posting again.")
-    
-    await record_attempt(client_ip, "comment")
+    # Rate limited per IP by RateLimitMiddleware, which also resolved the client IP
+    client_ip = get_client_ip(request)
     
     # Sanitize user input to prevent XSS - WITH LENGTH LIMITS
     sanitized_content = bleach.clean(comment.content, tags=[], strip=True)[:5000]  # Max 5000 chars
@@ -1140,6 +1266,10 @@ from routes import auth_routes, admin_routes, security_routes
 auth_routes.set_db(db)
 admin_routes.set_db(db)
 admin_routes.set_cache(cache)
+admin_routes.set_slug_index(slug_index)
+admin_routes.set_stats_sources(
+    view_counter=view_counter, view_dedup=view_dedup, visit_queue=visit_queue, mongo_breaker=mongo_breaker
+)
 security_routes.set_db(db)
 
 # Initialize security utilities with database
@@ -1153,6 +1283,15 @@ app.include_router(auth_routes.router, prefix="/api")
 app.include_router(admin_routes.router, prefix="/api")
 app.include_router(security_routes.router, prefix="/api")
 
+# Rate limiting runs before routing and body parsing, inside CORS so 429s carry CORS headers
+app.add_middleware(
+    RateLimitMiddleware,
+    policies=PUBLIC_RATE_LIMIT_POLICIES + auth_routes.RATE_LIMIT_POLICIES + security_routes.RATE_LIMIT_POLICIES
+)
+
+# Add security headers middleware (outside rate limiting, so 429s carry the headers too)
+app.add_middleware(SecurityHeadersMiddleware)
+
 # CORS configuration - use specific origins in production
 # Set CORS_ORIGINS env var to comma-separated list of allowed origins
 # Example: CORS_ORIGINS=https://yourdomain.com,https://www.yourdomain.com
@@ -1181,6 +1320,125 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def warm_site_cache():
+    """Load the site-wide documents so the first page renders skip the database."""
+    try:
+        pages = await db.page_content.distinct("page")
+    except Exception as e:
+        logger.warning(f"Site cache warm-up could not list pages: {e}")
+        pages = []
+
+    results = await asyncio.gather(
+        load_cached_response("site:profile", load_profile, "site", [SITE_PROFILE], last_modified_meta),
+        load_cached_response("site:about", load_about, "site", [SITE_ABOUT], last_modified_meta),
+        load_cached_response("site:testimonials", load_testimonials, "site", [SITE_TESTIMONIALS]),
+        *(
+            load_cached_response(
+                f"site:content={page}", lambda page=page: load_page_content(page), "site",
+                [page_content_tag(page)], last_modified_meta
+            )
+            for page in pages
+        ),
+        return_exceptions=True
+    )
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        logger.warning(f"Site cache warm-up: {len(failed)} load(s) failed, loading on demand: {failed[0]}")
+
+async def cache_versions() -> dict:
+    """Fingerprint of the documents behind each cache tag, for snapshot validation.
+
+    Detail and site tags map to the document's updated_at; listing tags map to
+    a digest of the ids and updated_at of every published blog they contain.
+    """
+    blogs = await db.blogs.find(
+        {"is_published": True}, {"_id": 0, "id": 1, "updated_at": 1, "category": 1, "tags": 1}
+    ).to_list(None)
+    versions = {}
+    members = {}
+    for blog in blogs:
+        stamp = f"{blog['id']}@{blog.get('updated_at')}"
+        versions[blog_tag(blog["id"])] = str(blog.get("updated_at"))
+        for tag in blog_list_tags(blog):
+            members.setdefault(tag, []).append(stamp)
+    for tag, stamps in members.items():
+        versions[tag] = hashlib.blake2b("\n".join(sorted(stamps)).encode(), digest_size=16).hexdigest()
+
+    # Site documents without an updated_at (never edited through the API) are not restored
+    profile = await db.profile.find_one({}, {"_id": 0, "updated_at": 1})
+    if profile and profile.get("updated_at"):
+        versions[SITE_PROFILE] = str(profile["updated_at"])
+    about = await db.about.find_one({}, {"_id": 0, "updated_at": 1})
+    if about and about.get("updated_at"):
+        versions[SITE_ABOUT] = str(about["updated_at"])
+    async for content in db.page_content.find({}, {"_id": 0, "page": 1, "updated_at": 1}):
+        if content.get("updated_at"):
+            versions[page_content_tag(content["page"])] = str(content["updated_at"])
+    return versions
+
+async def restore_cache_snapshot():
+    if not CACHE_SNAPSHOT_PATH or not Path(CACHE_SNAPSHOT_PATH).exists():
+        return
+    try:
+        restored = await load_snapshot(cache, CACHE_SNAPSHOT_PATH, await cache_versions(), STALE_IF_ERROR_SECONDS)
+        logger.info(f"Restored {restored} cache entries from snapshot")
+    except Exception as e:
+        logger.warning(f"Cache snapshot restore failed: {e}")
+
+async def save_cache_snapshot():
+    if not CACHE_SNAPSHOT_PATH:
+        return
+    try:
+        saved = await save_snapshot(cache, CACHE_SNAPSHOT_PATH, await cache_versions())
+        logger.info(f"Saved {saved} cache entries to snapshot")
+    except Exception as e:
+        logger.warning(f"Cache snapshot save failed: {e}")
+
+async def warn_pending_migrations():
+    try:
+        pending = await get_migration_runner(db).pending()
+    except PyMongoError as e:
+        logging.warning(f"Could not check migrations: {e}")
+        return
+    if pending:
+        logging.warning(
+            f"{len(pending)} data migration(s) pending ({', '.join(m.id for m in pending)}); "
+            "run `python -m migrations`"
+        )
+
+async def prepare_database_and_caches():
+    await ensure_indexes(db)
+    await warn_pending_migrations()
+    await restore_cache_snapshot()
+    await warm_site_cache()
+
+# Keep a reference so the warm-up task is not garbage collected mid-run
+_warmup_task = None
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global _warmup_task
+    cache.start_sweeper()
+    slug_index.start()
+    view_counter.start()
+    visit_queue.start()
+    visit_rollup.start()
+    visitor_sketches.start()
+    start_rate_limit_sync()
+    # Run in the background so an unreachable database does not hold up startup
+    _warmup_task = asyncio.create_task(prepare_database_and_caches())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if _warmup_task and not _warmup_task.done():
+        _warmup_task.cancel()
+    await slug_index.stop()
+    await view_counter.stop()
+    await visit_queue.stop()
+    await visit_rollup.stop()
+    await visitor_sketches.stop()
+    await stop_rate_limit_sync()
+    await cache.stop_sweeper()
+    await save_cache_snapshot()
+    await flush_audit_logs()
     client.close()
\ No newline at end of file
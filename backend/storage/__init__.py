@@ -2,6 +2,6 @@
 
 This module provides local filesystem storage for container-based deployments.
 """
-from .local_storage import LocalStorage, get_storage
+from .local_storage import LocalStorage, UploadTooLarge, get_storage
 
-__all__ = ['LocalStorage', 'get_storage']
\ No newline at end of file
+__all__ = ['LocalStorage', 'UploadTooLarge', 'get_storage']
\ No newline at end of file
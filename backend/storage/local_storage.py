@@ -2,22 +2,61 @@
 
 This module provides file storage functionality using the local filesystem.
 Suitable for container-based deployments like Railway with persistent volumes.
+
+All disk work runs in a dedicated thread pool so large files never block the
+event loop. A finished upload is hard-linked to its final name, which fails if
+the name exists, so concurrent uploads of the same name (from any worker)
+cannot overwrite each other and no reader sees a partial or empty file, and
+the next free ``name_N`` suffix per base name is kept in memory so picking a
+name does not probe every earlier upload.
 """
+import asyncio
+import hashlib
 import os
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 from datetime import datetime, timezone
 import re
 
 
+IMAGE_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp", "image/svg+xml"]
+
+# Threads doing file I/O for uploads, deletes and listings
+IO_WORKERS = int(os.environ.get("STORAGE_IO_WORKERS", 4))
+
+# "name_3.ext" -> ("name", "3", "ext")
+_SUFFIXED_NAME = re.compile(r'^(.+)_(\d+)(?:\.([^.]*))?$')
+
+
+class UploadTooLarge(Exception):
+    """Raised when a streamed upload exceeds its size limit."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
 class LocalStorage:
     """Storage class for local filesystem uploads."""
     
     def __init__(self):
         self.local_dir = Path('/uploads')
+        # Partial uploads live on the same volume so they can be renamed into place
+        self.temp_dir = self.local_dir / "temp"
         # Ensure directory exists
         self.local_dir.mkdir(exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="storage-io")
+        # (base_name, file_ext) -> next counter to try; None until seeded from the directory
+        self._next_counter: Optional[Dict[Tuple[str, str], int]] = None
+        self._names_lock = threading.Lock()
+    
+    async def _run(self, func, *args, **kwargs):
+        """Run blocking `func` in the storage thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args, **kwargs))
     
     async def upload(self, content: bytes, filename: str, content_type: str = None) -> Dict[str, Any]:
         """Upload a file and return the URL and metadata.
@@ -28,40 +67,114 @@ class LocalStorage:
             content_type: MIME type of the file
             
         Returns:
-            Dict with 'url', 'filename', 'is_image', 'size'
+            Dict with 'url', 'filename', 'is_image', 'size', 'sha256'
         """
-        # Sanitize filename
-        file_ext = filename.split(".")[-1].lower() if "." in filename else ""
-        base_name = ".".join(filename.split(".")[:-1]) if "." in filename else filename
-        base_name = re.sub(r'[^a-zA-Z0-9_-]', '_', base_name)
-        if not base_name:
-            base_name = "file"
+        async def single_chunk():
+            yield content
         
-        # Determine if it's an image
-        image_types = ["image/jpeg", "image/png", "image/gif", "image/webp", "image/svg+xml"]
-        is_image = content_type in image_types if content_type else False
+        return await self.upload_stream(single_chunk(), filename, content_type)
+    
+    async def upload_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        filename: str,
+        content_type: str = None,
+        max_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Upload a file from an async byte stream without holding it in memory.
         
-        # Generate filename with collision handling
-        final_filename = f"{base_name}.{file_ext}" if file_ext else base_name
-        file_path = self.local_dir / final_filename
+        Chunks are written to a temporary file in the upload volume and hashed
+        as they arrive; the file is renamed into place once complete, so a
+        failed or oversized upload never appears under its final name.
         
-        counter = 1
-        while file_path.exists():
-            final_filename = f"{base_name}_{counter}.{file_ext}" if file_ext else f"{base_name}_{counter}"
-            file_path = self.local_dir / final_filename
-            counter += 1
+        Args:
+            chunks: Async iterator of file content
+            filename: Original filename
+            content_type: MIME type of the file
+            max_size: Maximum size in bytes (UploadTooLarge is raised past it)
+            
+        Returns:
+            Dict with 'url', 'filename', 'is_image', 'size', 'sha256'
+        """
+        await self._run(self.temp_dir.mkdir, exist_ok=True)
+        temp_path = self.temp_dir / f"{uuid.uuid4()}.part"
+        digest = hashlib.sha256()
+        size = 0
         
-        # Write file
-        with open(file_path, "wb") as f:
-            f.write(content)
+        f = await self._run(open, temp_path, "wb")
+        try:
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise UploadTooLarge(max_size)
+                    digest.update(chunk)
+                    await self._run(f.write, chunk)
+                await self._run(f.close)
+            finally:
+                # No-op if already closed; run inline so it also happens on cancellation
+                f.close()
+            
+            final_filename = await self._run(self._place, temp_path, filename)
+        except BaseException:
+            # Also on cancellation (client disconnect)
+            temp_path.unlink(missing_ok=True)
+            raise
         
         return {
             "url": f"/api/uploads/{final_filename}",
             "filename": final_filename,
-            "is_image": is_image,
-            "size": len(content)
+            "is_image": content_type in IMAGE_TYPES if content_type else False,
+            "size": size,
+            "sha256": digest.hexdigest()
         }
     
+    def _place(self, temp_path: Path, filename: str) -> str:
+        """Move a finished temp file to a free name derived from `filename` (storage thread)."""
+        file_ext = filename.split(".")[-1].lower() if "." in filename else ""
+        base_name = ".".join(filename.split(".")[:-1]) if "." in filename else filename
+        base_name = re.sub(r'[^a-zA-Z0-9_-]', '_', base_name)
+        if not base_name:
+            base_name = "file"
+        
+        while True:
+            counter = self._claim_counter(base_name, file_ext)
+            final_filename = base_name if counter == 0 else f"{base_name}_{counter}"
+            if file_ext:
+                final_filename = f"{final_filename}.{file_ext}"
+            file_path = self.local_dir / final_filename
+            try:
+                # Atomic: fails if the name exists, even if another process just created it
+                os.link(temp_path, file_path)
+            except FileExistsError:
+                continue
+            temp_path.unlink()
+            return final_filename
+    
+    def _claim_counter(self, base_name: str, file_ext: str) -> int:
+        with self._names_lock:
+            if self._next_counter is None:
+                self._next_counter = self._scan_counters()
+            key = (base_name, file_ext)
+            counter = self._next_counter.get(key, 0)
+            self._next_counter[key] = counter + 1
+            return counter
+    
+    def _scan_counters(self) -> Dict[Tuple[str, str], int]:
+        """Seed the counter index from the files already uploaded (once per process)."""
+        counters: Dict[Tuple[str, str], int] = {}
+        for entry in os.scandir(self.local_dir):
+            if not entry.is_file():
+                continue
+            name = entry.name
+            stem, _, ext = name.rpartition(".") if "." in name else (name, "", "")
+            counters[stem, ext] = max(counters.get((stem, ext), 0), 1)
+            match = _SUFFIXED_NAME.match(name)
+            if match:
+                key = (match.group(1), match.group(3) or "")
+                counters[key] = max(counters.get(key, 0), int(match.group(2)) + 1)
+        return counters
+    
     async def delete(self, filename_or_url: str) -> bool:
         """Delete a file from storage.
         
@@ -80,6 +193,10 @@ class LocalStorage:
         safe_filename = filename.replace("/", "").replace("\\", "").replace("..", "")
         file_path = self.local_dir / safe_filename
         
+        return await self._run(self._delete_file, file_path)
+    
+    @staticmethod
+    def _delete_file(file_path: Path) -> bool:
         if file_path.exists() and file_path.is_file():
             file_path.unlink()
             return True
@@ -94,6 +211,9 @@ class LocalStorage:
         Returns:
             List of file metadata dicts
         """
+        return await self._run(self._list_files, images_only)
+    
+    def _list_files(self, images_only: bool) -> List[Dict[str, Any]]:
         image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp','.svg'}
         files = []
         
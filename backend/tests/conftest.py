@@ -0,0 +1,16 @@
+"""
+Test setup
+Tests import the app without a database: the Motor client only connects on the
+first query, and the app's startup hooks are not run (TestClient is not used
+as a context manager). Tests that need data stub the collections they touch.
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "test")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-" + "x" * 52)
+os.environ.setdefault("CORS_ORIGINS", "http://localhost:3000")
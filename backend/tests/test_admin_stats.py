@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+
+import server
+from routes.auth_routes import get_admin_user
+
+
+def test_cache_stats_include_write_buffers_and_breaker(monkeypatch):
+    monkeypatch.setitem(server.app.dependency_overrides, get_admin_user, lambda: None)
+    response = TestClient(server.app).get("/api/admin/cache/stats", headers={"X-Forwarded-For": "198.51.100.20"})
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["backend"] == "memory"
+    assert stats["view_counter"]["pending_views"] == 0
+    assert "repeat_views" in stats["view_dedup"]
+    assert "queued_visits" in stats["visit_queue"]
+    assert stats["mongo_breaker"]["state"] == "closed"
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from cache import MemoryCache
+from cache.snapshot import load_snapshot, save_snapshot
+
+VERSIONS = {"blog:b1": "2024-01-01"}
+
+
+async def _load_fails():
+    raise ConnectionError("database unavailable")
+
+
+def _restore(tmp_path, stale_if_error_seconds):
+    """Save one entry with 60s to live and restore it into a fresh cache."""
+    async def scenario():
+        source = MemoryCache()
+        source.set("blog:post", {"title": "Post"}, ttl_seconds=60, tags=["blog:b1"])
+        path = tmp_path / "snapshot.jsonl.gz"
+        assert await save_snapshot(source, path, VERSIONS) == 1
+
+        restored = MemoryCache()
+        assert await load_snapshot(restored, path, VERSIONS, stale_if_error_seconds) == 1
+        return restored
+
+    return asyncio.run(scenario())
+
+
+def test_restored_entries_keep_stale_if_error_grace(tmp_path, monkeypatch):
+    cache = _restore(tmp_path, stale_if_error_seconds=600)
+    now = cache._clock()
+    monkeypatch.setattr(cache, "_clock", lambda: now + 120)
+
+    value, status = asyncio.run(cache.get_or_load("blog:post", _load_fails, 30, 60, stale_if_error=600))
+    assert (value, status) == ({"title": "Post"}, "stale-error")
+
+
+def test_restored_entries_expire_without_grace(tmp_path, monkeypatch):
+    cache = _restore(tmp_path, stale_if_error_seconds=0)
+    now = cache._clock()
+    monkeypatch.setattr(cache, "_clock", lambda: now + 120)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cache.get_or_load("blog:post", _load_fails, 30, 60, stale_if_error=600))
+
+
+def test_changed_versions_are_not_restored(tmp_path):
+    async def scenario():
+        source = MemoryCache()
+        source.set("blog:post", {"title": "Post"}, ttl_seconds=60, tags=["blog:b1"])
+        path = tmp_path / "snapshot.jsonl.gz"
+        await save_snapshot(source, path, VERSIONS)
+        return await load_snapshot(MemoryCache(), path, {"blog:b1": "2024-02-01"})
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,34 @@
+from cache.tags import LIST_PROJECTION, LIST_PUBLISHED, blog_invalidation_tags, changed_list_fields
+
+BLOG = {
+    "_id": "object-id", "id": "b1", "slug": "post", "title": "Post", "excerpt": "Intro",
+    "content": "First draft", "editor_blocks": [], "category": "notes", "tags": ["python"],
+    "is_published": True, "reading_time": 1, "created_at": "2024-01-01T00:00:00+00:00",
+    "updated_at": "2024-01-01T00:00:00+00:00",
+}
+
+
+def _list_entry(blog: dict) -> dict:
+    """A blog as a cached listing returns it."""
+    return {field: value for field, value in blog.items() if LIST_PROJECTION.get(field, 1)}
+
+
+def test_content_only_update_keeps_list_entry_unchanged():
+    update = {"content": "Second draft", "updated_at": "2024-02-01T00:00:00+00:00"}
+    after = {**BLOG, **update}
+
+    changed = changed_list_fields(BLOG, update)
+    assert changed == set()
+    assert LIST_PUBLISHED not in blog_invalidation_tags("b1", BLOG, after, lists_changed=bool(changed))
+    # Listings are kept, so what they hold must not have changed
+    assert _list_entry(after) == _list_entry(BLOG)
+
+
+def test_list_visible_update_evicts_listings():
+    update = {"title": "Renamed", "updated_at": "2024-02-01T00:00:00+00:00"}
+    after = {**BLOG, **update}
+
+    changed = changed_list_fields(BLOG, update)
+    assert changed == {"title"}
+    assert LIST_PUBLISHED in blog_invalidation_tags("b1", BLOG, after, lists_changed=bool(changed))
+    assert _list_entry(after) != _list_entry(BLOG)
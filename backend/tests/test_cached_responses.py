@@ -0,0 +1,20 @@
+from starlette.requests import Request
+
+from cache.responses import CachedResponse
+
+
+def _request(headers=()):
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": list(headers)})
+
+
+def test_stale_error_is_reported_without_obsolete_warning_header():
+    response = CachedResponse.from_payload({"title": "Post"}).to_response(_request(), "stale-error")
+    assert response.headers["X-Cache"] == "STALE-ERROR"
+    assert "warning" not in response.headers
+
+
+def test_matching_etag_gets_not_modified():
+    cached = CachedResponse.from_payload({"title": "Post"})
+    response = cached.to_response(_request([(b"if-none-match", cached.etag.encode())]), "hit")
+    assert response.status_code == 304
+    assert response.headers["X-Cache"] == "HIT"
@@ -0,0 +1,85 @@
+"""Early flushes of the in-memory write buffers wait an interval after a failure."""
+import asyncio
+
+import pytest
+
+from utils import periodic
+from utils.view_counter import ViewCounter
+from utils.visit_queue import VisitIngestQueue
+from utils.visitor_sketches import VisitorSketches
+
+INTERVAL = 60
+
+
+class FailingCollection:
+    def __init__(self):
+        self.calls = 0
+
+    async def _fail(self, *args, **kwargs):
+        self.calls += 1
+        raise ConnectionError("database unavailable")
+
+    bulk_write = insert_many = update_one = find_one = _fail
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(periodic, "time", clock)
+    return clock
+
+
+# Each buffer reaches its early-flush threshold after two adds
+BUFFERS = {
+    "view_counter": (
+        lambda c: ViewCounter(c, flush_interval_seconds=INTERVAL, max_pending_ids=2),
+        lambda buffer, i: buffer.add(f"post-{i}"),
+    ),
+    "visit_queue": (
+        lambda c: VisitIngestQueue(c, c, flush_interval_seconds=INTERVAL, max_queued=4),
+        lambda buffer, i: buffer.add({"path": f"/{i}"}),
+    ),
+    "visitor_sketches": (
+        lambda c: VisitorSketches(c, flush_interval_seconds=INTERVAL, max_sketches=2),
+        lambda buffer, i: buffer.add(i, "site", f"blog:{i}"),
+    ),
+}
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.parametrize("name", BUFFERS)
+def test_early_flush_is_held_off_for_an_interval_after_failure(name, clock):
+    make, add = BUFFERS[name]
+
+    async def scenario():
+        collection = FailingCollection()
+        buffer = make(collection)
+        add(buffer, 0)
+        add(buffer, 1)
+        await _settle()
+        failed_calls = collection.calls
+        assert failed_calls > 0
+
+        clock.now += INTERVAL - 1
+        add(buffer, 2)
+        await _settle()
+        assert collection.calls == failed_calls
+
+        clock.now += 1
+        add(buffer, 3)
+        await _settle()
+        assert collection.calls > failed_calls
+
+    asyncio.run(scenario())
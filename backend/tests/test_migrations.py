@@ -0,0 +1,137 @@
+import asyncio
+from datetime import timedelta
+
+import mongomock
+import pytest
+
+from migrations.runner import (
+    MIGRATIONS_COLLECTION, Backfill, Migration, MigrationLocked, MigrationRunner, _now
+)
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor.sort(*args, **kwargs)
+        return self
+
+    async def to_list(self, length):
+        return list(self._cursor.limit(length) if length else self._cursor)
+
+    async def __aiter__(self):
+        for doc in self._cursor:
+            yield doc
+
+
+class AsyncCollection:
+    """Motor-style awaitable facade over a mongomock collection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self):
+        self.sync = mongomock.MongoClient().db
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.sync[name])
+
+
+@pytest.fixture
+def db():
+    db = AsyncDatabase()
+    db.sync.items.insert_many([{"_id": i, "n": i} for i in range(5)])
+    return db
+
+
+class Doubling:
+    """Migration doubling `n` in every item, optionally crashing at one document."""
+
+    def __init__(self, migration_id="m0001", crash_at=None):
+        self.seen = []
+        self.crash_at = crash_at
+        self.migration = Migration(migration_id, "double n", self.run)
+
+    def transform(self, doc):
+        if doc["_id"] == self.crash_at:
+            raise RuntimeError("worker killed")
+        self.seen.append(doc["_id"])
+        return {"$set": {"n": doc["n"] * 2, "doubled": True}}
+
+    async def run(self, ctx):
+        await ctx.backfill(Backfill("double", "items", {"doubled": {"$ne": True}}, self.transform))
+
+
+def _runner(db, *migrations):
+    return MigrationRunner(db, [m.migration for m in migrations], batch_size=2, pause_seconds=0)
+
+
+def test_backfill_resumes_from_checkpoint_after_crash(db):
+    crashing = Doubling(crash_at=3)
+    with pytest.raises(RuntimeError):
+        asyncio.run(_runner(db, crashing).run())
+
+    record = db.sync[MIGRATIONS_COLLECTION].find_one({"_id": "m0001"})
+    assert record["status"] == "failed"
+    assert record["checkpoints"] == {"double": 1}
+    # The first batch is written, the one that crashed is not
+    assert [doc["n"] for doc in db.sync.items.find().sort("_id")] == [0, 2, 2, 3, 4]
+
+    resumed = Doubling()
+    reports = asyncio.run(_runner(db, resumed).run())
+    assert resumed.seen == [2, 3, 4]
+    assert reports == {"m0001": {"double": 3}}
+    assert [doc["n"] for doc in db.sync.items.find().sort("_id")] == [0, 2, 4, 6, 8]
+    record = db.sync[MIGRATIONS_COLLECTION].find_one({"_id": "m0001"})
+    assert record["status"] == "done"
+    assert "checkpoints" not in record and "locked_until" not in record
+
+
+def test_second_runner_is_blocked_by_the_lease(db):
+    db.sync[MIGRATIONS_COLLECTION].insert_one(
+        {"_id": "m0001", "status": "running", "locked_until": _now() + timedelta(seconds=60)}
+    )
+    migration = Doubling()
+    with pytest.raises(MigrationLocked):
+        asyncio.run(_runner(db, migration).run())
+    assert migration.seen == []
+    assert db.sync.items.count_documents({"doubled": True}) == 0
+
+
+def test_expired_lease_is_taken_over(db):
+    db.sync[MIGRATIONS_COLLECTION].insert_one(
+        {"_id": "m0001", "status": "running", "locked_until": _now() - timedelta(seconds=1),
+         "checkpoints": {"double": 3}}
+    )
+    migration = Doubling()
+    asyncio.run(_runner(db, migration).run())
+    assert migration.seen == [4]
+    assert db.sync[MIGRATIONS_COLLECTION].find_one({"_id": "m0001"})["status"] == "done"
+
+
+def test_dry_run_counts_without_writing(db):
+    reports = asyncio.run(_runner(db, Doubling()).run(dry_run=True))
+    assert reports == {"m0001": {"double": 5}}
+    assert [doc["n"] for doc in db.sync.items.find().sort("_id")] == [0, 1, 2, 3, 4]
+    assert db.sync[MIGRATIONS_COLLECTION].count_documents({}) == 0
+
+
+def test_target_stops_after_the_given_migration(db):
+    first, second = Doubling("m0001"), Doubling("m0002")
+    runner = _runner(db, second, first)
+    assert list(asyncio.run(runner.run(target="m0001"))) == ["m0001"]
+    assert [m.id for m in asyncio.run(runner.pending())] == ["m0002"]
+    assert second.seen == []
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from utils.indexes import INDEXES, TTL_INDEXES
+from utils.query_plans import all_queries, check_query_plans, source_queries
+
+
+def _leading_fields(collection: str) -> set:
+    fields = {spec.keys[0][0] for spec in INDEXES if spec.collection == collection}
+    return fields | {spec.field for spec in TTL_INDEXES if spec.collection == collection} | {"_id"}
+
+
+def _has_index_prefix(query) -> bool:
+    """True if some index starts with a field the query filters or sorts on."""
+    leading = _leading_fields(query.collection)
+    if not query.filter:
+        return bool(query.sort) and query.sort[0][0] in leading
+    if {field for field in query.filter if not field.startswith("$")} & leading:
+        return True
+    branches = query.filter.get("$or")
+    return bool(branches) and all(set(branch) & leading for branch in branches)
+
+
+def test_every_query_call_site_is_parsed():
+    _, unresolved = source_queries()
+    assert unresolved == []
+
+
+def test_shapes_follow_the_call_sites():
+    shapes, _ = source_queries()
+    [count] = [q for q in shapes if q.name.startswith("utils/rate_limiter.py") and q.name.endswith("count_documents")]
+    assert set(count.filter) == {"identifier", "type", "timestamp"}
+
+
+def test_every_query_shape_has_an_index_prefix():
+    queries, _ = all_queries()
+    assert [query.name for query in queries if not _has_index_prefix(query)] == []
+
+
+@pytest.mark.skipif(
+    not os.environ.get("QUERY_PLANS_MONGODB_URI"),
+    reason="set QUERY_PLANS_MONGODB_URI to explain the queries against a scratch MongoDB"
+)
+def test_no_query_uses_a_collection_scan():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ["QUERY_PLANS_MONGODB_URI"])
+        name = f"query_plans_{uuid.uuid4().hex[:8]}"
+        try:
+            return await check_query_plans(client[name])
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    failures = asyncio.run(run())
+    assert [f"{query.collection}: {query.name} ({' > '.join(stages)})" for query, stages in failures] == []
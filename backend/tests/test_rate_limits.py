@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+import server
+
+CURL = {"User-Agent": "curl/8.4.0"}
+BROWSER = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0"}
+
+
+def _client():
+    return TestClient(server.app)
+
+
+def test_bot_limit_rejects_request_past_the_limit():
+    client = _client()
+    headers = {**CURL, "X-Forwarded-For": "198.51.100.10"}
+    for _ in range(server.BOT_API_MAX_REQUESTS):
+        assert client.post("/api/visits/track", headers=headers).status_code == 204
+
+    response = client.post("/api/visits/track", headers=headers)
+    assert response.status_code == 429
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "Content-Security-Policy" in response.headers
+
+
+def test_bot_limit_does_not_apply_to_browsers(monkeypatch):
+    queued = []
+    monkeypatch.setattr(server.visit_queue, "add", queued.append)
+    client = _client()
+    headers = {**BROWSER, "X-Forwarded-For": "198.51.100.11"}
+    for _ in range(server.BOT_API_MAX_REQUESTS + 1):
+        assert client.post("/api/visits/track", headers=headers).status_code == 204
+    assert len(queued) == server.BOT_API_MAX_REQUESTS + 1
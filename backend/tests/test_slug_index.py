@@ -0,0 +1,37 @@
+import asyncio
+
+from cache import MemoryCache, SharedCache
+from cache.slug_index import SlugIndex
+
+
+def _index(cache, slugs):
+    async def load_slugs():
+        return [{"id": f"id-{slug}", "slug": slug} for slug in slugs]
+
+    index = SlugIndex(cache, load_slugs)
+    asyncio.run(index.rebuild())
+    return index
+
+
+def test_per_process_index_miss_is_checked_in_the_database():
+    # "new-post" was published through another worker after this index was built
+    index = _index(MemoryCache(), ["old-post"])
+    assert index.may_exist("old-post")
+    assert index.may_exist("new-post")
+
+    # Once the database confirms the miss, it is remembered
+    index.mark_missing("missing-post")
+    assert not index.may_exist("missing-post")
+
+
+def test_shared_index_miss_is_trusted(tmp_path):
+    index = _index(SharedCache(str(tmp_path)), ["old-post"])
+    assert index.may_exist("old-post")
+    assert not index.may_exist("new-post")
+
+
+def test_publishing_drops_the_negative_entry():
+    index = _index(MemoryCache(), [])
+    index.mark_missing("post")
+    index.apply("id-post", None, {"slug": "post", "is_published": True})
+    assert index.may_exist("post")
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Response
+from fastapi.testclient import TestClient
+
+import server
+from utils.view_dedup import ViewDeduplicator
+
+BROWSER = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0"}
+
+
+@pytest.fixture
+def views(monkeypatch):
+    """Serves one published post (id "b1") and collects the views counted for it."""
+    async def load_published_blog(slug):
+        cached = SimpleNamespace(
+            meta={"id": "b1"},
+            to_response=lambda request, status, cache_control=None: Response(b"{}", media_type="application/json")
+        )
+        return cached, "HIT"
+
+    counted = []
+    monkeypatch.setattr(server, "load_published_blog", load_published_blog)
+    monkeypatch.setattr(server, "view_dedup", ViewDeduplicator())
+    monkeypatch.setattr(server.view_counter, "add", counted.append)
+    monkeypatch.setattr(server.visitor_sketches, "add", lambda *args: None)
+    return counted
+
+
+def _view(client, ip, user_agent=BROWSER):
+    return client.post("/api/blogs/some-post/view", headers={**user_agent, "X-Forwarded-For": ip})
+
+
+def test_beacon_counts_each_reader_once(views):
+    client = TestClient(server.app)
+    assert _view(client, "203.0.113.1").status_code == 204
+    assert _view(client, "203.0.113.2").status_code == 204
+    assert _view(client, "203.0.113.1").status_code == 204
+    assert views == ["b1", "b1"]
+
+
+def test_beacon_ignores_bots(views):
+    client = TestClient(server.app)
+    assert _view(client, "203.0.113.3", {"User-Agent": "Googlebot/2.1"}).status_code == 204
+    assert views == []
+
+
+def test_detail_fetch_does_not_count_views(views):
+    # Server-side rendering fetches the post from one address, twice per page
+    client = TestClient(server.app)
+    for _ in range(2):
+        assert client.get("/api/blogs/some-post", headers={**BROWSER, "X-Forwarded-For": "203.0.113.4"}).status_code == 200
+    assert views == []
@@ -0,0 +1,39 @@
+import hashlib
+
+from utils.visitor_sketches import HyperLogLog
+
+SEEDS = 8
+# Spans the range where the classic estimator switched to linear counting (2.5 * 8192)
+CARDINALITIES = range(4000, 60001, 4000)
+
+
+def _hash(seed: int, i: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{seed}:{i}".encode(), digest_size=8).digest(), "big")
+
+
+def test_estimate_is_unbiased_across_small_and_large_counts():
+    errors = {n: [] for n in CARDINALITIES}
+    for seed in range(SEEDS):
+        sketch = HyperLogLog(13)
+        for i in range(1, CARDINALITIES[-1] + 1):
+            sketch.add(_hash(seed, i))
+            if i in errors:
+                errors[i].append(sketch.estimate() / i - 1)
+
+    for n, relative in errors.items():
+        # Standard error is about 1.15% per sketch, so about 0.4% over 8 sketches
+        assert abs(sum(relative) / SEEDS) < 0.012, n
+    all_errors = [abs(e) for relative in errors.values() for e in relative]
+    assert sum(all_errors) / len(all_errors) < 0.015
+
+
+def test_empty_and_merged_sketches():
+    empty = HyperLogLog(13)
+    assert empty.estimate() == 0
+
+    left, right = HyperLogLog(13), HyperLogLog(13)
+    for i in range(1000):
+        left.add(_hash(0, i))
+        right.add(_hash(0, i + 500))
+    assert left.merge(right)
+    assert abs(left.estimate() / 1500 - 1) < 0.05
@@ -5,12 +5,15 @@ from .rate_limiter import (
     check_account_lockout,
     increment_failure_count,
     clear_failure_count,
-    cleanup_old_attempts
+    start_rate_limit_sync,
+    stop_rate_limit_sync
 )
 
 from .audit_logger import (
     set_db as set_audit_db,
     log_audit,
+    log_audit_background,
+    flush_audit_logs,
     get_audit_logs,
     AuditAction
 )
@@ -21,6 +24,7 @@ from .crypto import (
     hash_otp_code,
     verify_otp_hash,
     hash_ip_address,
+    hash_visitor,
     generate_secure_token,
     validate_password_strength
 )
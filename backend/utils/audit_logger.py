@@ -3,7 +3,8 @@ Audit Logger for Admin Actions
 Logs all sensitive admin operations for security review and compliance
 """
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Set
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -106,6 +107,28 @@ async def log_audit(
         logger.error(f"Failed to write audit log: {e}")
 
 
+# Audit writes scheduled off the request path, kept referenced until done
+_pending_writes: Set[asyncio.Task] = set()
+
+
+def log_audit_background(action: str, **kwargs):
+    """
+    Schedule an audit event without waiting for the write.
+    
+    Used on hot paths (login) where the response should not wait for the
+    audit insert. Takes the same arguments as log_audit.
+    """
+    task = asyncio.get_running_loop().create_task(log_audit(action, **kwargs))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+
+async def flush_audit_logs():
+    """Wait for scheduled audit writes (call from app shutdown)."""
+    if _pending_writes:
+        await asyncio.gather(*list(_pending_writes), return_exceptions=True)
+
+
 async def get_audit_logs(
     user_id: Optional[str] = None,
     action_prefix: Optional[str] = None,
@@ -0,0 +1,102 @@
+"""
+Circuit breaker
+Stops sending requests to a dependency (MongoDB) that keeps failing, so a slow
+or unavailable database does not pile up waiting requests
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and consecutive failures are counted.
+    Open: calls fail immediately with CircuitOpenError for `reset_timeout_seconds`.
+    Half-open: one trial call goes through; success closes the circuit, failure reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout_seconds: float = 30,
+        call_timeout_seconds: Optional[float] = None,
+        failure_exceptions: Tuple[Type[BaseException], ...] = (Exception,)
+    ):
+        """
+        Args:
+            name: Name used in logs
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout_seconds: Time the circuit stays open before a trial call
+            call_timeout_seconds: Deadline per call (counted as a failure when exceeded)
+            failure_exceptions: Exceptions that count as failures; others pass through
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.call_timeout_seconds = call_timeout_seconds
+        self.failure_exceptions = failure_exceptions + (asyncio.TimeoutError,)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Run `func()` through the breaker."""
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._trial_in_flight):
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        trial = state == self.HALF_OPEN
+        if trial:
+            self._trial_in_flight = True
+        try:
+            if self.call_timeout_seconds is not None:
+                result = await asyncio.wait_for(func(), self.call_timeout_seconds)
+            else:
+                result = await func()
+        except self.failure_exceptions as e:
+            self._record_failure(e)
+            raise
+        finally:
+            if trial:
+                self._trial_in_flight = False
+        self._record_success()
+        return result
+
+    def stats(self) -> dict:
+        return {"name": self.name, "state": self.state, "consecutive_failures": self._failures}
+
+    def _record_success(self):
+        if self._opened_at is not None:
+            logger.info(f"Circuit '{self.name}' closed")
+        self._failures = 0
+        self._opened_at = None
+
+    def _record_failure(self, error: BaseException):
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning(f"Circuit '{self.name}' opened after {self._failures} failures: {error!r}")
+            # A failed trial call restarts the open period
+            self._opened_at = time.monotonic()
@@ -118,6 +118,26 @@ def hash_ip_address(ip_address: str) -> str:
     return hashlib.sha256(salted.encode()).hexdigest()[:16]
 
 
+_visitor_hash_key = None
+
+
+def hash_visitor(ip_address: str) -> int:
+    """
+    Stable 64-bit keyed hash of an IP address for unique-visitor sketches.
+    
+    Unlike hash_ip_address it does not change daily, so sketches of different
+    days can be merged. It is only used in memory and never stored.
+    """
+    global _visitor_hash_key
+    
+    if _visitor_hash_key is None:
+        jwt_secret = os.environ.get('JWT_SECRET_KEY', os.environ.get('JWT_SECRET', ''))
+        _visitor_hash_key = hashlib.sha256(f"visitor-sketch:{jwt_secret}".encode()).digest()
+    
+    digest = hashlib.blake2b(ip_address.encode(), digest_size=8, key=_visitor_hash_key).digest()
+    return int.from_bytes(digest, "big")
+
+
 def generate_secure_token(length: int = 32) -> str:
     """Generate a cryptographically secure random token."""
     return secrets.token_urlsafe(length)
@@ -0,0 +1,30 @@
+"""
+Timestamp helpers
+Expiring records store BSON dates (returned by the driver as naive UTC datetimes);
+records written before that switch may still hold ISO-8601 strings
+"""
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+
+def utc_now() -> datetime:
+    """Current time truncated to BSON date precision (milliseconds).
+
+    A value built from it compares equal after a round trip through MongoDB.
+    """
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def as_utc_datetime(value: Union[datetime, str, None]) -> Optional[datetime]:
+    """Read a stored timestamp (datetime or ISO string) as an aware UTC datetime."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
@@ -0,0 +1,175 @@
+"""
+Index manifest
+Declares the indexes behind every hot query and the TTL indexes that expire
+short-lived collections, and creates or updates them idempotently at startup
+
+Query indexes are created with ``create_index``, which is a no-op when an
+identical index exists. ``utils.query_plans`` checks the queries the routes
+issue against them.
+
+Each TTL index has a retention in seconds, overridable with the
+``TTL_<COLLECTION>_SECONDS`` environment variable. For fields holding an
+absolute expiry time (``expires_at``) the retention is a grace period after
+that time, usually 0; for fields holding an event time it is how long the
+record is kept. MongoDB's TTL monitor only expires BSON dates, so the indexed
+fields must be written as datetimes.
+"""
+from dataclasses import dataclass
+from typing import Tuple
+import logging
+import os
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Index:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+INDEXES = [
+    # Blogs: detail by slug, admin by id, listings newest first
+    Index("blogs", (("slug", ASCENDING),), unique=True),
+    Index("blogs", (("id", ASCENDING),), unique=True),
+    Index("blogs", (("is_published", ASCENDING), ("created_at", DESCENDING))),
+    # Filtered listings and related posts (each branch of the category/tag $or)
+    Index("blogs", (("category", ASCENDING), ("is_published", ASCENDING), ("created_at", DESCENDING))),
+    Index("blogs", (("tags", ASCENDING), ("is_published", ASCENDING), ("created_at", DESCENDING))),
+    Index("blogs", (("created_at", DESCENDING),)),
+
+    Index("comments", (("blog_id", ASCENDING), ("is_approved", ASCENDING), ("created_at", ASCENDING))),
+    Index("comments", (("id", ASCENDING),), unique=True),
+    Index("comments", (("parent_id", ASCENDING),)),
+    Index("comments", (("created_at", DESCENDING),)),
+
+    Index("users", (("email", ASCENDING),), unique=True),
+    Index("users", (("id", ASCENDING),), unique=True),
+    # Failure counters are upserted by email; concurrent upserts must not duplicate them
+    Index("login_failures", (("email", ASCENDING),), unique=True),
+
+    Index("passkey_credentials", (("credential_id", ASCENDING),), unique=True),
+    Index("passkey_credentials", (("user_id", ASCENDING),)),
+    # Sign count updates after a passkey login
+    Index("passkey_credentials", (("id", ASCENDING),)),
+
+    Index("contact_messages", (("created_at", DESCENDING),)),
+    Index("contact_messages", (("id", ASCENDING),)),
+
+    # Legacy rate limiter: attempts of one identifier and type in the window
+    Index("rate_limits", (("identifier", ASCENDING), ("type", ASCENDING), ("timestamp", ASCENDING))),
+
+    Index("audit_logs", (("action", ASCENDING), ("timestamp", DESCENDING))),
+    Index("audit_logs", (("timestamp", DESCENDING),)),
+    Index("audit_logs", (("user_id", ASCENDING), ("timestamp", DESCENDING))),
+
+    # Analytics: one document per (granularity, dimension, bucket, value), read by range
+    Index(
+        "visit_rollups",
+        (("granularity", ASCENDING), ("dimension", ASCENDING), ("start", ASCENDING), ("value", ASCENDING)),
+        unique=True
+    ),
+
+    Index("visitor_sketches", (("scope", ASCENDING), ("day", ASCENDING))),
+
+    Index("page_content", (("page", ASCENDING),)),
+    Index("projects", (("id", ASCENDING),)),
+    Index("skills", (("id", ASCENDING),)),
+    Index("categories", (("name", ASCENDING),)),
+    Index("site_stats", (("type", ASCENDING),)),
+    Index("totp_setup", (("user_id", ASCENDING),)),
+    Index("otp_codes", (("session_token", ASCENDING),)),
+    Index("webauthn_challenges", (("session_id", ASCENDING),)),
+    Index("webauthn_challenges", (("user_id", ASCENDING),)),
+]
+
+
+async def ensure_indexes(db):
+    """Create the query indexes, then the TTL indexes. Failures are logged, not raised."""
+    for spec in INDEXES:
+        try:
+            await db[spec.collection].create_index(list(spec.keys), name=spec.name, unique=spec.unique)
+        except DuplicateKeyError as e:
+            logger.error(
+                f"Unique index {spec.collection}.{spec.name} not created, existing documents "
+                f"have duplicate values (run `python -m migrations`): {e}"
+            )
+        except PyMongoError as e:
+            # e.g. an index on the same keys exists with other options
+            logger.warning(f"Index {spec.collection}.{spec.name} not ensured: {e}")
+    await ensure_ttl_indexes(db)
+
+
+@dataclass(frozen=True)
+class TtlIndex:
+    collection: str
+    field: str
+    default_retention_seconds: int
+
+    @property
+    def env_var(self) -> str:
+        return f"TTL_{self.collection.upper()}_SECONDS"
+
+    @property
+    def retention_seconds(self) -> int:
+        return int(os.environ.get(self.env_var, self.default_retention_seconds))
+
+
+TTL_INDEXES = [
+    # Legacy per-attempt rate limit records (windows are at most minutes long)
+    TtlIndex("rate_limits", "timestamp", 3600),
+    # Counter buckets carry their own expiry (see utils.rate_limiter)
+    TtlIndex("rate_limit_buckets", "expires_at", 0),
+    TtlIndex("otp_codes", "expires_at", 0),
+    TtlIndex("webauthn_challenges", "expires_at", 0),
+    # Must outlast the lockout: the lock lives in the same document
+    TtlIndex("login_failures", "last_attempt", 86400),
+    # Raw visits; history is kept in visit_rollups (the index also serves the rollup range scans)
+    TtlIndex("visit_logs", "timestamp", 30 * 86400),
+]
+
+
+async def ensure_ttl_indexes(db):
+    """Create missing TTL indexes and apply changed retentions (collMod)."""
+    for spec in TTL_INDEXES:
+        try:
+            await _ensure_ttl_index(db, spec)
+        except PyMongoError as e:
+            logger.warning(f"TTL index on {spec.collection}.{spec.field} not ensured: {e}")
+
+
+async def _ensure_ttl_index(db, spec: TtlIndex):
+    collection = db[spec.collection]
+    retention = spec.retention_seconds
+    key = [(spec.field, 1)]
+
+    existing = None
+    for name, info in (await collection.index_information()).items():
+        if info.get("key") == key:
+            existing = (name, info)
+            break
+
+    if existing is None:
+        await collection.create_index(key, expireAfterSeconds=retention, name=f"{spec.field}_ttl")
+        logger.info(f"Created TTL index {spec.collection}.{spec.field} ({retention}s)")
+        return
+
+    name, info = existing
+    if info.get("expireAfterSeconds") == retention:
+        return
+    if "expireAfterSeconds" not in info:
+        logger.warning(
+            f"{spec.collection} has a non-TTL index {name} on {spec.field}; "
+            "drop it to let records expire"
+        )
+        return
+    await db.command("collMod", spec.collection, index={"name": name, "expireAfterSeconds": retention})
+    logger.info(f"Changed TTL of {spec.collection}.{spec.field} to {retention}s")
@@ -0,0 +1,76 @@
+"""
+Periodic background tasks
+Small helper for running a coroutine on a fixed interval from the server lifespan
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Run an async callable every `interval_seconds` until stopped."""
+
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], Awaitable[None]]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self._func = func
+        self._task: Optional[asyncio.Task] = None
+        self._early_run: Optional[asyncio.Task] = None
+        self._held_until = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the loop on the running event loop (no-op if already started)."""
+        if self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(), name=self.name)
+
+    def run_soon(self):
+        """Run the callable now in the background, unless an early run is in progress or held off."""
+        if self._early_run is not None and not self._early_run.done():
+            return
+        if time.monotonic() < self._held_until:
+            return
+        self._early_run = asyncio.get_running_loop().create_task(self._run_once(), name=f"{self.name}-early")
+
+    def hold_off(self):
+        """Ignore run_soon() for one interval (call when a run failed, so retries wait for the loop)."""
+        self._held_until = time.monotonic() + self.interval_seconds
+
+    async def stop(self, run_final: bool = False):
+        """
+        Cancel the loop.
+
+        Args:
+            run_final: If True, run the callable one last time after stopping
+                       (used to flush buffered state on shutdown)
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if run_final:
+            await self._run_once()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self._run_once()
+
+    async def _run_once(self):
+        try:
+            await self._func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Periodic task '{self.name}' failed: {e}")
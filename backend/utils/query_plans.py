@@ -0,0 +1,464 @@
+"""
+Query plan check
+Runs explain() on every filtered or sorted query the application issues and
+reports the ones MongoDB would answer with a collection scan
+
+The queries are read from the source, not listed by hand: every
+``db.<collection>.<method>(...)`` call in SOURCE_MODULES is parsed and its
+filter and sort are rebuilt from the literals at the call site. A filter built
+in a variable (``query = {...}``, then ``query["field"] = ...`` under an ``if``)
+gives one shape per combination of its conditional fields, and a filter
+returned by a local helper is expanded with the helper's arguments. Values that
+are not literals become sample values; plans depend on the fields and
+operators, not on the data. Reads with neither a filter nor a sort (settings
+documents, whole-collection reads) scan by definition and are skipped.
+Collections reached through an object passed in from elsewhere cannot be
+named by the parser; their queries are listed in EXTRA_QUERIES.
+
+Run against a database (a scratch one is fine):
+
+    python -m utils.query_plans
+
+Indexes from ``utils.indexes`` are ensured first. Exits non-zero if any query
+uses a COLLSCAN or a call site cannot be parsed, so it can gate a deploy or CI
+job; the test suite runs the same check when ``QUERY_PLANS_MONGODB_URI`` is set.
+"""
+from dataclasses import dataclass
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import ast
+import asyncio
+import copy
+import json
+import os
+import sys
+
+from .indexes import ensure_indexes
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Modules whose queries serve requests or run in the background (migrations are one-off scans)
+SOURCE_MODULES = ["server.py", "routes/*.py", "utils/*.py"]
+
+QUERY_METHODS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "find_one_and_replace",
+    "count_documents", "distinct", "aggregate",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+}
+SORT_DIRECTIONS = {"ASCENDING": 1, "DESCENDING": -1}
+
+# Conditional fields of one filter variable expanded into every combination
+MAX_OPTIONAL_FIELDS = 4
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[Tuple[Tuple[str, int], ...]] = None
+    limit: int = 0
+
+
+EXTRA_QUERIES = [
+    # utils/view_counter.py - bulk $inc of views
+    QueryShape("view count flush", "blogs", {"id": "sample"}),
+    # utils/visit_rollups.py - upserted rollup counts
+    QueryShape(
+        "rollup count upsert", "visit_rollups",
+        {"granularity": "hour", "dimension": "path", "start": "sample", "value": "sample"}
+    ),
+    # utils/visitor_sketches.py - per-scope sketches of a day range
+    QueryShape("visitor sketches", "visitor_sketches", {"scope": "site", "day": {"$gte": "sample", "$lte": "sample"}}, (("day", 1),)),
+]
+
+
+class _Unresolved(Exception):
+    """A call site whose filter or sort is not built from literals."""
+
+
+class _Sample:
+    """A value only known at run time."""
+
+    def __repr__(self):
+        return "<sample>"
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+SAMPLE = _Sample()
+
+
+class _ModuleQueries:
+    """Query shapes of one source module."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.label = path.relative_to(BACKEND_DIR).as_posix()
+        self.tree = ast.parse(path.read_text(), filename=str(path))
+        self.parents = {child: node for node in ast.walk(self.tree) for child in ast.iter_child_nodes(node)}
+        self.module_values = {
+            target.id: node.value
+            for node in self.tree.body if isinstance(node, ast.Assign)
+            for target in node.targets if isinstance(target, ast.Name)
+        }
+
+    def shapes(self) -> Iterator[Tuple[str, Optional[QueryShape]]]:
+        """(call site, shape) pairs; the shape is None if the site cannot be parsed."""
+        for node in ast.walk(self.tree):
+            target = _query_target(node)
+            if target is None:
+                continue
+            collection, method = target
+            site = f"{self.label}:{node.lineno} {collection}.{method}"
+            try:
+                if method == "aggregate":
+                    variants, sort = self._pipeline(node)
+                else:
+                    variants, sort = self._filters(node, method), self._sort(node)
+                shapes = [QueryShape(site, collection, _concrete(f), sort) for f in variants]
+            except _Unresolved:
+                yield site, None
+                continue
+            for shape in shapes:
+                yield site, shape
+
+    # ---- filters ------------------------------------------------------------
+
+    def _filters(self, call: ast.Call, method: str) -> List[dict]:
+        index = 1 if method == "distinct" else 0
+        if len(call.args) > index:
+            node = call.args[index]
+        else:
+            node = next((kw.value for kw in call.keywords if kw.arg == "filter"), None)
+        if node is None:
+            return [{}]
+        return self._variants(node, call)
+
+    def _variants(self, node: ast.AST, at: ast.AST) -> List[dict]:
+        if isinstance(node, ast.Dict):
+            return [self._value(node, {})]
+        if isinstance(node, ast.IfExp):
+            return self._variants(node.body, at) + self._variants(node.orelse, at)
+        if isinstance(node, ast.Name):
+            return self._name_variants(node.id, at)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            return [self._call_value(node, at)]
+        raise _Unresolved()
+
+    def _name_variants(self, name: str, at: ast.AST) -> List[dict]:
+        """Filters a variable can hold at `at`: its last assignment plus the fields set on it since."""
+        for scope in self._scopes(at):
+            assignments = [
+                stmt for stmt in _walk_scope(scope)
+                if isinstance(stmt, ast.Assign) and stmt.lineno < at.lineno
+                and any(isinstance(t, ast.Name) and t.id == name for t in stmt.targets)
+            ]
+            if assignments:
+                base = max(assignments, key=lambda stmt: stmt.lineno)
+                return self._with_updates(name, scope, base, at)
+        if name in self.module_values:
+            return self._variants(self.module_values[name], at)
+        raise _Unresolved()
+
+    def _with_updates(self, name: str, scope: ast.AST, base: ast.Assign, at: ast.AST) -> List[dict]:
+        groups: Dict[str, List[ast.Assign]] = {}
+        for stmt in _walk_scope(scope):
+            if not (isinstance(stmt, ast.Assign) and base.lineno < stmt.lineno < at.lineno):
+                continue
+            for target in stmt.targets:
+                path = _subscript_path(target, name)
+                if path:
+                    groups.setdefault(self._key(path[0]), []).append(stmt)
+
+        always = [field for field, stmts in groups.items() if not any(self._conditional(s, scope) for s in stmts)]
+        optional = [field for field in groups if field not in always]
+        if len(optional) > MAX_OPTIONAL_FIELDS:
+            raise _Unresolved()
+
+        variants = []
+        for base_filter in self._variants(base.value, base):
+            for size in range(len(optional) + 1):
+                for chosen in combinations(optional, size):
+                    fields = set(always) | set(chosen)
+                    query = copy.deepcopy(base_filter)
+                    for stmt in sorted((s for f in fields for s in groups[f]), key=lambda s: s.lineno):
+                        for target in stmt.targets:
+                            path = _subscript_path(target, name)
+                            if path:
+                                _set_path(query, [self._key(key) for key in path], self._value(stmt.value, {}))
+                    variants.append(query)
+        return variants
+
+    def _call_value(self, call: ast.Call, at: ast.AST) -> dict:
+        """Filter returned by a helper defined in an enclosing scope or the module."""
+        name = call.func.id
+        for scope in [*self._scopes(at), self.tree]:
+            for node in _walk_scope(scope):
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+                    returns = [stmt for stmt in node.body if isinstance(stmt, ast.Return)]
+                    if len(returns) != 1 or call.keywords:
+                        raise _Unresolved()
+                    env = {
+                        arg.arg: self._value(value, {})
+                        for arg, value in zip(node.args.args, call.args)
+                    }
+                    value = self._value(returns[0].value, env)
+                    if not isinstance(value, dict):
+                        raise _Unresolved()
+                    return value
+        raise _Unresolved()
+
+    def _value(self, node: ast.AST, env: Dict[str, Any]) -> Any:
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Dict):
+            result = {}
+            for key, value in zip(node.keys, node.values):
+                if key is None:
+                    raise _Unresolved()  # ** unpacking
+                result[self._key(key, env)] = self._value(value, env)
+            return result
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [self._value(item, env) for item in node.elts]
+        if isinstance(node, ast.Name):
+            if node.id in env:
+                return env[node.id]
+            if node.id in SORT_DIRECTIONS:
+                return SORT_DIRECTIONS[node.id]
+            literal = self.module_values.get(node.id)
+            if isinstance(literal, (ast.Constant, ast.Dict, ast.List, ast.Tuple)):
+                return self._value(literal, env)
+            return SAMPLE
+        if isinstance(node, ast.UnaryOp) and isinstance(node.operand, ast.Constant):
+            return ast.literal_eval(node)
+        return SAMPLE
+
+    def _key(self, node: ast.AST, env: Optional[Dict[str, Any]] = None) -> str:
+        key = self._value(node, env or {})
+        if not isinstance(key, str):
+            raise _Unresolved()
+        return key
+
+    # ---- sorts and pipelines ------------------------------------------------
+
+    def _sort(self, call: ast.Call) -> Optional[Tuple[Tuple[str, int], ...]]:
+        keyword = next((kw.value for kw in call.keywords if kw.arg == "sort"), None)
+        if keyword is not None:
+            return _sort_spec(self._value(keyword, {}))
+        parent = self.parents.get(call)
+        if isinstance(parent, ast.Attribute) and parent.attr == "sort":
+            sort_call = self.parents.get(parent)
+            if isinstance(sort_call, ast.Call):
+                args = [self._value(arg, {}) for arg in sort_call.args]
+                return _sort_spec(args if len(args) == 2 else args[0])
+        return None
+
+    def _pipeline(self, call: ast.Call) -> Tuple[List[dict], Optional[Tuple[Tuple[str, int], ...]]]:
+        if not call.args:
+            raise _Unresolved()
+        node = call.args[0]
+        if isinstance(node, ast.Name):
+            assigned = [
+                stmt.value for scope in self._scopes(call) for stmt in _walk_scope(scope)
+                if isinstance(stmt, ast.Assign) and stmt.lineno < call.lineno
+                and any(isinstance(t, ast.Name) and t.id == node.id for t in stmt.targets)
+            ]
+            if not assigned:
+                raise _Unresolved()
+            node = assigned[-1]
+        if not isinstance(node, ast.List) or not node.elts:
+            raise _Unresolved()
+        stages = [self._value(stage, {}) for stage in node.elts[:2]]
+        if not all(isinstance(stage, dict) for stage in stages) or "$match" not in stages[0]:
+            # Grouping a whole collection scans it by design
+            return [{}], None
+        sort = _sort_spec(list(stages[1]["$sort"].items())) if len(stages) > 1 and "$sort" in stages[1] else None
+        return [stages[0]["$match"]], sort
+
+    # ---- scopes -------------------------------------------------------------
+
+    def _scopes(self, node: ast.AST) -> List[ast.AST]:
+        """Enclosing functions, innermost first."""
+        scopes = []
+        while node in self.parents:
+            node = self.parents[node]
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                scopes.append(node)
+        return scopes
+
+    def _conditional(self, stmt: ast.AST, scope: ast.AST) -> bool:
+        node = stmt
+        while node is not scope and node in self.parents:
+            node = self.parents[node]
+            if isinstance(node, (ast.If, ast.For, ast.While)):
+                return True
+        return False
+
+
+def _query_target(node: ast.AST) -> Optional[Tuple[str, str]]:
+    """(collection, method) of a ``db.<collection>.<method>(...)`` call."""
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in QUERY_METHODS):
+        return None
+    collection = node.func.value
+    if not isinstance(collection, ast.Attribute):
+        return None
+    owner = collection.value
+    if (isinstance(owner, ast.Name) and owner.id == "db") or (isinstance(owner, ast.Attribute) and owner.attr == "db"):
+        return collection.attr, node.func.attr
+    return None
+
+
+def _walk_scope(scope: ast.AST) -> Iterator[ast.AST]:
+    """Nodes of a function (or module), not descending into nested functions."""
+    stack = list(ast.iter_child_nodes(scope))
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            stack.extend(ast.iter_child_nodes(node))
+
+
+def _subscript_path(target: ast.AST, name: str) -> Optional[List[ast.AST]]:
+    """Keys of ``name[k1][k2] = ...`` (outermost first), or None for other targets."""
+    keys = []
+    while isinstance(target, ast.Subscript):
+        keys.append(target.slice)
+        target = target.value
+    if keys and isinstance(target, ast.Name) and target.id == name:
+        return keys[::-1]
+    return None
+
+
+def _set_path(query: dict, path: List[str], value: Any):
+    for key in path[:-1]:
+        query = query.setdefault(key, {})
+        if not isinstance(query, dict):
+            raise _Unresolved()
+    query[path[-1]] = value
+
+
+def _sort_spec(value: Any) -> Tuple[Tuple[str, int], ...]:
+    if isinstance(value, str):
+        return ((value, 1),)
+    if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and isinstance(value[1], int):
+        return ((value[0], value[1]),)
+    if isinstance(value, list) and all(isinstance(p, (list, tuple)) and len(p) == 2 for p in value):
+        if all(isinstance(field, str) and isinstance(direction, int) for field, direction in value):
+            return tuple((field, direction) for field, direction in value)
+    raise _Unresolved()
+
+
+def _concrete(value: Any, key: Optional[str] = None) -> Any:
+    """Replace run-time values with samples of a type valid for their operator."""
+    if value is SAMPLE:
+        if key in ("$in", "$nin", "$all"):
+            return ["sample"]
+        if key == "$regex":
+            return "^sample"
+        if key == "$exists":
+            return True
+        if key in ("$or", "$and", "$nor"):
+            raise _Unresolved()
+        return "sample"
+    if isinstance(value, dict):
+        return {k: _concrete(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_concrete(item) for item in value]
+    return value
+
+
+def source_queries() -> Tuple[List[QueryShape], List[str]]:
+    """Shapes of the queries in SOURCE_MODULES, and the call sites that could not be parsed.
+
+    Shapes with neither a filter nor a sort are left out; so are repeats of a
+    shape already found at another call site.
+    """
+    shapes: List[QueryShape] = []
+    unresolved: List[str] = []
+    seen = set()
+    paths = sorted({path for pattern in SOURCE_MODULES for path in BACKEND_DIR.glob(pattern)})
+    for path in paths:
+        for site, shape in _ModuleQueries(path).shapes():
+            if shape is None:
+                unresolved.append(site)
+                continue
+            if not shape.filter and not shape.sort:
+                continue
+            key = (shape.collection, json.dumps(shape.filter, sort_keys=True, default=str), shape.sort)
+            if key not in seen:
+                seen.add(key)
+                shapes.append(shape)
+    return shapes, unresolved
+
+
+def all_queries() -> Tuple[List[QueryShape], List[str]]:
+    shapes, unresolved = source_queries()
+    return shapes + EXTRA_QUERIES, unresolved
+
+
+def _stages(plan: Any) -> Iterator[str]:
+    """Every stage name in an explain plan tree (classic and SBE layouts)."""
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+async def explain(db, query: QueryShape) -> List[str]:
+    """Stage names of the winning plan for `query`."""
+    command: Dict[str, Any] = {"find": query.collection, "filter": query.filter}
+    if query.sort:
+        command["sort"] = dict(query.sort)
+    if query.limit:
+        command["limit"] = query.limit
+    result = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    return list(_stages(result["queryPlanner"]["winningPlan"]))
+
+
+async def check_query_plans(db, queries: Optional[List[QueryShape]] = None) -> List[Tuple[QueryShape, List[str]]]:
+    """Ensure indexes, then return the queries whose plans contain a COLLSCAN.
+
+    Args:
+        db: Database to explain against
+        queries: Shapes to explain (default: all_queries())
+    """
+    if queries is None:
+        queries, _ = all_queries()
+    await ensure_indexes(db)
+    failures = []
+    for query in queries:
+        stages = await explain(db, query)
+        if "COLLSCAN" in stages:
+            failures.append((query, stages))
+    return failures
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(BACKEND_DIR / ".env")
+    queries, unresolved = all_queries()
+    client = AsyncIOMotorClient(os.environ["MONGODB_URI"])
+    try:
+        failures = await check_query_plans(client[os.environ["DB_NAME"]], queries)
+    finally:
+        client.close()
+
+    for site in unresolved:
+        print(f"UNPARSED  {site}")
+    for query, stages in failures:
+        print(f"COLLSCAN  {query.collection:<20} {query.name}: {' > '.join(stages)}")
+    print(f"{len(queries) - len(failures)}/{len(queries)} queries use an index")
+    return 1 if failures or unresolved else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
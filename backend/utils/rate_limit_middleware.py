@@ -0,0 +1,218 @@
+"""
+Rate limiting middleware
+Applies a declarative policy table to incoming requests before routing, and
+resolves the trusted client IP once per request into ``request.state.client_ip``
+"""
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, FrozenSet, List, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .rate_limiter import check_rate_limit, record_attempt
+
+# Largest request body read to extract a body-field identifier
+MAX_IDENTIFIER_BODY_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """
+    One rate limit applied to matching requests.
+
+    Args:
+        method: HTTP method the policy applies to
+        path: Regex matched against the full request path
+        limit_type: Limit type passed to check_rate_limit/record_attempt
+        max_attempts: Maximum attempts allowed in the window
+        window_seconds: Time window in seconds
+        detail: Message returned with the 429
+        identifier: "ip", or "body:<field>" to limit by a JSON body field
+        identifier_prefix: Prefix added to the identifier (keeps key spaces apart)
+        consume: Count every request when it is checked (in the same round trip)
+        record_statuses: Response statuses recorded as failed attempts (when not consuming)
+        clear_on_success: Clear the identifier's attempts after a 2xx response
+        skip: Predicate on the request that exempts it from this policy
+    """
+    method: str
+    path: str
+    limit_type: str
+    max_attempts: int
+    window_seconds: int
+    detail: str = "Too many requests. Please slow down."
+    identifier: str = "ip"
+    identifier_prefix: str = ""
+    consume: bool = True
+    record_statuses: FrozenSet[int] = frozenset()
+    clear_on_success: bool = False
+    skip: Optional[Callable[[Request], bool]] = None
+    pattern: "re.Pattern" = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "pattern", re.compile(self.path))
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.pattern.fullmatch(path) is not None
+
+
+def trusted_proxy_hops() -> int:
+    """Number of reverse proxies in front of the app that append to X-Forwarded-For.
+
+    0 trusts only the socket peer. Entries left of the trusted hops are set by
+    the client and never used.
+    """
+    return int(os.environ.get("TRUSTED_PROXY_HOPS", 1))
+
+
+def resolve_client_ip(scope: Scope, trusted_hops: int) -> str:
+    """Client address as seen by the outermost trusted proxy."""
+    peer = scope.get("client")
+    peer_ip = peer[0] if peer else "unknown"
+    if trusted_hops <= 0:
+        return peer_ip
+
+    forwarded = []
+    for name, value in scope.get("headers", ()):
+        if name == b"x-forwarded-for":
+            forwarded.extend(part.strip() for part in value.decode("latin-1").split(","))
+    forwarded = [ip for ip in forwarded if ip]
+    if not forwarded:
+        return peer_ip
+    # Each trusted proxy appended the address it received the request from
+    return forwarded[-trusted_hops] if len(forwarded) >= trusted_hops else forwarded[0]
+
+
+def get_client_ip(request: Request) -> str:
+    """Client IP resolved by RateLimitMiddleware (falls back to resolving it here)."""
+    client_ip = getattr(request.state, "client_ip", None)
+    return client_ip or resolve_client_ip(request.scope, trusted_proxy_hops())
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware enforcing `policies` before the request reaches routing."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        policies: Sequence[RateLimitPolicy] = (),
+        trusted_hops: Optional[int] = None
+    ):
+        self.app = app
+        self.policies = list(policies)
+        self.trusted_hops = trusted_proxy_hops() if trusted_hops is None else trusted_hops
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = resolve_client_ip(scope, self.trusted_hops)
+        scope.setdefault("state", {})["client_ip"] = client_ip
+
+        policies = [p for p in self.policies if p.matches(scope["method"], scope["path"])]
+        if not policies:
+            await self.app(scope, receive, send)
+            return
+
+        body = None
+        if any(p.identifier.startswith("body:") for p in policies):
+            body, receive = await self._buffer_body(receive)
+        request = Request(scope, receive)
+
+        applied = []
+        for policy in policies:
+            if policy.skip is not None and policy.skip(request):
+                continue
+            identifier = self._identifier(policy, body, client_ip)
+            if identifier is None:
+                continue
+            is_allowed, _ = await check_rate_limit(
+                identifier=identifier,
+                limit_type=policy.limit_type,
+                max_attempts=policy.max_attempts,
+                window_seconds=policy.window_seconds,
+                consume=policy.consume
+            )
+            if not is_allowed:
+                response = JSONResponse({"detail": policy.detail}, status_code=429)
+                await response(scope, receive, send)
+                return
+            applied.append((policy, identifier))
+
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            await self._record(applied, status_code)
+
+    async def _record(self, applied: List, status_code: int):
+        for policy, identifier in applied:
+            if policy.clear_on_success and 200 <= status_code < 300:
+                await record_attempt(identifier, policy.limit_type, success=True)
+            elif not policy.consume and status_code in policy.record_statuses:
+                await record_attempt(identifier, policy.limit_type, window_seconds=policy.window_seconds)
+
+    @staticmethod
+    def _identifier(policy: RateLimitPolicy, body: Optional[dict], client_ip: str) -> Optional[str]:
+        """Identifier for `policy`, or None if the request does not carry it."""
+        if policy.identifier == "ip":
+            value = client_ip
+        else:
+            value = body.get(policy.identifier[len("body:"):]) if body else None
+            if not isinstance(value, str) or not value:
+                return None
+            value = value.strip().lower()[:254]
+        return f"{policy.identifier_prefix}{value}"
+
+    @staticmethod
+    async def _buffer_body(receive: Receive) -> Tuple[Optional[dict], Receive]:
+        """Read the body (up to the limit) and parse it as a JSON object.
+
+        Returns the parsed object (None if it is not one) and a receive callable
+        that replays the buffered messages to the app.
+        """
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Client went away; let the app see the disconnect
+                pending = [message]
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+            if size > MAX_IDENTIFIER_BODY_BYTES:
+                pending = []
+                break
+        else:
+            pending = []
+
+        raw = b"".join(chunks)
+        buffered = [{"type": "http.request", "body": raw, "more_body": more_body}] + pending
+
+        async def replay() -> Message:
+            if buffered:
+                return buffered.pop(0)
+            return await receive()
+
+        body = None
+        if not more_body and not pending:
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                pass
+        return (body if isinstance(body, dict) else None), replay
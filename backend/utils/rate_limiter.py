@@ -1,10 +1,27 @@
 """
 Persistent Rate Limiter using MongoDB
 Replaces in-memory rate limiting for scalability and persistence across restarts
+
+High-volume limit types (public API reads) are counted in process with a
+sliding-window counter instead, so a request costs no database round trip.
+Their counts are reconciled with MongoDB in the background, which keeps the
+limits across restarts and shared between workers (within one sync interval).
+
+Abuse-sensitive limit types (login, passkey, contact, comment) use one counter
+document per (type, identifier, fixed window) in ``rate_limit_buckets``,
+incremented atomically so check-and-record is a single round trip. Both
+kinds of bucket expire through a TTL index on ``expires_at``.
 """
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import logging
+import re
+import time
+
+from pymongo import ReturnDocument, UpdateOne
+
+from .dates import as_utc_datetime, utc_now
+from .periodic import PeriodicTask
 
 logger = logging.getLogger(__name__)
 
@@ -16,33 +33,231 @@ def set_db(database):
     db = database
 
 
-async def cleanup_old_attempts():
-    """Remove expired rate limit records (run periodically)"""
-    try:
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=1)
-        await db.rate_limits.delete_many({"timestamp": {"$lt": cutoff.isoformat()}})
-    except Exception as e:
-        logger.warning(f"Rate limit cleanup error: {e}")
+# Limit types counted in memory (see LocalRateLimiter)
+LOCAL_LIMIT_TYPES = {"public_api", "bot_api"}
+
+# Limit types counted with atomic per-window counter documents
+COUNTER_LIMIT_TYPES = {"login", "passkey", "contact", "contact_email", "comment"}
+
+# How often local counts are pushed to / merged from MongoDB
+LOCAL_SYNC_INTERVAL_SECONDS = 5
+
+# Upper bound on tracked identifiers; the oldest are dropped beyond it
+LOCAL_MAX_KEYS = 100_000
+
+
+def _bucket_id(limit_type: str, identifier: str, index: int) -> str:
+    return f"{limit_type}|{identifier}|{index}"
+
+
+def _bucket_expiry(index: int, window_seconds: int) -> datetime:
+    # Kept for one extra window so the sliding estimate can still read it
+    return datetime.fromtimestamp((index + 2) * window_seconds, timezone.utc)
+
+
+class _Window:
+    """Counts for the current and previous fixed window of one identifier."""
+
+    __slots__ = ("index", "current", "previous")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.current = 0
+        self.previous = 0
+
+    def roll(self, index: int):
+        if index == self.index:
+            return
+        self.previous = self.current if index == self.index + 1 else 0
+        self.current = 0
+        self.index = index
+
+
+class LocalRateLimiter:
+    """
+    Sliding-window rate limiter held in process memory.
+
+    Each (limit type, identifier) keeps counts for the current and previous
+    fixed window; the estimate weights the previous window by how much of it
+    still overlaps the sliding window. Increments are buffered and flushed to
+    the ``rate_limit_buckets`` collection with one ``$inc`` upsert per bucket;
+    the merged totals read back raise the local counts, so hits seen by other
+    workers or before a restart still count.
+    """
+
+    def __init__(self, max_keys: int = LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._windows: Dict[Tuple[str, str], _Window] = {}
+        self._window_seconds: Dict[str, int] = {}
+        # Unflushed increments per (limit type, identifier, window index)
+        self._pending: Dict[Tuple[str, str, int], int] = {}
+
+    def _window(self, identifier: str, limit_type: str, window_seconds: int, now: float) -> _Window:
+        self._window_seconds[limit_type] = window_seconds
+        index = int(now // window_seconds)
+        key = (limit_type, identifier)
+        window = self._windows.get(key)
+        if window is None:
+            if len(self._windows) >= self.max_keys:
+                del self._windows[next(iter(self._windows))]
+            window = self._windows[key] = _Window(index)
+        else:
+            window.roll(index)
+        return window
+
+    @staticmethod
+    def _estimate(window: _Window, window_seconds: int, now: float) -> float:
+        overlap = 1 - (now % window_seconds) / window_seconds
+        return window.previous * overlap + window.current
+
+    def check(self, identifier: str, limit_type: str, max_attempts: int, window_seconds: int) -> Tuple[bool, int]:
+        now = time.time()
+        window = self._window(identifier, limit_type, window_seconds, now)
+        count = self._estimate(window, window_seconds, now)
+        return count < max_attempts, max(0, int(max_attempts - count))
+
+    def hit(self, identifier: str, limit_type: str, max_attempts: int, window_seconds: int) -> Tuple[bool, int]:
+        """Count one request and return whether it is within the limit."""
+        now = time.time()
+        window = self._window(identifier, limit_type, window_seconds, now)
+        count = self._estimate(window, window_seconds, now)
+        if count >= max_attempts:
+            return False, 0
+        self._count(identifier, limit_type, window)
+        return True, max(0, int(max_attempts - count - 1))
+
+    def record(self, identifier: str, limit_type: str, window_seconds: int):
+        window = self._window(identifier, limit_type, window_seconds, time.time())
+        self._count(identifier, limit_type, window)
+
+    def _count(self, identifier: str, limit_type: str, window: _Window):
+        window.current += 1
+        pending_key = (limit_type, identifier, window.index)
+        self._pending[pending_key] = self._pending.get(pending_key, 0) + 1
+
+    def reset(self, identifier: str, limit_type: str):
+        self._windows.pop((limit_type, identifier), None)
+
+    async def sync(self):
+        """Push buffered increments to MongoDB and merge back the shared totals."""
+        self._prune(time.time())
+        if db is None or not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        operations = []
+        ids = []
+        for (limit_type, identifier, index), count in pending.items():
+            window_seconds = self._window_seconds[limit_type]
+            bucket_id = _bucket_id(limit_type, identifier, index)
+            operations.append(UpdateOne(
+                {"_id": bucket_id},
+                {"$inc": {"count": count}, "$setOnInsert": {"expires_at": _bucket_expiry(index, window_seconds)}},
+                upsert=True
+            ))
+            ids.append(bucket_id)
+
+        try:
+            await db.rate_limit_buckets.bulk_write(operations, ordered=False)
+            totals = await db.rate_limit_buckets.find({"_id": {"$in": ids}}, {"count": 1}).to_list(None)
+        except Exception as e:
+            # Keep the increments for the next attempt
+            for key, count in pending.items():
+                self._pending[key] = self._pending.get(key, 0) + count
+            logger.warning(f"Rate limit sync error: {e}")
+            return
+
+        for doc in totals:
+            limit_type, identifier, index = doc["_id"].rsplit("|", 2)
+            window = self._windows.get((limit_type, identifier))
+            if window is None:
+                continue
+            # Local hits since the flush are not in the stored total yet
+            total = doc["count"] + self._pending.get((limit_type, identifier, int(index)), 0)
+            if window.index == int(index):
+                window.current = max(window.current, total)
+            elif window.index == int(index) + 1:
+                window.previous = max(window.previous, total)
+
+    def _prune(self, now: float):
+        """Forget identifiers idle for more than a full window."""
+        stale = [
+            key for key, window in self._windows.items()
+            if int(now // self._window_seconds[key[0]]) > window.index + 1
+        ]
+        for key in stale:
+            del self._windows[key]
+
+
+_local_limiter = LocalRateLimiter()
+_local_sync = PeriodicTask("rate-limit-sync", LOCAL_SYNC_INTERVAL_SECONDS, _local_limiter.sync)
+
+
+async def _counter_check(
+    identifier: str,
+    limit_type: str,
+    max_attempts: int,
+    window_seconds: int,
+    consume: bool
+) -> tuple[bool, int]:
+    """Fixed-window check on a counter document; with `consume`, count the attempt atomically."""
+    index = int(time.time() // window_seconds)
+    bucket_id = _bucket_id(limit_type, identifier, index)
+    if consume:
+        bucket = await db.rate_limit_buckets.find_one_and_update(
+            {"_id": bucket_id},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"expires_at": _bucket_expiry(index, window_seconds)}
+            },
+            projection={"count": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        count = bucket["count"]
+        return count <= max_attempts, max(0, max_attempts - count)
+
+    bucket = await db.rate_limit_buckets.find_one({"_id": bucket_id}, {"count": 1})
+    count = bucket["count"] if bucket else 0
+    return count < max_attempts, max(0, max_attempts - count)
+
+
+def start_rate_limit_sync():
+    """Start reconciling in-memory limits with MongoDB (call from app startup)."""
+    _local_sync.start()
+
+
+async def stop_rate_limit_sync():
+    """Stop the sync loop, flushing buffered counts first."""
+    await _local_sync.stop(run_final=True)
 
 
 async def check_rate_limit(
     identifier: str,
     limit_type: str,
     max_attempts: int,
-    window_seconds: int
+    window_seconds: int,
+    consume: bool = False
 ) -> tuple[bool, int]:
     """
     Check if rate limit exceeded for given identifier.
     
     Args:
         identifier: IP address or email or other unique identifier
-        limit_type: Type of limit (login, totp, contact, passkey)
+        limit_type: Type of limit (login, totp, contact, passkey, public_api)
         max_attempts: Maximum attempts allowed in window
         window_seconds: Time window in seconds
+        consume: Also count this attempt, in the same round trip for counter
+                 types (other persistent types count via record_attempt)
     
     Returns:
         tuple: (is_allowed: bool, remaining_attempts: int)
     """
+    if limit_type in LOCAL_LIMIT_TYPES:
+        if consume:
+            return _local_limiter.hit(identifier, limit_type, max_attempts, window_seconds)
+        return _local_limiter.check(identifier, limit_type, max_attempts, window_seconds)
+    
     if db is None:
         logger.warning("Rate limiter DB not initialized")
         return True, max_attempts  # Fail open if DB not ready
@@ -51,11 +266,14 @@ async def check_rate_limit(
     window_start = current_time - timedelta(seconds=window_seconds)
     
     try:
+        if limit_type in COUNTER_LIMIT_TYPES:
+            return await _counter_check(identifier, limit_type, max_attempts, window_seconds, consume)
+        
         # Count recent attempts
         count = await db.rate_limits.count_documents({
             "identifier": identifier,
             "type": limit_type,
-            "timestamp": {"$gte": window_start.isoformat()}
+            "timestamp": {"$gte": window_start}
         })
         
         remaining = max(0, max_attempts - count)
@@ -70,7 +288,8 @@ async def check_rate_limit(
 async def record_attempt(
     identifier: str,
     limit_type: str,
-    success: bool = False
+    success: bool = False,
+    window_seconds: int = 60
 ):
     """
     Record an attempt for rate limiting.
@@ -79,11 +298,35 @@ async def record_attempt(
         identifier: IP address or email
         limit_type: Type of limit
         success: If True, clear all attempts for this identifier/type
+        window_seconds: Window of in-memory and counter limit types
     """
+    if limit_type in LOCAL_LIMIT_TYPES:
+        if success:
+            _local_limiter.reset(identifier, limit_type)
+        else:
+            _local_limiter.record(identifier, limit_type, window_seconds)
+        return
+    
     if db is None:
         return
     
     try:
+        if limit_type in COUNTER_LIMIT_TYPES:
+            if success:
+                prefix = re.escape(f"{limit_type}|{identifier}|")
+                await db.rate_limit_buckets.delete_many({"_id": {"$regex": f"^{prefix}"}})
+            else:
+                index = int(time.time() // window_seconds)
+                await db.rate_limit_buckets.update_one(
+                    {"_id": _bucket_id(limit_type, identifier, index)},
+                    {
+                        "$inc": {"count": 1},
+                        "$setOnInsert": {"expires_at": _bucket_expiry(index, window_seconds)}
+                    },
+                    upsert=True
+                )
+            return
+        
         if success:
             # Clear attempts on successful action
             await db.rate_limits.delete_many({
@@ -95,7 +338,7 @@ async def record_attempt(
             await db.rate_limits.insert_one({
                 "identifier": identifier,
                 "type": limit_type,
-                "timestamp": datetime.now(timezone.utc).isoformat()
+                "timestamp": datetime.now(timezone.utc)
             })
     except Exception as e:
         logger.error(f"Rate limit record error: {e}")
@@ -116,71 +359,71 @@ async def check_account_lockout(
         return False, None
     
     try:
-        lockout = await db.account_lockouts.find_one({"email": email})
-        
-        if lockout:
-            unlock_time = datetime.fromisoformat(lockout["unlock_at"])
+        record = await db.login_failures.find_one({"email": email}, {"_id": 0, "locked_until": 1})
+        unlock_time = as_utc_datetime(record.get("locked_until")) if record else None
+        if unlock_time:
             if datetime.now(timezone.utc) < unlock_time:
                 return True, unlock_time
-            else:
-                # Lockout expired, remove it
-                await db.account_lockouts.delete_one({"email": email})
-        
+        # An expired lock is left in place; the next failure or success resets it
         return False, None
     except Exception as e:
         logger.error(f"Account lockout check error: {e}")
         return False, None
 
 
-async def increment_failure_count(email: str, max_failures: int = 10, lockout_minutes: int = 30):
+async def increment_failure_count(
+    email: str,
+    max_failures: int = 10,
+    lockout_minutes: int = 30
+) -> Optional[datetime]:
     """
     Increment failure count and lock account if threshold reached.
+    
+    One atomic upsert: the count and the lock live in the same
+    ``login_failures`` document, and reaching the threshold sets
+    ``locked_until`` and restarts the count in the same update.
+    
+    Returns:
+        The unlock time if this failure locked the account, else None
     """
     if db is None:
-        return
+        return None
     
+    now = utc_now()
+    unlock_at = now + timedelta(minutes=lockout_minutes)
     try:
-        # Get or create failure record
-        record = await db.login_failures.find_one({"email": email})
-        
-        if record:
-            new_count = record.get("count", 0) + 1
-            await db.login_failures.update_one(
-                {"email": email},
-                {"$set": {"count": new_count, "last_attempt": datetime.now(timezone.utc).isoformat()}}
-            )
-        else:
-            new_count = 1
-            await db.login_failures.insert_one({
-                "email": email,
-                "count": new_count,
-                "last_attempt": datetime.now(timezone.utc).isoformat()
-            })
-        
-        # Lock account if threshold reached
-        if new_count >= max_failures:
-            unlock_time = datetime.now(timezone.utc) + timedelta(minutes=lockout_minutes)
-            await db.account_lockouts.update_one(
-                {"email": email},
+        record = await db.login_failures.find_one_and_update(
+            {"email": email},
+            [
                 {"$set": {
-                    "email": email,
-                    "unlock_at": unlock_time.isoformat(),
-                    "locked_at": datetime.now(timezone.utc).isoformat()
+                    "count": {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+                    "last_attempt": now
                 }},
-                upsert=True
-            )
-            # Reset failure count
-            await db.login_failures.delete_one({"email": email})
+                {"$set": {
+                    "locked_until": {"$cond": [{"$gte": ["$count", max_failures]}, unlock_at, "$locked_until"]},
+                    "count": {"$cond": [{"$gte": ["$count", max_failures]}, 0, "$count"]}
+                }}
+            ],
+            upsert=True,
+            projection={"_id": 0, "locked_until": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if record and as_utc_datetime(record.get("locked_until")) == unlock_at:
+            return unlock_at
     except Exception as e:
         logger.error(f"Failure count increment error: {e}")
+    return None
 
 
 async def clear_failure_count(email: str):
-    """Clear failure count on successful login."""
+    """Clear failure count on successful login (an active lock is kept)."""
     if db is None:
         return
     
     try:
-        await db.login_failures.delete_one({"email": email})
+        await db.login_failures.delete_one({
+            "email": email,
+            "locked_until": {"$not": {"$gt": datetime.now(timezone.utc)}}
+        })
     except Exception as e:
         logger.error(f"Clear failure count error: {e}")
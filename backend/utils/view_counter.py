@@ -0,0 +1,97 @@
+"""
+Write-behind view counter
+Accumulates blog view increments in memory and writes them to MongoDB in one
+bulk_write per flush interval, so serving a (cached) post costs no write and a
+popular post is updated once per interval instead of once per view
+
+Views are keyed by blog id. Increments for the same post are merged, and a
+failed flush puts its increments back for the next one. At most one flush
+interval of views is lost if the process dies without a graceful shutdown;
+stop() flushes what is left.
+"""
+from typing import Dict
+import logging
+
+from pymongo import UpdateOne
+
+from .periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 5
+
+# Distinct posts buffered before a flush is started early
+DEFAULT_MAX_PENDING_IDS = 10_000
+
+
+class ViewCounter:
+    """In-memory view increments, flushed periodically with one bulk_write."""
+
+    def __init__(
+        self,
+        collection,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        max_pending_ids: int = DEFAULT_MAX_PENDING_IDS
+    ):
+        """
+        Args:
+            collection: Blogs collection (documents matched on ``id``)
+            flush_interval_seconds: Interval between flushes (the loss bound on a crash)
+            max_pending_ids: Distinct posts buffered before flushing early; increments
+                             that cannot be put back within twice this are dropped
+        """
+        self._collection = collection
+        self.max_pending_ids = max_pending_ids
+        self._pending: Dict[str, int] = {}
+        self._flusher = PeriodicTask("view-counter-flush", flush_interval_seconds, self.flush)
+        self.flushed_views = 0
+        self.dropped_views = 0
+
+    def add(self, blog_id: str, count: int = 1):
+        """Count `count` views of `blog_id`."""
+        self._pending[blog_id] = self._pending.get(blog_id, 0) + count
+        if len(self._pending) >= self.max_pending_ids:
+            self._flusher.run_soon()
+
+    @property
+    def pending_views(self) -> int:
+        return sum(self._pending.values())
+
+    async def flush(self):
+        """Write the merged increments (one bulk_write)."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        operations = [UpdateOne({"id": blog_id}, {"$inc": {"views": count}}) for blog_id, count in pending.items()]
+        try:
+            await self._collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            self._restore(pending)
+            self._flusher.hold_off()
+            logger.warning(f"View count flush failed, retrying next interval: {e}")
+            return
+        self.flushed_views += sum(pending.values())
+
+    def start(self):
+        """Start the periodic flush (call from app startup)."""
+        self._flusher.start()
+
+    async def stop(self):
+        """Stop flushing, writing what is buffered first (call from app shutdown)."""
+        await self._flusher.stop(run_final=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending_posts": len(self._pending),
+            "pending_views": self.pending_views,
+            "flushed_views": self.flushed_views,
+            "dropped_views": self.dropped_views,
+        }
+
+    def _restore(self, pending: Dict[str, int]):
+        for blog_id, count in pending.items():
+            if blog_id not in self._pending and len(self._pending) >= 2 * self.max_pending_ids:
+                # Keep memory bounded while the database is down
+                self.dropped_views += count
+                continue
+            self._pending[blog_id] = self._pending.get(blog_id, 0) + count
@@ -0,0 +1,114 @@
+"""
+View deduplication
+Remembers which visitor has viewed which post within a window, so refreshes
+and repeat crawler hits are not counted as views
+
+Keys are ``(hash_ip_address(ip), blog_id)`` pairs held in two rotating Bloom
+filters of fixed size: a pair is a repeat if either the current or the
+previous generation contains it. The current generation is retired after
+`window_seconds`, or early once it holds `capacity` keys, so memory stays
+constant and the false-positive rate stays near `error_rate` however busy the
+site is. A false positive drops a genuine first view; a pair is never counted
+twice within one window.
+
+The filters are per process. Behind several workers a visitor may be counted
+once per worker, and the IP hash changes daily, so the window restarts at
+midnight.
+"""
+from typing import Optional
+import hashlib
+import math
+import time
+
+DEFAULT_WINDOW_SECONDS = 1800
+DEFAULT_CAPACITY = 100_000
+DEFAULT_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing of one blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        Args:
+            capacity: Keys the filter holds at `error_rate`
+            error_rate: Target false-positive probability at capacity
+        """
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str):
+        for p in self._positions(key):
+            self._bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class ViewDeduplicator:
+    """Drops repeat (visitor, post) views within a rolling window."""
+
+    def __init__(
+        self,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE
+    ):
+        """
+        Args:
+            window_seconds: Minimum time a view is remembered (at most twice this);
+                            0 disables deduplication
+            capacity: Distinct views remembered per window before rotating early
+            error_rate: Target false-positive rate of each generation
+        """
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous: Optional[BloomFilter] = None
+        self._rotated_at = time.monotonic()
+        self.counted_views = 0
+        self.repeat_views = 0
+
+    def first_view(self, visitor_hash: str, blog_id: str) -> bool:
+        """Record a view; True if `visitor_hash` has not viewed `blog_id` in the window."""
+        if self.window_seconds <= 0:
+            self.counted_views += 1
+            return True
+
+        self._maybe_rotate()
+        key = f"{visitor_hash}:{blog_id}"
+        if key in self._current or (self._previous is not None and key in self._previous):
+            self.repeat_views += 1
+            return False
+        self._current.add(key)
+        self.counted_views += 1
+        return True
+
+    def _maybe_rotate(self):
+        now = time.monotonic()
+        if now - self._rotated_at < self.window_seconds and self._current.count < self.capacity:
+            return
+        # Two windows of silence: the previous generation has nothing left to remember either
+        expired = now - self._rotated_at >= 2 * self.window_seconds
+        self._previous = None if expired else self._current
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._rotated_at = now
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "counted_views": self.counted_views,
+            "repeat_views": self.repeat_views,
+            "memory_bytes": 2 * len(self._current._bits),
+        }
@@ -0,0 +1,137 @@
+"""
+Visit ingestion queue
+Buffers tracked visits in memory and writes them once per flush interval with
+one insert_many into ``visit_logs`` and one merged $inc of the site visit
+counter, so tracking a page load costs no database round trip
+
+The log buffer is bounded: when it is full the oldest visit is dropped (and
+counted in ``dropped_visits``). The visit counter is a plain integer and is
+never dropped. A failed write is retried with the next flush; stop() flushes
+what is left on shutdown.
+"""
+from collections import deque
+from typing import Deque, List
+import asyncio
+import logging
+import re
+
+from pymongo.errors import BulkWriteError
+
+from .periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 5
+DEFAULT_MAX_QUEUED = 10_000
+
+MAX_USER_AGENT_LENGTH = 500
+
+# Control characters (log injection) and markup delimiters
+_UNSAFE_USER_AGENT_CHARS = re.compile(r"[\x00-\x1f\x7f<>]")
+
+
+def sanitize_user_agent(user_agent: str) -> str:
+    """Truncate a User-Agent header and strip characters unsafe to store or display."""
+    return _UNSAFE_USER_AGENT_CHARS.sub("", user_agent[:MAX_USER_AGENT_LENGTH])
+
+
+class VisitIngestQueue:
+    """Bounded in-memory visit buffer, flushed periodically."""
+
+    def __init__(
+        self,
+        logs_collection,
+        stats_collection,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        max_queued: int = DEFAULT_MAX_QUEUED
+    ):
+        """
+        Args:
+            logs_collection: Collection receiving one document per visit
+            stats_collection: Collection holding the ``{"type": "visits"}`` counter
+            flush_interval_seconds: Interval between flushes (the loss bound on a crash)
+            max_queued: Visit logs buffered before the oldest are dropped; a flush is
+                        started early when half of it is used
+        """
+        self._logs = logs_collection
+        self._stats = stats_collection
+        self.max_queued = max_queued
+        self._queue: Deque[dict] = deque(maxlen=max_queued)
+        self._pending_total = 0
+        self._flusher = PeriodicTask("visit-ingest-flush", flush_interval_seconds, self.flush)
+        self.written_visits = 0
+        self.dropped_visits = 0
+
+    def add(self, visit: dict):
+        """Queue one visit log document and count it."""
+        if len(self._queue) == self.max_queued:
+            self.dropped_visits += 1
+        self._queue.append(visit)
+        self._pending_total += 1
+        if len(self._queue) >= self.max_queued // 2:
+            self._flusher.run_soon()
+
+    @property
+    def unwritten_total(self) -> int:
+        """Visits counted here but not yet added to the stored total."""
+        return self._pending_total
+
+    async def flush(self):
+        """Write the queued logs (one insert_many) and the merged counter increment."""
+        await asyncio.gather(self._flush_total(), self._flush_logs())
+
+    async def _flush_total(self):
+        if not self._pending_total:
+            return
+        count, self._pending_total = self._pending_total, 0
+        try:
+            await self._stats.update_one({"type": "visits"}, {"$inc": {"total": count}}, upsert=True)
+        except Exception as e:
+            self._pending_total += count
+            self._flusher.hold_off()
+            logger.warning(f"Visit counter flush failed, retrying next interval: {e}")
+
+    async def _flush_logs(self):
+        if not self._queue:
+            return
+        batch: List[dict] = list(self._queue)
+        self._queue.clear()
+        try:
+            await self._logs.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Part of the batch is written; retrying it would duplicate those logs
+            inserted = e.details.get("nInserted", 0)
+            self.written_visits += inserted
+            self.dropped_visits += len(batch) - inserted
+            self._flusher.hold_off()
+            logger.warning(f"Visit log flush partly failed, {len(batch) - inserted} logs dropped: {e}")
+            return
+        except Exception as e:
+            self._restore(batch)
+            self._flusher.hold_off()
+            logger.warning(f"Visit log flush failed, retrying next interval: {e}")
+            return
+        self.written_visits += len(batch)
+
+    def _restore(self, batch: List[dict]):
+        # Older visits go back in front; whatever exceeds the bound is dropped oldest first
+        restored = deque(batch, maxlen=self.max_queued)
+        restored.extend(self._queue)
+        self.dropped_visits += len(batch) + len(self._queue) - len(restored)
+        self._queue = restored
+
+    def start(self):
+        """Start the periodic flush (call from app startup)."""
+        self._flusher.start()
+
+    async def stop(self):
+        """Stop flushing, writing what is queued first (call from app shutdown)."""
+        await self._flusher.stop(run_final=True)
+
+    def stats(self) -> dict:
+        return {
+            "queued_visits": len(self._queue),
+            "pending_total": self._pending_total,
+            "written_visits": self.written_visits,
+            "dropped_visits": self.dropped_visits,
+        }
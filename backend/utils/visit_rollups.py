@@ -0,0 +1,220 @@
+"""
+Visit rollups
+Folds raw ``visit_logs`` into hourly and daily counts in ``visit_rollups`` so
+analytics queries read a few small documents instead of scanning raw visits
+
+Each rollup document counts one value of one dimension in one bucket:
+
+    {"granularity": "hour", "start": <bucket start>, "dimension": "path",
+     "value": "/blog/some-post", "count": 12}
+
+Dimensions are ``total`` (value ""), ``path`` (the referrer path) and
+``user_agent`` (the browser family). Only complete hours are rolled up, after a
+settle delay that lets queued visits reach the database. A watermark in
+``site_stats`` records the first hour not yet rolled up, so every run starts
+where the last one stopped.
+
+Counts are written with $set, recomputed from the raw logs of the hour (and
+from the hourly rollups for the day), so a run that is interrupted, or that
+runs on two workers at once, can repeat an hour without double counting.
+Raw logs are expired by the ``visit_logs`` TTL index; keep its retention well
+above the settle delay.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import logging
+import re
+
+from pymongo import ASCENDING, UpdateOne
+
+from .bot_detection import is_bot
+from .dates import as_utc_datetime, utc_now
+from .periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_QUERY = {"type": "visit_rollups"}
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+GRANULARITIES = {"hour": HOUR, "day": DAY}
+
+DEFAULT_INTERVAL_SECONDS = 300
+DEFAULT_SETTLE_SECONDS = 300
+# Hours rolled up per run, so catching up after downtime is spread over runs
+MAX_HOURS_PER_RUN = 24 * 7
+
+MAX_PATH_LENGTH = 200
+
+# First match wins: Edge and Opera also send "Chrome", Chrome also sends "Safari"
+_USER_AGENT_FAMILIES = [
+    ("edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("opera", re.compile(r"OPR/|Opera")),
+    ("samsung", re.compile(r"SamsungBrowser/")),
+    ("firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("chrome", re.compile(r"Chrome/|CriOS/")),
+    ("safari", re.compile(r"Safari/")),
+]
+
+
+@lru_cache(maxsize=1024)
+def user_agent_family(user_agent: Optional[str]) -> str:
+    """Coarse browser family of a User-Agent string."""
+    if not user_agent or user_agent == "unknown":
+        return "unknown"
+    if is_bot(user_agent):
+        # Logged before bots were filtered at ingestion
+        return "bot"
+    for family, pattern in _USER_AGENT_FAMILIES:
+        if pattern.search(user_agent):
+            return family
+    return "other"
+
+
+def referrer_path(referrer: Optional[str]) -> str:
+    """Path of a Referer header value (query and fragment dropped)."""
+    if not referrer:
+        return "/"
+    return (urlsplit(referrer).path or "/")[:MAX_PATH_LENGTH]
+
+
+def _floor(value: datetime, granularity: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        value = value.replace(hour=0)
+    return value
+
+
+def _set_counts(granularity: str, start: datetime, counts: Dict[Tuple[str, str], int]):
+    return [
+        UpdateOne(
+            {"granularity": granularity, "dimension": dimension, "start": start, "value": value},
+            {"$set": {"count": count}},
+            upsert=True
+        )
+        for (dimension, value), count in counts.items()
+    ]
+
+
+class VisitRollup:
+    """Incrementally rolls raw visit logs up into hourly and daily buckets."""
+
+    def __init__(
+        self,
+        db,
+        interval_seconds: float = DEFAULT_INTERVAL_SECONDS,
+        settle_seconds: float = DEFAULT_SETTLE_SECONDS
+    ):
+        """
+        Args:
+            db: Database holding visit_logs, visit_rollups and site_stats
+            interval_seconds: Interval between rollup runs
+            settle_seconds: Age an hour must reach past its end before it is rolled up
+        """
+        self.db = db
+        self.settle_seconds = settle_seconds
+        self._task = PeriodicTask("visit-rollup", interval_seconds, self.run_once)
+
+    async def watermark(self) -> Optional[datetime]:
+        doc = await self.db.site_stats.find_one(WATERMARK_QUERY)
+        return as_utc_datetime(doc.get("watermark")) if doc else None
+
+    async def run_once(self) -> int:
+        """Roll up the complete hours after the watermark. Returns the hours processed."""
+        end = _floor(utc_now() - timedelta(seconds=self.settle_seconds), "hour")
+        hour = await self.watermark()
+        processed = 0
+        days = set()
+
+        while processed < MAX_HOURS_PER_RUN and (hour is None or hour < end):
+            # Skip hours without visits in one query
+            query = {"timestamp": {"$gte": hour, "$lt": end}} if hour else {"timestamp": {"$lt": end}}
+            first = await self.db.visit_logs.find_one(query, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+            if first is None:
+                hour = end
+                break
+            hour = _floor(as_utc_datetime(first["timestamp"]), "hour")
+            await self._roll_up_hour(hour)
+            days.add(_floor(hour, "day"))
+            hour += HOUR
+            processed += 1
+            await self._set_watermark(hour)
+
+        for day in sorted(days):
+            await self._roll_up_day(day)
+        if hour is not None:
+            await self._set_watermark(hour)
+        if processed:
+            logger.info(f"Rolled up {processed} hours of visits")
+        return processed
+
+    async def _roll_up_hour(self, start: datetime):
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": start, "$lt": start + HOUR}}},
+            {"$group": {"_id": {"path": "$path", "user_agent": "$user_agent"}, "count": {"$sum": 1}}},
+        ]
+        counts: Counter = Counter()
+        async for row in self.db.visit_logs.aggregate(pipeline):
+            count = row["count"]
+            counts["total", ""] += count
+            counts["path", referrer_path(row["_id"].get("path"))] += count
+            counts["user_agent", user_agent_family(row["_id"].get("user_agent"))] += count
+        if counts:
+            await self.db.visit_rollups.bulk_write(_set_counts("hour", start, counts), ordered=False)
+
+    async def _roll_up_day(self, start: datetime):
+        pipeline = [
+            {"$match": {"granularity": "hour", "start": {"$gte": start, "$lt": start + DAY}}},
+            {"$group": {"_id": {"dimension": "$dimension", "value": "$value"}, "count": {"$sum": "$count"}}},
+        ]
+        counts = {
+            (row["_id"]["dimension"], row["_id"]["value"]): row["count"]
+            async for row in self.db.visit_rollups.aggregate(pipeline)
+        }
+        if counts:
+            await self.db.visit_rollups.bulk_write(_set_counts("day", start, counts), ordered=False)
+
+    async def _set_watermark(self, value: datetime):
+        await self.db.site_stats.update_one(WATERMARK_QUERY, {"$set": {"watermark": value}}, upsert=True)
+
+    def start(self):
+        """Run the rollup periodically (call from app startup)."""
+        self._task.start()
+
+    async def stop(self):
+        await self._task.stop()
+
+
+async def query_visit_analytics(db, start: datetime, end: datetime, granularity: str = "day", top: int = 10) -> dict:
+    """Visit totals per bucket and the top paths and browser families in [start, end)."""
+    bucket_range = {"$gte": _floor(start, granularity), "$lt": end}
+    series = await db.visit_rollups.find(
+        {"granularity": granularity, "dimension": "total", "start": bucket_range},
+        {"_id": 0, "start": 1, "count": 1}
+    ).sort("start", ASCENDING).to_list(None)
+
+    breakdowns = {}
+    for dimension in ("path", "user_agent"):
+        breakdowns[dimension] = await db.visit_rollups.aggregate([
+            {"$match": {"granularity": granularity, "dimension": dimension, "start": bucket_range}},
+            {"$group": {"_id": "$value", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": top},
+            {"$project": {"_id": 0, "value": "$_id", "count": 1}},
+        ]).to_list(None)
+
+    watermark = await db.site_stats.find_one(WATERMARK_QUERY, {"_id": 0, "watermark": 1})
+    return {
+        "granularity": granularity,
+        "start": _floor(start, granularity),
+        "end": end,
+        "total": sum(row["count"] for row in series),
+        "series": series,
+        "paths": breakdowns["path"],
+        "user_agents": breakdowns["user_agent"],
+        # Visits at or after this time are not rolled up yet
+        "rolled_up_until": watermark.get("watermark") if watermark else None,
+    }
@@ -0,0 +1,238 @@
+"""
+Unique visitor sketches
+Estimates unique visitors per day, for the site and for each post, with
+HyperLogLog sketches instead of a distinct over stored IP hashes
+
+A sketch with precision 13 has 8192 one-byte registers and a standard error of
+about 1.15% at any cardinality. Counts are estimated with Ertl's improved
+estimator ("New cardinality estimation algorithms for HyperLogLog sketches",
+2017), which has no bias bump where the classic estimator switches from linear
+counting to the raw estimate (around 2.5 * 8192 visitors). Merging sketches (register-wise max) gives
+the unique count of the union, so any range of days is answered by merging
+its daily sketches. Registers are stored zlib-compressed, so a quiet post-day
+takes a few hundred bytes and a busy one about 4KB.
+
+Visits are added to in-memory sketches and persisted periodically to
+``visitor_sketches``, one document per scope and UTC day. Several workers
+write the same documents, so each write merges into the stored registers and
+is applied only if the document's version is unchanged, retrying otherwise.
+Merging is idempotent: a repeated or failed persist never inflates a count.
+"""
+from datetime import date, datetime, timezone
+from typing import Dict, Optional, Tuple
+import logging
+import math
+import zlib
+
+from pymongo.errors import DuplicateKeyError
+
+from .periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRECISION = 13
+DEFAULT_FLUSH_INTERVAL_SECONDS = 60
+# In-memory sketches (at most 8KB each) before a flush is started early
+DEFAULT_MAX_SKETCHES = 1000
+MAX_MERGE_ATTEMPTS = 5
+
+SITE_SCOPE = "site"
+
+
+def blog_scope(blog_id: str) -> str:
+    return f"blog:{blog_id}"
+
+
+def _sigma(x: float) -> float:
+    # Correction for empty registers (x = fraction of registers at 0)
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    # Correction for saturated registers (x = 1 - fraction at the maximum rank)
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+class HyperLogLog:
+    """HyperLogLog cardinality sketch over 64-bit hashes."""
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+        if len(self.registers) != self.size:
+            raise ValueError(f"Expected {self.size} registers, got {len(self.registers)}")
+
+    def add(self, value_hash: int):
+        """Add a uniformly distributed 64-bit hash."""
+        index = value_hash >> (64 - self.precision)
+        remainder = value_hash & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> bool:
+        """Fold `other` into this sketch. Returns True if any register grew."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        changed = False
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+                changed = True
+        return changed
+
+    def estimate(self) -> int:
+        m = self.size
+        max_rank = 64 - self.precision + 1
+        histogram = [0] * (max_rank + 1)
+        for rank in self.registers:
+            histogram[rank] += 1
+        if histogram[0] == m:
+            return 0
+        z = m * _tau(1 - histogram[max_rank] / m)
+        for rank in range(max_rank - 1, 0, -1):
+            z = 0.5 * (z + histogram[rank])
+        z += m * _sigma(histogram[0] / m)
+        return round(m * m / (2 * math.log(2)) / z)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes, precision: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        return cls(precision, zlib.decompress(data))
+
+
+def _day(value: Optional[datetime] = None) -> str:
+    return (value or datetime.now(timezone.utc)).date().isoformat()
+
+
+class VisitorSketches:
+    """In-memory per-day sketches, persisted periodically with an optimistic merge."""
+
+    def __init__(
+        self,
+        collection,
+        flush_interval_seconds: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+        max_sketches: int = DEFAULT_MAX_SKETCHES,
+        precision: int = DEFAULT_PRECISION
+    ):
+        """
+        Args:
+            collection: ``visitor_sketches`` collection
+            flush_interval_seconds: Interval between persists (the loss bound on a crash)
+            max_sketches: Sketches held in memory before persisting early
+            precision: Register index bits (error about 1.04 / sqrt(2 ** precision))
+        """
+        self._collection = collection
+        self.max_sketches = max_sketches
+        self.precision = precision
+        self._pending: Dict[Tuple[str, str], HyperLogLog] = {}
+        self._flusher = PeriodicTask("visitor-sketch-flush", flush_interval_seconds, self.flush)
+
+    def add(self, visitor_hash: int, *scopes: str):
+        """Count `visitor_hash` as a visitor of today for each scope."""
+        day = _day()
+        for scope in scopes:
+            sketch = self._pending.get((scope, day))
+            if sketch is None:
+                sketch = self._pending[scope, day] = HyperLogLog(self.precision)
+            sketch.add(visitor_hash)
+        if len(self._pending) >= self.max_sketches:
+            self._flusher.run_soon()
+
+    async def flush(self):
+        """Merge the in-memory sketches into the stored ones."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        failed = False
+        for (scope, day), sketch in pending.items():
+            try:
+                persisted = await self._persist(scope, day, sketch)
+            except Exception as e:
+                logger.warning(f"Visitor sketch {scope}:{day} not persisted: {e}")
+                persisted = False
+            if not persisted:
+                failed = True
+                # Merge back with what was added meanwhile; retried on the next flush
+                current = self._pending.get((scope, day))
+                if current is not None:
+                    sketch.merge(current)
+                self._pending[scope, day] = sketch
+        if failed:
+            self._flusher.hold_off()
+
+    async def _persist(self, scope: str, day: str, sketch: HyperLogLog) -> bool:
+        doc_id = f"{scope}:{day}"
+        for _ in range(MAX_MERGE_ATTEMPTS):
+            stored = await self._collection.find_one({"_id": doc_id}, {"registers": 1, "version": 1})
+            if stored is None:
+                try:
+                    await self._collection.insert_one({
+                        "_id": doc_id, "scope": scope, "day": day, "precision": self.precision,
+                        "registers": sketch.to_bytes(), "version": 1
+                    })
+                    return True
+                except DuplicateKeyError:
+                    continue
+
+            merged = HyperLogLog.from_bytes(stored["registers"], self.precision)
+            if not merged.merge(sketch):
+                return True
+            result = await self._collection.update_one(
+                {"_id": doc_id, "version": stored["version"]},
+                {"$set": {"registers": merged.to_bytes()}, "$inc": {"version": 1}}
+            )
+            if result.matched_count:
+                return True
+        logger.info(f"Visitor sketch {doc_id} kept changing, merging next flush")
+        return False
+
+    def start(self):
+        """Start the periodic persist (call from app startup)."""
+        self._flusher.start()
+
+    async def stop(self):
+        """Stop persisting, writing what is held first (call from app shutdown)."""
+        await self._flusher.stop(run_final=True)
+
+
+async def count_unique_visitors(collection, scope: str, start: date, end: date) -> dict:
+    """Estimated unique visitors of `scope` per day and over the days [start, end]."""
+    total = None
+    days = []
+    async for doc in collection.find(
+        {"scope": scope, "day": {"$gte": start.isoformat(), "$lte": end.isoformat()}},
+        {"_id": 0, "day": 1, "registers": 1, "precision": 1}
+    ).sort("day", 1):
+        sketch = HyperLogLog.from_bytes(doc["registers"], doc.get("precision", DEFAULT_PRECISION))
+        days.append({"day": doc["day"], "unique_visitors": sketch.estimate()})
+        if total is None:
+            total = sketch
+        else:
+            total.merge(sketch)
+    return {
+        "scope": scope,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "unique_visitors": total.estimate() if total else 0,
+        "days": days,
+    }
@@ -563,6 +563,12 @@ export default function BlogPostPage({ slug: propSlug, initialData }) {
     }
   }, [slug, isPreview, hasSSRData]);
 
+  // Views are counted from the reader's browser; the SSR fetch comes from the frontend server
+  useEffect(() => {
+    if (!blog?.slug || isPreview) return;
+    fetch(`${API_URL}/api/blogs/${blog.slug}/view`, { method: 'POST', keepalive: true }).catch(() => {});
+  }, [blog?.slug, isPreview]);
+
   const formatDate = (dateString) => format(new Date(dateString), 'MMM d, yyyy');
   const currentUrl = typeof window !== 'undefined' ? window.location.href : '';
 